@@ -0,0 +1,276 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""Token size check of every ChatPromptTemplate in prompts.py, rendered with representative inputs.
+
+System prompt tokens are paid on every call, so growth in a template should be a decision
+and not an accident. Each template is rendered twice: with the fixtures below, and with every
+input variable empty. The empty render is the static part (instructions, examples, tags) and
+the difference is the dynamic part (chat history, search results, profile, cart, ...).
+
+Tokens are counted offline with an approximation of a BPE tokenizer: a run of letters costs
+one token per 6 characters, a run of punctuation one per 2 characters (both at least one),
+every digit costs one and whitespace is free. It is not the Nova tokenizer, but it is deterministic and tracks it
+closely enough to catch regressions.
+
+For the templates that take previous_chat, the report also shows the prompt tokens with the
+raw history entries against the compact transcript from history.render.
+
+The script exits with status 1 when a template goes over its baseline in
+prompt_token_baselines.json by more than the tolerance, for either the static or the total
+count, or when a template has an input variable without a fixture.
+
+Usage (from agents/tests):
+    python check_prompt_tokens.py [--templates route_prompt_template,amazon_pack_template] [--update-baselines]
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+import sys
+from typing import Callable, Dict, List, Optional
+
+AGENT_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../travel-agent-langgraph"))
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompt_token_baselines.json")
+CHARS_PER_WORD_TOKEN = 6
+CHARS_PER_PUNCTUATION_TOKEN = 2
+TOKEN_PATTERN = re.compile(r"[^\W\d_]+|\d|[^\w\s]+|_+")
+
+#################### FIXTURES ####################
+# Shaped like the values the nodes pass in (see nodes.py), at typical sizes
+
+# Stored bot turns are the raw model output, <answer> markup included
+ANSWERS = [
+    "<answer>Barcelona in June is warm and sunny, perfect for the beach at Barceloneta. Start with the Sagrada Familia "
+    "(book tickets ahead), then walk the Gothic Quarter and have dinner in El Born. For a day trip, Montserrat is "
+    "an hour away by train.</answer>",
+    "<answer>For your trip I would pack: lightweight clothes, a swimsuit, comfortable walking shoes, sunscreen, "
+    "sunglasses and a <highlight link>travel adapter</highlight link> (Spain uses type F plugs).</answer>",
+    "Here are some options I found:\n\n" + "\n\n".join(
+        f"{i + 1}. Product: {title}\n   Link: https://www.amazon.com/dp/{asin}?tag=travelagent-20&linkCode=osi&th=1&psc=1\n"
+        f"   Price: ${price}\n   Rating: 4.{i + 5}\n   Description: {description}"
+        for i, (title, asin, price, description) in enumerate([
+            ("Osprey Daylite Daypack", "B07Y2FY2C6", "54.95", "Lightweight 13 L daypack with a padded laptop sleeve."),
+            ("Hydro Flask 24 oz Standard Mouth Bottle", "B083GBJ7Z1", "34.95", "Insulated bottle, keeps water cold for 24 hours."),
+        ])
+    ),
+    "<answer>The forecast for Barcelona this week:\nMonday, Jun 10: clear sky, 81°F\nTuesday, Jun 11: few clouds, 79°F\n"
+    "Wednesday, Jun 12: light rain, 75°F</answer>",
+]
+
+QUESTIONS = [
+    "What should I do in Barcelona?",
+    "What should I pack for my barcelona trip?",
+    "Find me a daypack and a water bottle",
+    "What's the weather like in Barcelona next week?",
+]
+
+def previous_chat(turns: int = 10) -> List[Dict]:
+    """Stored chat history entries; the nodes render them with history.render."""
+    history = []
+    for i in range(turns):
+        history.append({"user": QUESTIONS[i % len(QUESTIONS)], "time": 1717000000 + 60 * i})
+        history.append({"bot": ANSWERS[i % len(ANSWERS)], "time": 1717000030 + 60 * i})
+    return history
+
+USER_PROFILE = {
+    "id": "user-7f3a9c",
+    "createdAt": "now",
+    "summary": "Travelling to Barcelona from June 10 to June 17 with a partner and two kids (8 and 11). "
+               "Likes beaches, food markets and museums. Prefers public transport.",
+}
+
+CART = [
+    {"asin": "B07Y2FY2C6", "title": "Osprey Daylite Daypack", "price": "54.95", "qty": "1"},
+    {"asin": "B083GBJ7Z1", "title": "Hydro Flask 24 oz Standard Mouth Bottle", "price": "34.95", "qty": "2"},
+    {"asin": "B07KBGQP3K", "title": "EPICKA Universal Travel Adapter", "price": "25.99", "qty": "1"},
+]
+
+KB_PASSAGES = [
+    "Barcelona is the capital of Catalonia. The old town (Ciutat Vella) includes the Gothic Quarter, El Raval "
+    "and El Born. Gaudi's works, among them the Sagrada Familia, Park Guell and Casa Batllo, are the most visited "
+    "sights; book timed tickets online. The metro runs until midnight on weekdays and all night on Saturdays. " * 2,
+] * 3
+
+PRODUCTS = [{
+    "asin": item["asin"],
+    "detail_page_url": f"https://www.amazon.com/dp/{item['asin']}?tag=travelagent-20&linkCode=osi&th=1&psc=1",
+    "title": {"display_value": item["title"], "label": "Title", "locale": "en_US"},
+    "price": {"listings": [{"price": {"amount": float(item["price"]), "currency": "USD",
+                                      "display_amount": f"${item['price']}"}}]},
+} for item in CART]
+
+SEARCH_PAGE = ("Things to do in New York in June. Summer kicks off with outdoor concerts in Central Park, "
+               "the Museum Mile Festival on Fifth Avenue and free movies in Bryant Park on Monday nights. "
+               "Check the event calendar for dates and tickets. ") * 15
+
+FORECAST = "\n".join(f"{day}, Jun {10 + i:02d}: {desc}, {temp}°F" for i, (day, desc, temp) in enumerate([
+    ("Monday", "clear sky", 81), ("Tuesday", "few clouds", 79), ("Wednesday", "light rain", 75),
+    ("Thursday", "scattered clouds", 77), ("Friday", "clear sky", 82),
+]))
+
+CITY_CANDIDATES = [
+    ("portland", {"city": "Portland", "country": "United States", "admin_name": "Oregon",
+                  "lat": 45.5371, "lng": -122.65, "population": 2074775}, 100.0),
+    ("portland", {"city": "Portland", "country": "United States", "admin_name": "Maine",
+                  "lat": 43.6773, "lng": -70.2715, "population": 203914}, 100.0),
+]
+
+FIXTURES = {
+    "input": QUESTIONS[0],
+    "question": QUESTIONS[1],
+    "previous_chat": previous_chat(),
+    "user_profile": USER_PROFILE,
+    "search_res": KB_PASSAGES,
+    "prod_search": [PRODUCTS],
+    "cart": CART,
+    "user_cart": CART,
+    "recommendation": ANSWERS[1],
+    "city_candidates": CITY_CANDIDATES,
+}
+
+# Values that differ per template, where the node passes something else under the same name
+TEMPLATE_FIXTURES = {
+    "search_internet_prompt_template": {"input": "search for events in NY during my visit", "search_res": SEARCH_PAGE},
+    "search_snippets_prompt_template": {
+        "input": "search for events in NY during my visit",
+        "search_res": "\n".join(f"{i + 1}. Events in New York in June: concerts, festivals and free movies ({i})"
+                                for i in range(5)),
+    },
+    "weather_prompt_template": {"input": QUESTIONS[3], "search_res": FORECAST},
+    "confirm_location_prompt_template": {"input": "What's the weather in Portland?"},
+    "extract_city_prompt_template": {"input": QUESTIONS[3]},
+}
+
+# previous_chat window per template, where the node passes something other than the last 20 entries
+HISTORY_ENTRIES = {"summarize_conversation_template": 10}
+
+#################### COUNTING ####################
+
+def count_tokens(text: str) -> int:
+    return sum(math.ceil(len(piece) / (CHARS_PER_WORD_TOKEN if piece[0].isalpha() else CHARS_PER_PUNCTUATION_TOKEN))
+               for piece in TOKEN_PATTERN.findall(text))
+
+def message_tokens(template, values: Dict) -> Dict:
+    messages = template.format_messages(**values)
+    system = sum(count_tokens(m.content) for m in messages if m.type == "system")
+    return {"system": system, "total": sum(count_tokens(m.content) for m in messages)}
+
+def fixture_values(name: str, template, render_history: Callable) -> Dict:
+    values = {var: TEMPLATE_FIXTURES.get(name, {}).get(var, FIXTURES.get(var)) for var in template.input_variables}
+    if "previous_chat" in values:
+        values["previous_chat"] = render_history(values["previous_chat"], HISTORY_ENTRIES.get(name, 20))
+    return values
+
+def history_savings(name: str, template, render_history: Callable) -> Dict:
+    """Prompt tokens with previous_chat as the raw entries (as before history.py) and as the compact transcript."""
+    raw = message_tokens(template, fixture_values(name, template, lambda entries, n: entries[-n:]))["total"]
+    compact = message_tokens(template, fixture_values(name, template, render_history))["total"]
+    return {"raw": raw, "compact": compact}
+
+def measure(name: str, template, render_history: Callable) -> Dict:
+    missing = [var for var in template.input_variables
+               if var not in TEMPLATE_FIXTURES.get(name, {}) and var not in FIXTURES]
+    if missing:
+        return {"missing": missing}
+    rendered = message_tokens(template, fixture_values(name, template, render_history))
+    static = message_tokens(template, {var: "" for var in template.input_variables})
+    return {
+        "system": rendered["system"],
+        "static": static["total"],
+        "dynamic": rendered["total"] - static["total"],
+        "total": rendered["total"],
+    }
+
+def templates(prompts_module) -> Dict:
+    from langchain_core.prompts.chat import ChatPromptTemplate
+    return {name: value for name, value in vars(prompts_module).items() if isinstance(value, ChatPromptTemplate)}
+
+def over_baseline(counts: Dict, baseline: Optional[Dict], tolerance: float) -> List[str]:
+    if not baseline:
+        return []
+    return [f"{key} {counts[key]} > {baseline[key]}" for key in ("static", "total")
+            if counts[key] > baseline[key] * (1 + tolerance)]
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--templates", help="Comma separated template names, defaults to every template in prompts.py")
+    parser.add_argument("--update-baselines", action="store_true", help="Record the current counts as the new baselines")
+    args = parser.parse_args()
+
+    sys.path.insert(0, AGENT_DIR)
+    import history
+    import prompts
+    render_history = lambda entries, n: history.render(entries, entries=n)
+
+    found = templates(prompts)
+    names = args.templates.split(",") if args.templates else list(found)
+    unknown = [name for name in names if name not in found]
+    if unknown:
+        parser.error(f"not a ChatPromptTemplate in prompts.py: {', '.join(unknown)}")
+
+    with open(BASELINES_PATH, encoding="utf-8") as f:
+        baselines = json.load(f)
+    tolerance = baselines["tolerance"]
+
+    print(f"{'template':<40}{'system':>8}{'static':>8}{'dynamic':>9}{'total':>8}{'static %':>10}{'baseline':>10}  status")
+    results, failures = {}, []
+    for name in names:
+        counts = results[name] = measure(name, found[name], render_history)
+        if "missing" in counts:
+            failures.append(name)
+            print(f"{name:<40}  no fixture for {', '.join(counts['missing'])}")
+            continue
+        baseline = baselines["templates"].get(name)
+        over = over_baseline(counts, baseline, tolerance)
+        if over:
+            failures.append(name)
+        status = "; ".join(over) or ("ok" if baseline else "no baseline")
+        print(f"{name:<40}{counts['system']:>8}{counts['static']:>8}{counts['dynamic']:>9}{counts['total']:>8}"
+              f"{counts['static'] / counts['total']:>10.0%}{baseline['total'] if baseline else '-':>10}  {status}")
+
+    measured = {name: counts for name, counts in results.items() if "missing" not in counts}
+    static = sum(counts["static"] for counts in measured.values())
+    total = sum(counts["total"] for counts in measured.values())
+    print(f"{'all templates':<40}{'':>8}{static:>8}{total - static:>9}{total:>8}{static / max(total, 1):>10.0%}")
+    print(f"(approximate tokens; static is the render with empty inputs, system is the cacheable system prompt,"
+          f" tolerance {tolerance:.0%})")
+
+    print(f"\n{'previous_chat savings':<40}{'raw':>8}{'compact':>9}{'saved':>8}{'saved %':>9}")
+    for name in measured:
+        if "previous_chat" in found[name].input_variables:
+            savings = history_savings(name, found[name], render_history)
+            saved = savings["raw"] - savings["compact"]
+            print(f"{name:<40}{savings['raw']:>8}{savings['compact']:>9}{saved:>8}{saved / savings['raw']:>9.0%}")
+    print("(whole prompt tokens with the raw history entries vs history.render)")
+
+    if args.update_baselines:
+        baselines["templates"] = {
+            **baselines["templates"],
+            **{name: {"static": counts["static"], "total": counts["total"]} for name, counts in measured.items()},
+        }
+        with open(BASELINES_PATH, "w", encoding="utf-8") as f:
+            json.dump(baselines, f, indent=2)
+            f.write("\n")
+        print(f"\nBaselines written to {BASELINES_PATH}")
+    elif failures:
+        print(f"\nOver baseline or missing fixtures: {', '.join(failures)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
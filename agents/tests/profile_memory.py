@@ -0,0 +1,399 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Peak memory profile of every route, with AWS, HTTP and model calls stubbed out.
+
+On Lambda the memory size also sets the CPU share, so this reports what each route costs.
+Every RouteType is run through TravelAgent.run twice: cold (node construction and lazy
+loads included) and warm. Both runs are measured with tracemalloc and an RSS sampler. The
+report shows peak and retained Python heap, peak RSS growth and the top allocation
+sites, both near the peak and retained.
+
+The script exits with status 1 when a route goes over its budget in memory_budgets.json.
+The warm peak is checked against peak_mb and the warm retained heap against retained_mb.
+
+The stubs use a long chat history, a large search result page, a full forecast and the
+cities CSV. When data/worldcities.csv is missing, a synthetic file of the same size is
+generated for the run.
+
+Usage (from agents/tests):
+    python profile_memory.py [--routes weather,internet_search] [--top 5] [--update-budgets]
+"""
+
+import argparse
+import csv
+import gc
+import json
+import os
+import random
+import sys
+import sysconfig
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+AGENT_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../travel-agent-langgraph"))
+BUDGETS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "memory_budgets.json")
+BUDGET_HEADROOM = 1.3
+MB = 1024 * 1024
+
+# Offline settings for config.py; values already set in the environment win
+os.environ.update({
+    **{name: f"profiling-{name.split('_')[0].lower()}" for name in (
+        "USER_TABLE_NAME", "WISHLIST_TABLE_NAME", "CHAT_TABLE_NAME", "KNOWLEDGE_BASE_ID",
+        "OPENWEATHER_SECRET_NAME", "PAAPI_SECRET_NAME", "GOOGLE_SEARCH_SECRET_NAME",
+    )},
+    "AWS_REGION": "us-east-1",
+    **{key: value for key, value in os.environ.items()},
+    # Bucket waits and 429s would distort the numbers
+    "ADMISSION_ENABLED": "false",
+    "LLM_CACHE_BACKEND": "memory",
+    "SEARCH_CACHE_BACKEND": "memory",
+})
+
+ROUTE_PROMPTS = {
+    "intro": "Hi! What can you do?",
+    "internet_search": "search for events in NY during my visit",
+    "amazon_facts": "What is Amazon Prime?",
+    "trip_recommendation": "What should I do in Barcelona?",
+    "packing_list": "What should I pack for my barcelona trip?",
+    "weather": "What's the weather like in Miami?",
+    "conversation_summary": "Can you summarize our chat?",
+    "order_cart": "What's in my cart?",
+    "product_search": "Find me a waterproof jacket",
+    "remove_cart": "Remove the sunscreen from my cart",
+    "add_cart": "Add the travel adapter you mentioned to my cart",
+    "user_summary": "What do you know about me?",
+    "grocery": "I need groceries for a beach picnic",
+}
+
+#################### FIXTURES ####################
+
+ANSWER = "<answer>" + " ".join(
+    f"Option {i}: a <highlight link>well reviewed</highlight link> pick for sunny city breaks, with day trips nearby."
+    for i in range(12)
+) + "</answer>"
+
+STRUCTURED = {
+    "CityExtraction": {"city_name": "Miami"},
+    "ConfirmedLocation": {"thinking": "", "city": "Miami", "latitude": 25.7839, "longitude": -80.2102},
+    "PackingList": {"items": ["sunscreen", "swimsuit", "sandals", "sunglasses", "beach towel", "hat",
+                              "water bottle", "travel adapter", "daypack", "rain jacket"]},
+    "Cart": {"items": [{"asin": f"B0000000{i:02d}", "title": f"Travel item {i}", "price": "19.99", "qty": "1"}
+                       for i in range(4)]},
+}
+
+def chat_history(turns: int) -> List[Dict]:
+    history = []
+    for i in range(turns):
+        history.append({"user": f"Question {i} about planning my trip to Barcelona in June", "time": 1712345678 + i})
+        history.append({"bot": ANSWER, "time": 1712345679 + i})
+    return history
+
+def forecast() -> Dict:
+    # OpenWeather 5 day / 3 hour forecast: 40 entries
+    start = 1718000000
+    return {"list": [{
+        "dt": start + i * 10800,
+        "dt_txt": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(start + i * 10800)),
+        "main": {"temp": 300.15 + (i % 8), "humidity": 70},
+        "weather": [{"description": "scattered clouds"}],
+    } for i in range(40)]}
+
+def search_items() -> List[Dict]:
+    # Generic snippets, so the snippet sufficiency check fails and the page is fetched (the costly path)
+    return [{"title": f"Result {i}", "snippet": "Read more on our website.", "link": f"https://example.com/page{i}"}
+            for i in range(5)]
+
+def web_page(size_kb: int) -> bytes:
+    paragraph = "<div class='card'><p>" + "Lorem ipsum dolor sit amet, " * 10 + "</p><a href='#'>link</a></div>"
+    count = size_kb * 1024 // len(paragraph) + 1
+    return f"<html><head><title>Events</title></head><body>{paragraph * count}</body></html>".encode()
+
+def write_cities_csv(path: str, rows: int = 47000) -> None:
+    """Synthetic stand-in for the simplemaps worldcities.csv (same columns, similar size)."""
+    rng = random.Random(0)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["city", "city_ascii", "lat", "lng", "country", "iso2", "iso3", "admin_name",
+                         "capital", "population", "id"])
+        writer.writerow(["Miami", "Miami", "25.7839", "-80.2102", "United States", "US", "USA", "Florida",
+                         "", "6445545", "1840015149"])
+        for i in range(rows - 1):
+            name = "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(4, 11))).title()
+            writer.writerow([name, name, f"{rng.uniform(-60, 70):.4f}", f"{rng.uniform(-180, 180):.4f}",
+                             "Country", "CC", "CCC", "Region", "", str(rng.randint(1000, 5000000)), str(i)])
+
+#################### STUBS ####################
+
+class FakeResponse:
+    def __init__(self, status_code: int = 200, content: bytes = b"", payload: Any = None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = {}
+        self._payload = payload
+
+    def json(self) -> Any:
+        return self._payload
+
+    def raise_for_status(self) -> None:
+        pass
+
+def install_aws_stubs(history_turns: int) -> None:
+    """Answer botocore calls from the fixtures, before config.py reads its secrets."""
+    import botocore.client
+
+    tables = {
+        os.environ["CHAT_TABLE_NAME"]: {"history": chat_history(history_turns)},
+        os.environ["USER_TABLE_NAME"]: {"summary": "Likes beaches, food markets and museums. Travels with two kids."},
+        os.environ["WISHLIST_TABLE_NAME"]: {"wishlist": STRUCTURED["Cart"]["items"]},
+    }
+    secret = json.dumps({"openweather_key": "profiling", "google_api_key": "profiling", "cse_id": "profiling"})
+
+    def make_api_call(client, operation: str, params: Dict) -> Dict:
+        if operation == "GetSecretValue":
+            return {"SecretString": secret}
+        if operation == "GetItem":
+            # Replacing _make_api_call also skips boto3's attribute (de)serialization, so items stay plain Python
+            item = tables.get(params["TableName"])
+            return {"Item": item} if item else {}
+        if operation == "Retrieve":
+            return {"retrievalResults": [{
+                "content": {"text": "Barcelona guide section. " * 80},
+                "location": {"s3Location": {"uri": f"s3://docs/barcelona/{i}.txt"}},
+            } for i in range(params["retrievalConfiguration"]["vectorSearchConfiguration"]["numberOfResults"])]}
+        return {}
+
+    botocore.client.BaseClient._make_api_call = make_api_call
+
+def install_http_stubs(page_kb: int) -> None:
+    """Answer OpenWeather, Custom Search and web page GETs from the fixtures."""
+    import http_client
+    import nodes
+    page = web_page(page_kb)
+
+    def get(url: str, **kwargs) -> FakeResponse:
+        if url == nodes.OPENWEATHER_FORECAST_URL:
+            return FakeResponse(content=json.dumps(forecast()).encode())
+        if url == nodes.GOOGLE_CSE_URL:
+            return FakeResponse(payload={"items": search_items()})
+        return FakeResponse(content=page)
+
+    async def aget(url: str, **kwargs) -> FakeResponse:
+        return get(url, **kwargs)
+
+    http_client.get = get
+    http_client.aget = aget
+
+def stub_chat_model(text: str):
+    """Chat model returning `text`, or the STRUCTURED fixture for the bound schema when used with structured output."""
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from langchain_core.messages import AIMessage
+    from langchain_core.outputs import ChatGeneration, ChatResult
+
+    class StubChatModel(BaseChatModel):
+        @property
+        def _llm_type(self) -> str:
+            return "stub"
+
+        def bind_tools(self, tools, **kwargs):
+            return self.bind(tools=tools, **kwargs)
+
+        def _generate(self, messages, stop=None, run_manager=None, tools=None, **kwargs) -> ChatResult:
+            if tools:
+                name = tools[0].__name__
+                message = AIMessage(content="", tool_calls=[{"name": name, "args": STRUCTURED[name], "id": "stub"}])
+            else:
+                message = AIMessage(content=text)
+            return ChatResult(generations=[ChatGeneration(message=message)])
+
+    return StubChatModel()
+
+#################### MEASUREMENT ####################
+
+def rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None  # not Linux, RSS is not sampled
+
+class Sampler(threading.Thread):
+    """Samples RSS, and snapshots the traced heap each time it grows well past the last snapshot, to find peak sites."""
+    def __init__(self, interval: float = 0.005, min_growth: int = MB):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.min_growth = min_growth
+        self.start_rss = rss_bytes()
+        self.peak_rss = self.start_rss
+        self.peak_snapshot: Optional[tracemalloc.Snapshot] = None
+        self._snapshot_size = tracemalloc.get_traced_memory()[0]
+        self._done = threading.Event()
+
+    def run(self) -> None:
+        while not self._done.is_set():
+            rss = rss_bytes()
+            if rss is not None:
+                self.peak_rss = max(self.peak_rss, rss)
+            current, _ = tracemalloc.get_traced_memory()
+            if current > self._snapshot_size + max(self.min_growth, self._snapshot_size // 10):
+                self.peak_snapshot = tracemalloc.take_snapshot()
+                self._snapshot_size = current
+            time.sleep(self.interval)
+
+    def stop(self) -> Optional[int]:
+        self._done.set()
+        self.join()
+        return None if self.start_rss is None else self.peak_rss - self.start_rss
+
+STDLIB_DIR = sysconfig.get_paths()["stdlib"]
+
+def site_name(frame: tracemalloc.Frame) -> str:
+    filename = frame.filename
+    if filename.startswith(AGENT_DIR + os.sep):
+        filename = os.path.relpath(filename, AGENT_DIR)
+    elif "site-packages" + os.sep in filename:
+        filename = filename.split("site-packages" + os.sep, 1)[1]
+    elif filename.startswith(STDLIB_DIR + os.sep):
+        filename = os.path.relpath(filename, STDLIB_DIR)
+    return f"{filename}:{frame.lineno}"
+
+def top_sites(snapshot: Optional[tracemalloc.Snapshot], before: tracemalloc.Snapshot, top: int) -> List:
+    if snapshot is None:
+        return []
+    stats = [stat for stat in snapshot.compare_to(before, "lineno") if stat.size_diff > 0][:top]
+    return [(site_name(stat.traceback[0]), stat.size_diff / MB) for stat in stats]
+
+def measure(run: Callable[[], Any], top: int) -> Dict:
+    gc.collect()
+    before = tracemalloc.take_snapshot()
+    start_current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    sampler = Sampler()
+    sampler.start()
+    start = time.perf_counter()
+    run()
+    elapsed = time.perf_counter() - start
+    rss_growth = sampler.stop()
+    _, peak = tracemalloc.get_traced_memory()
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    return {
+        "peak_mb": (peak - start_current) / MB,
+        "retained_mb": (current - start_current) / MB,
+        "rss_mb": None if rss_growth is None else rss_growth / MB,
+        "seconds": elapsed,
+        "peak_sites": top_sites(sampler.peak_snapshot, before, top),
+        "retained_sites": top_sites(tracemalloc.take_snapshot(), before, top),
+    }
+
+def profile_route(agent_module, route: str, top: int) -> Dict:
+    def run():
+        travel_agent = agent_module.TravelAgent()
+        travel_agent.router_chain = agent_module.build_chain(
+            agent_module.route_prompt_template, stub_chat_model(route), "router_chain"
+        )
+        result = travel_agent.run(ROUTE_PROMPTS[route], "profiling_user")
+        if result["promptResponse"].startswith("Error"):
+            print(f"  {route} answered with {result['promptResponse'][:120]}")
+    return {"cold": measure(run, top), "warm": measure(run, top)}
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--routes", help="Comma separated routes, defaults to every RouteType")
+    parser.add_argument("--top", type=int, default=5, help="Allocation sites to show per route")
+    parser.add_argument("--history-turns", type=int, default=50, help="User/bot turn pairs in the stored chat history")
+    parser.add_argument("--page-kb", type=int, default=800, help="Size of the fetched search result page")
+    parser.add_argument("--update-budgets", action="store_true",
+                        help=f"Record the measured values, with {BUDGET_HEADROOM}x headroom, as the new budgets")
+    args = parser.parse_args()
+
+    sys.path.insert(0, AGENT_DIR)
+    cities_csv = os.path.join(AGENT_DIR, "data", "worldcities.csv")
+    if os.path.exists(cities_csv):
+        os.chdir(AGENT_DIR)
+    else:
+        workdir = tempfile.mkdtemp(prefix="profile-memory-")
+        write_cities_csv(os.path.join(workdir, "data", "worldcities.csv"))
+        os.chdir(workdir)
+        print(f"{cities_csv} not found, using a synthetic cities file in {workdir}")
+
+    install_aws_stubs(args.history_turns)
+    import agent as agent_module
+    install_http_stubs(args.page_kb)
+    stub = stub_chat_model(ANSWER)
+    agent_module.nova_lite_llm_converse = stub
+    agent_module.nova_pro_llm_converse = stub
+
+    routes = args.routes.split(",") if args.routes else [route_type.value for route_type in agent_module.RouteType]
+    tracemalloc.start()
+    results = {}
+    for route in routes:
+        print(f"Profiling {route}...")
+        results[route] = profile_route(agent_module, route, args.top)
+    tracemalloc.stop()
+
+    with open(BUDGETS_PATH, encoding="utf-8") as f:
+        budgets = json.load(f)
+    print()
+    print(f"{'route':<22}{'cold peak':>10}{'warm peak':>10}{'retained':>10}{'rss':>8}{'budget':>8}  status")
+    failures = []
+    for route, result in results.items():
+        cold, warm = result["cold"], result["warm"]
+        budget = budgets["routes"].get(route)
+        status = "no budget"
+        if budget:
+            over = [f"peak {warm['peak_mb']:.1f} > {budget['peak_mb']}"] if warm["peak_mb"] > budget["peak_mb"] else []
+            if warm["retained_mb"] > budget["retained_mb"]:
+                over.append(f"retained {warm['retained_mb']:.2f} > {budget['retained_mb']}")
+            status = "; ".join(over) or "ok"
+            if over:
+                failures.append(route)
+        rss = "-" if warm["rss_mb"] is None else f"{warm['rss_mb']:.1f}"
+        print(f"{route:<22}{cold['peak_mb']:>10.1f}{warm['peak_mb']:>10.1f}{warm['retained_mb']:>10.2f}{rss:>8}"
+              f"{budget['peak_mb'] if budget else '-':>8}  {status}")
+    print("(MB; retained is the warm run, rss is peak growth during the warm run)")
+
+    for route, result in results.items():
+        cold = result["cold"]
+        if cold["peak_sites"]:
+            print(f"\n{route}, top allocation sites near the peak (cold run):")
+            for site, size in cold["peak_sites"]:
+                print(f"  {size:8.2f} MB  {site}")
+        print(f"\n{route}, top retained allocation sites (cold run):")
+        for site, size in cold["retained_sites"]:
+            print(f"  {size:8.2f} MB  {site}")
+
+    if args.update_budgets:
+        budgets["routes"] = {
+            **budgets["routes"],
+            **{route: {
+                "peak_mb": round(max(result["warm"]["peak_mb"], 1) * BUDGET_HEADROOM, 1),
+                "retained_mb": round(max(result["warm"]["retained_mb"], 0.5) * BUDGET_HEADROOM, 1),
+            } for route, result in results.items()},
+        }
+        with open(BUDGETS_PATH, "w", encoding="utf-8") as f:
+            json.dump(budgets, f, indent=2)
+            f.write("\n")
+        print(f"\nBudgets written to {BUDGETS_PATH}")
+    elif failures:
+        print(f"\nOver budget: {', '.join(failures)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Admission control for batches: python -m pytest agents/tests/test_admission.py"""
+
+import os
+import sys
+
+AGENT_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../travel-agent-langgraph"))
+sys.path.insert(0, AGENT_DIR)
+
+from admission import AdmissionLimits, AdmissionRejected, build_controller
+
+
+def controller(**limits):
+    # No refill and no queueing, so the outcome does not depend on timing
+    defaults = dict(user_capacity=5, user_refill_per_second=0, global_capacity=100, global_refill_per_second=0,
+                    max_wait_seconds=0, route_costs={"router": 1})
+    return build_controller(AdmissionLimits(**{**defaults, **limits}))
+
+
+def test_batch_larger_than_user_budget_is_throttled():
+    results = controller().admit_batch("user-1", ["router"] * 8)
+
+    assert [isinstance(result, AdmissionRejected) for result in results] == [False] * 5 + [True] * 3
+    assert all(result.bucket == "user" for result in results[5:])
+
+
+def test_batch_of_one_user_leaves_others_their_budget():
+    admission = controller()
+    admission.admit_batch("user-1", ["router"] * 8)
+
+    assert admission.admit("user-2", "router") == 0.0
+
+
+def test_batch_is_charged_to_the_global_bucket():
+    admission = controller(user_capacity=100, global_capacity=3)
+    results = admission.admit_batch("user-1", ["router"] * 4)
+
+    assert isinstance(results[-1], AdmissionRejected) and results[-1].bucket == "global"
+    assert all(result == 0.0 for result in results[:3])
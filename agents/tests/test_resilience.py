@@ -0,0 +1,73 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Circuit breaker recovery: python -m pytest agents/tests/test_resilience.py"""
+
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+AGENT_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../travel-agent-langgraph"))
+sys.path.insert(0, AGENT_DIR)
+
+from resilience import CircuitOpen, Dependency
+
+RESET_SECONDS = 0.05
+
+
+async def fail():
+    raise ConnectionError("down")
+
+async def hang():
+    await asyncio.sleep(60)
+
+async def succeed():
+    return "ok"
+
+
+def half_open_dependency() -> Dependency:
+    dependency = Dependency("test", failure_threshold=1, reset_seconds=RESET_SECONDS)
+    with pytest.raises(ConnectionError):
+        asyncio.run(dependency.acall(fail))
+    time.sleep(RESET_SECONDS * 2)
+    assert dependency.breaker.state == "half_open"
+    return dependency
+
+
+def test_cancelled_half_open_trial_lets_the_next_trial_through():
+    dependency = half_open_dependency()
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(asyncio.wait_for(dependency.acall(hang), 0.01))
+
+    assert asyncio.run(dependency.acall(succeed)) == "ok"
+    assert dependency.breaker.state == "closed"
+
+
+def test_half_open_breaker_admits_one_trial_at_a_time():
+    dependency = half_open_dependency()
+
+    async def trial_and_second_call():
+        trial = asyncio.ensure_future(dependency.acall(hang))
+        await asyncio.sleep(0)
+        with pytest.raises(CircuitOpen):
+            await dependency.acall(succeed)
+        trial.cancel()
+
+    asyncio.run(trial_and_second_call())
+    assert asyncio.run(dependency.acall(succeed)) == "ok"
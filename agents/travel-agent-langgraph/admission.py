@@ -0,0 +1,212 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import threading
+import time
+from dataclasses import dataclass, field, replace
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import metrics
+from aws_clients import get_client, get_resource
+
+# Bucket state: (tokens, updated_at, version). The version guards concurrent updates to a shared store.
+BucketState = Tuple[float, float, int]
+
+class AdmissionRejected(Exception):
+    """The user or the account is over its token budget for longer than the admission queue allows."""
+    def __init__(self, bucket: str, retry_after: float):
+        super().__init__(f"Rate limited by {bucket} bucket, retry after {retry_after:.1f}s")
+        self.bucket = bucket
+        self.retry_after = retry_after
+
+
+@dataclass
+class AdmissionLimits:
+    enabled: bool = True
+    user_capacity: float = 20
+    user_refill_per_second: float = 0.2
+    global_capacity: float = 200
+    global_refill_per_second: float = 5
+    # Requests short of tokens wait up to this long for the refill, beyond it they are rejected
+    max_wait_seconds: float = 2
+    default_cost: float = 1
+    route_costs: Dict[str, float] = field(default_factory=dict)
+
+    def cost(self, route: str) -> float:
+        return self.route_costs.get(route, self.default_cost)
+
+
+class MemoryBucketStore:
+    """Process-local bucket state."""
+    def __init__(self):
+        self._buckets: Dict[str, BucketState] = {}
+        self._lock = threading.Lock()
+
+    def load(self, names) -> Dict[str, Optional[BucketState]]:
+        with self._lock:
+            return {name: self._buckets.get(name) for name in names}
+
+    def save(self, updates: Dict[str, Tuple[float, float, int]]) -> bool:
+        """Write (tokens, updated_at, expected_version) for every bucket, or nothing if any version moved."""
+        with self._lock:
+            for name, (_, _, version) in updates.items():
+                if self._buckets.get(name, (0, 0, 0))[2] != version:
+                    return False
+            for name, (tokens, updated_at, version) in updates.items():
+                self._buckets[name] = (tokens, updated_at, version + 1)
+            return True
+
+
+class DynamoDBBucketStore:
+    """Bucket state shared by every container, in the repo's id/createdAt table layout."""
+    SORT_KEY = "admission"
+
+    def __init__(self, table_name: str):
+        self.table_name = table_name
+        self.table = get_resource('dynamodb').Table(table_name)
+        self.client = get_client('dynamodb')
+
+    def load(self, names) -> Dict[str, Optional[BucketState]]:
+        states = {}
+        for name in names:
+            item = self.table.get_item(Key={'id': f"bucket:{name}", 'createdAt': self.SORT_KEY}, ConsistentRead=True).get('Item')
+            states[name] = (float(item['tokens']), float(item['updated_at']), int(item['version'])) if item else None
+        return states
+
+    def save(self, updates: Dict[str, Tuple[float, float, int]]) -> bool:
+        items = []
+        for name, (tokens, updated_at, version) in updates.items():
+            items.append({'Put': {
+                'TableName': self.table_name,
+                'Item': {
+                    'id': {'S': f"bucket:{name}"}, 'createdAt': {'S': self.SORT_KEY},
+                    'tokens': {'N': f"{tokens:.6f}"}, 'updated_at': {'N': f"{updated_at:.6f}"},
+                    'version': {'N': str(version + 1)},
+                    # Idle user buckets are full again after a day, let the table TTL drop them
+                    'expires_at': {'N': str(int(updated_at) + 86400)},
+                },
+                'ConditionExpression': 'attribute_not_exists(id) OR version = :v',
+                'ExpressionAttributeValues': {':v': {'N': str(version)}},
+            }})
+        try:
+            self.client.transact_write_items(TransactItems=items)
+            return True
+        except self.client.exceptions.TransactionCanceledException:
+            return False
+
+    def load_limits(self) -> Optional[Dict]:
+        """Limit overrides stored in the table, editable at runtime without a redeploy."""
+        item = self.table.get_item(Key={'id': 'admission-config', 'createdAt': self.SORT_KEY}).get('Item')
+        return item.get('limits') if item else None
+
+
+class AdmissionController:
+    """Per-user and global token buckets charged by route cost, in front of node execution."""
+    SAVE_ATTEMPTS = 3
+
+    def __init__(self, limits: AdmissionLimits, store: Any, refresh_seconds: float = 60):
+        self.defaults = limits
+        self.limits = limits
+        self.store = store
+        self.refresh_seconds = refresh_seconds
+        self._refreshed_at = 0.0
+
+    def admit(self, user_id: Optional[str], route: str) -> float:
+        """Reserve the route's cost and return how long to wait before running it. Raises AdmissionRejected.
+
+        user_id must be an authenticated identity. Without one only the global bucket is charged, since a
+        shared placeholder id would turn the per-user bucket into a second, much smaller global bucket.
+        """
+        self._refresh_limits()
+        limits = self.limits
+        if not limits.enabled:
+            return 0.0
+        cost = limits.cost(route)
+        buckets = {"global": (limits.global_capacity, limits.global_refill_per_second)}
+        if user_id:
+            buckets[f"user:{user_id}"] = (limits.user_capacity, limits.user_refill_per_second)
+        try:
+            for _ in range(self.SAVE_ATTEMPTS):
+                now = time.time()
+                states = self.store.load(buckets)
+                updates, wait, limiting = {}, 0.0, None
+                for name, (capacity, rate) in buckets.items():
+                    tokens, updated_at, version = states[name] or (capacity, now, 0)
+                    tokens = min(capacity, tokens + (now - updated_at) * rate)
+                    bucket_wait = max(0.0, (cost - tokens) / rate) if rate > 0 else (0.0 if tokens >= cost else float("inf"))
+                    if bucket_wait > wait:
+                        wait, limiting = bucket_wait, name
+                    # Tokens may go negative: the deficit is the queue of admitted requests still waiting
+                    updates[name] = (tokens - cost, now, version)
+                if wait > limits.max_wait_seconds:
+                    metrics.incr(f"admission.{route}.rejected")
+                    raise AdmissionRejected(limiting.split(":")[0], wait)
+                if self.store.save(updates):
+                    metrics.incr(f"admission.{route}.{'queued' if wait else 'admitted'}")
+                    if wait:
+                        print(f"Admission: {route} for {user_id or 'anonymous'} queued {wait:.2f}s on {limiting} bucket")
+                    return wait
+        except AdmissionRejected:
+            raise
+        except Exception as e:
+            print(f"Admission store error, admitting: {e}")
+            metrics.incr("admission.store_error")
+            return 0.0
+        # Persistent contention on the buckets, fail open rather than reject healthy traffic
+        metrics.incr("admission.contention")
+        return 0.0
+
+    def admit_batch(self, user_id: Optional[str], routes: List[str]) -> List[Union[float, AdmissionRejected]]:
+        """Admit each item of a batch like a single request, in order.
+
+        Returns per item the queueing delay, or the AdmissionRejected that turned it away, so a batch
+        never gets past the budget its items would have had one by one.
+        """
+        results = []
+        for route in routes:
+            try:
+                results.append(self.admit(user_id, route))
+            except AdmissionRejected as e:
+                results.append(e)
+        return results
+
+    def _refresh_limits(self) -> None:
+        if not hasattr(self.store, 'load_limits') or time.time() - self._refreshed_at < self.refresh_seconds:
+            return
+        self._refreshed_at = time.time()
+        try:
+            overrides = self.store.load_limits() or {}
+            fields = {key: value for key, value in overrides.items() if key in AdmissionLimits.__dataclass_fields__}
+            fields = {key: (
+                {route: float(cost) for route, cost in value.items()} if key == "route_costs"
+                else value if key == "enabled" else float(value)
+            ) for key, value in fields.items()}
+            if "route_costs" in fields:
+                fields["route_costs"] = {**self.defaults.route_costs, **fields["route_costs"]}
+            self.limits = replace(self.defaults, **fields)
+        except Exception as e:
+            print(f"Admission limits refresh error, keeping current limits: {e}")
+
+
+def build_controller(limits: AdmissionLimits, backend: str = "memory", table_name: Optional[str] = None,
+                     refresh_seconds: float = 60) -> AdmissionController:
+    """Build an admission controller. backend is "memory" or "dynamodb"."""
+    if backend == "dynamodb" and table_name:
+        store = DynamoDBBucketStore(table_name)
+    else:
+        if backend != "memory":
+            print(f"Admission backend {backend} not configured, using memory")
+        store = MemoryBucketStore()
+    return AdmissionController(limits, store, refresh_seconds)
@@ -14,27 +14,41 @@
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE. 
 
 from langgraph.graph import StateGraph, START, END
-from typing import TypedDict, Dict, List, Union
+from typing import TypedDict, Any, Callable, Dict, Iterator, List, Optional, Union
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout, as_completed
 from enum import Enum
+import asyncio
+import contextvars
+import math
+import threading
 import time
-import boto3
 import re
 import json
 
 from config import (
     user_table_name, chat_table_name, wishlist_table_name, kb_id,
-    USE_PAAPI, paapi_access, paapi_secret, partner_tag,
+    USE_PAAPI, paapi_access, paapi_secret, partner_tag, SPECULATIVE_PREFETCH, BATCH_MAX_CONCURRENCY,
+    MODEL_CASCADE_ROUTES, CASCADE_POLICIES,
+    ADMISSION_ENABLED, ADMISSION_BACKEND, ADMISSION_TABLE_NAME, ADMISSION_REFRESH_SECONDS,
+    ADMISSION_USER_CAPACITY, ADMISSION_USER_REFILL, ADMISSION_GLOBAL_CAPACITY, ADMISSION_GLOBAL_REFILL,
+    ADMISSION_MAX_WAIT, ADMISSION_ROUTE_COSTS, MODEL_RETRY_BUDGET, MODEL_MAX_THROTTLE_WAIT,
     nova_lite_llm_converse, nova_pro_llm_converse, AGENT_RT,
     my_api_key, my_cse_id, open_weather_api_key
 )
 from nodes import (
-    IntroNode, InternetSearchNode, AmazonFactsNode, TripRecommendationNode,
+    BaseNode, build_chain, IntroNode, InternetSearchNode, AmazonFactsNode, TripRecommendationNode,
     PackingListNode, WeatherNode, ConversationSummaryNode, OrderCartNode,
     ProductSearchNode, RemoveCartNode, AddFromHistoryNode, UserSummaryNode,
     FallbackPackingListNode, FallbackProductSearchNode
 )
+from aws_clients import get_resource
+from admission import AdmissionLimits, AdmissionRejected, build_controller
+import scheduler
+import deadline
+import metrics
 from prompts import route_prompt_template
-from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import RunnableLambda
 
 class AgentState(TypedDict):
     input: str
@@ -42,7 +56,11 @@ class AgentState(TypedDict):
     user_profile: Dict
     conversation_id: str
     user_id: str
+    # Authenticated caller, keys the per-user admission bucket. None skips it
+    principal: Optional[str]
     final_output: Dict
+    prefetched: Optional[Future]
+    deadline: Optional[float]
 
 class RouteType(Enum):
     INTRO = "intro"
@@ -59,49 +77,121 @@ class RouteType(Enum):
     USER_SUMMARY = "user_summary"
     GROCERY = "grocery"
 
+# Nodes are built on first dispatch and shared by every TravelAgent in the process
+_materialized_nodes: Dict[RouteType, BaseNode] = {}
+_materialize_lock = threading.Lock()
+
+def materialized_nodes() -> List[str]:
+    """Report which routes have had their node constructed so far."""
+    return [route_type.value for route_type in _materialized_nodes]
+
+# Cheap input heuristics used to start node work while the router is still running.
+# Routes grouped together share one prefetch, so it must return the same data for each of them.
+PREFETCH_HINTS = [
+    (re.compile(r"\b(weather|forecast|temperature|rain(y|ing)?|snow(y|ing)?|sunny|humid|degrees)\b", re.IGNORECASE),
+     (RouteType.WEATHER,)),
+    (re.compile(r"\b(cart|basket|wishlist|checkout|order)\b", re.IGNORECASE),
+     (RouteType.ORDER_CART, RouteType.REMOVE_CART, RouteType.ADD_CART)),
+    (re.compile(r"\b(things to do|what (should|can|to) (i |we )?(do|see|visit)|recommend\w*|itinerary|sightseeing|trip to|where (should|to) (i |we )?(go|stay|eat))\b", re.IGNORECASE),
+     (RouteType.TRIP_REC,)),
+]
+
+# Module level so the buckets outlive the per-request TravelAgent instances
+admission = build_controller(
+    AdmissionLimits(
+        enabled=ADMISSION_ENABLED,
+        user_capacity=ADMISSION_USER_CAPACITY,
+        user_refill_per_second=ADMISSION_USER_REFILL,
+        global_capacity=ADMISSION_GLOBAL_CAPACITY,
+        global_refill_per_second=ADMISSION_GLOBAL_REFILL,
+        max_wait_seconds=ADMISSION_MAX_WAIT,
+        route_costs=ADMISSION_ROUTE_COSTS,
+    ),
+    backend=ADMISSION_BACKEND, table_name=ADMISSION_TABLE_NAME, refresh_seconds=ADMISSION_REFRESH_SECONDS
+)
+
+# Admission cost key charged for the router call itself, before the route's own cost is known
+ROUTER_ADMISSION_KEY = "router"
+
+_prefetch_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="prefetch")
+# Runs a deadline-bound graph so run() can return a best-effort answer when the deadline passes
+_turn_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="turn")
+
+DEADLINE_EXCEEDED_ANSWER = ("Sorry, I couldn't finish that in time. Please try again in a moment, "
+                            "or ask a more specific question.")
+
 class TravelAgent:
     def __init__(self):
-        self.dynamodb = boto3.resource('dynamodb')
+        self.dynamodb = get_resource('dynamodb')
         self.user_table = self.dynamodb.Table(user_table_name)
         self.chat_table = self.dynamodb.Table(chat_table_name)
         self.wishlist_table = self.dynamodb.Table(wishlist_table_name)
+        self.router_chain = build_chain(route_prompt_template, nova_lite_llm_converse, "router_chain")
+        self.node_factories = self._node_factories()
         self.graph = self._build_graph()
+        print(f"Materialized nodes: {materialized_nodes() or 'none'}")
 
-    def _build_graph(self) -> StateGraph:
-        graph = StateGraph(AgentState)
-        
+    def _node_factories(self) -> Dict[RouteType, Callable[[], BaseNode]]:
+        """Return a factory per route so nodes are only constructed when first dispatched."""
         # Create nodes with PAAPI fallback
         if USE_PAAPI and paapi_access and paapi_secret:
-            pack_node = PackingListNode(nova_lite_llm_converse, paapi_access, paapi_secret, partner_tag)
-            product_node = ProductSearchNode(nova_lite_llm_converse, paapi_access, paapi_secret, partner_tag)
-            grocery_node = PackingListNode(nova_lite_llm_converse, paapi_access, paapi_secret, partner_tag)
+            pack_factory = lambda: PackingListNode(nova_lite_llm_converse, paapi_access, paapi_secret, partner_tag)
+            product_factory = lambda: ProductSearchNode(nova_lite_llm_converse, paapi_access, paapi_secret, partner_tag)
+            grocery_factory = lambda: PackingListNode(nova_lite_llm_converse, paapi_access, paapi_secret, partner_tag)
         else:
-            pack_node = FallbackPackingListNode(nova_lite_llm_converse)
-            product_node = FallbackProductSearchNode(nova_lite_llm_converse)
-            grocery_node = FallbackPackingListNode(nova_lite_llm_converse)
-
-        nodes = {
-            RouteType.INTRO: IntroNode(nova_lite_llm_converse),
-            RouteType.INTERNET_SEARCH: InternetSearchNode(nova_pro_llm_converse, my_api_key, my_cse_id),
-            RouteType.AMAZON_FACTS: AmazonFactsNode(nova_pro_llm_converse),
-            RouteType.TRIP_REC: TripRecommendationNode(nova_pro_llm_converse, AGENT_RT, kb_id),
-            RouteType.PACK_LIST: pack_node,
-            RouteType.WEATHER: WeatherNode(nova_lite_llm_converse, open_weather_api_key),
-            RouteType.CONV_SUMMARY: ConversationSummaryNode(nova_pro_llm_converse, chat_table_name, self.dynamodb),
-            RouteType.ORDER_CART: OrderCartNode(nova_lite_llm_converse, wishlist_table_name, self.dynamodb),
-            RouteType.PRODUCT_SEARCH: product_node,
-            RouteType.REMOVE_CART: RemoveCartNode(nova_lite_llm_converse, wishlist_table_name, self.dynamodb),
-            RouteType.ADD_CART: AddFromHistoryNode(nova_lite_llm_converse, wishlist_table_name, self.dynamodb),
-            RouteType.USER_SUMMARY: UserSummaryNode(nova_pro_llm_converse),
-            RouteType.GROCERY: grocery_node
+            pack_factory = lambda: FallbackPackingListNode(nova_lite_llm_converse)
+            product_factory = lambda: FallbackProductSearchNode(nova_lite_llm_converse)
+            grocery_factory = lambda: FallbackPackingListNode(nova_lite_llm_converse)
+
+        return {
+            RouteType.INTRO: lambda: IntroNode(nova_lite_llm_converse),
+            RouteType.INTERNET_SEARCH: lambda: InternetSearchNode(*self._pro_llm(RouteType.INTERNET_SEARCH, my_api_key, my_cse_id)),
+            RouteType.AMAZON_FACTS: lambda: AmazonFactsNode(*self._pro_llm(RouteType.AMAZON_FACTS)),
+            RouteType.TRIP_REC: lambda: TripRecommendationNode(*self._pro_llm(RouteType.TRIP_REC, AGENT_RT, kb_id)),
+            RouteType.PACK_LIST: pack_factory,
+            RouteType.WEATHER: lambda: WeatherNode(nova_lite_llm_converse, open_weather_api_key),
+            RouteType.CONV_SUMMARY: lambda: ConversationSummaryNode(*self._pro_llm(RouteType.CONV_SUMMARY, chat_table_name, self.dynamodb)),
+            RouteType.ORDER_CART: lambda: OrderCartNode(nova_lite_llm_converse, wishlist_table_name, self.dynamodb),
+            RouteType.PRODUCT_SEARCH: product_factory,
+            RouteType.REMOVE_CART: lambda: RemoveCartNode(nova_lite_llm_converse, wishlist_table_name, self.dynamodb),
+            RouteType.ADD_CART: lambda: AddFromHistoryNode(nova_lite_llm_converse, wishlist_table_name, self.dynamodb),
+            RouteType.USER_SUMMARY: lambda: UserSummaryNode(*self._pro_llm(RouteType.USER_SUMMARY)),
+            RouteType.GROCERY: grocery_factory
         }
 
-        # Add router node
-        graph.add_node("router", self._route)
+    @staticmethod
+    def _pro_llm(route_type: RouteType, *args) -> tuple:
+        """Constructor args for a Nova Pro node: Nova Lite with escalation to Pro when the route is cascaded."""
+        if route_type.value in MODEL_CASCADE_ROUTES and route_type.value in CASCADE_POLICIES:
+            return (nova_lite_llm_converse, *args, nova_pro_llm_converse, CASCADE_POLICIES[route_type.value])
+        return (nova_pro_llm_converse, *args)
+
+    def _get_node(self, route_type: RouteType) -> BaseNode:
+        """Build the node for a route on first dispatch and memoize it for the life of the process."""
+        node = _materialized_nodes.get(route_type)
+        if node is None:
+            with _materialize_lock:
+                node = _materialized_nodes.get(route_type)
+                if node is None:
+                    start = time.perf_counter()
+                    node = self.node_factories[route_type]()
+                    _materialized_nodes[route_type] = node
+                    print(f"Materialized node {route_type.value} ({node.__class__.__name__}) "
+                          f"in {(time.perf_counter() - start) * 1000:.1f} ms")
+        return node
+
+    def _build_graph(self) -> StateGraph:
+        graph = StateGraph(AgentState)
+
+        # Add router node, with a native async path for graph.ainvoke
+        graph.add_node("router", RunnableLambda(self._route, afunc=self._aroute))
         
-        # Add processing nodes
-        for route_type, node in nodes.items():
-            graph.add_node(route_type.value, node.process)
+        # Add processing nodes, resolved lazily on first dispatch
+        for route_type in self.node_factories.keys():
+            graph.add_node(route_type.value, RunnableLambda(
+                lambda state, route_type=route_type: self._get_node(route_type).process(state),
+                afunc=lambda state, route_type=route_type: self._get_node(route_type).aprocess(state)
+            ))
 
         # Add conditional edges from router
         def route_to_node(state):
@@ -110,11 +200,11 @@ class TravelAgent:
         graph.add_conditional_edges(
             "router",
             route_to_node,
-            {route_type.value: route_type.value for route_type in nodes.keys()}
+            {route_type.value: route_type.value for route_type in self.node_factories.keys()}
         )
 
         # Add edges from nodes to END
-        for route_type in nodes.keys():
+        for route_type in self.node_factories.keys():
             graph.add_edge(route_type.value, END)
 
         graph.set_entry_point("router")
@@ -122,20 +212,100 @@ class TravelAgent:
         return graph.compile()
     
 
+    def _start_prefetches(self, state: AgentState) -> Dict[RouteType, Future]:
+        """Launch side-effect free node prefetches the input hints at, to overlap with the router call.
+
+        Only nodes that are already materialized prefetch, so a hint never constructs a node the router may not pick.
+        """
+        futures = {}
+        if not SPECULATIVE_PREFETCH:
+            return futures
+
+        for pattern, route_types in PREFETCH_HINTS:
+            if pattern.search(state["input"]):
+                node = _materialized_nodes.get(route_types[0])
+                if node is None:
+                    metrics.incr("prefetch.not_materialized")
+                    continue
+                future = _prefetch_executor.submit(scheduler.background(node.prefetch, dict(state)))
+                for route_type in route_types:
+                    futures[route_type] = future
+
+        if futures:
+            print(f"Speculative prefetch started for: {[route_type.value for route_type in futures]}")
+        return futures
+
+    @staticmethod
+    def _settle_prefetches(futures: Dict[RouteType, Future], next_route: str) -> Optional[Future]:
+        """Keep the prefetch for the chosen route and cancel the rest. Already running prefetches finish and are discarded.
+
+        A winner still queued behind other prefetches is cancelled too, and the node computes it inline instead.
+        """
+        winner = futures.get(RouteType(next_route))
+        for future in set(futures.values()):
+            if future is not winner:
+                future.cancel()
+        if winner is not None and winner.cancel():
+            metrics.incr("prefetch.queued")
+            print(f"Speculative prefetch for route {next_route} had not started, computing it inline")
+            return None
+        if winner is not None:
+            print(f"Using speculative prefetch for route: {next_route}")
+        return winner
+
+    @staticmethod
+    def _admit_router(state: AgentState) -> float:
+        """Charge the router call to the caller's and the global bucket before it runs, returning the queueing delay."""
+        return admission.admit(state.get("principal"), ROUTER_ADMISSION_KEY)
+
+    @staticmethod
+    def _admit(state: AgentState, next_route: str, prefetches: Dict[RouteType, Future]) -> float:
+        """Charge the chosen route's cost on top of the router's, returning the queueing delay."""
+        try:
+            return admission.admit(state.get("principal"), next_route)
+        except Exception:
+            for future in set(prefetches.values()):
+                future.cancel()
+            raise
+
     def _route(self, state: AgentState) -> str:
+        time.sleep(self._admit_router(state))
+        prefetches = self._start_prefetches(state)
 
         try:
-            router_chain = (route_prompt_template | nova_lite_llm_converse | StrOutputParser()).with_config({"name": "router_chain"})
-            pred = router_chain.invoke({"question": state["input"]})
+            pred = self.router_chain.invoke({"question": state["input"]})
             print(f"Selected route: {pred}")
             next_route = RouteType(pred).value
         except:
             next_route = RouteType.INTRO.value
 
+        time.sleep(self._admit(state, next_route, prefetches))
+
         # Return the full state with the next route
         return {
             **state,
-            "next": next_route
+            "next": next_route,
+            "prefetched": self._settle_prefetches(prefetches, next_route)
+        }
+
+    async def _aroute(self, state: AgentState) -> str:
+        # The admission store may be DynamoDB, keep its calls off the event loop
+        await asyncio.sleep(await asyncio.to_thread(self._admit_router, state))
+        prefetches = self._start_prefetches(state)
+
+        try:
+            pred = await self.router_chain.ainvoke({"question": state["input"]})
+            print(f"Selected route: {pred}")
+            next_route = RouteType(pred).value
+        except:
+            next_route = RouteType.INTRO.value
+
+        await asyncio.sleep(await asyncio.to_thread(self._admit, state, next_route, prefetches))
+
+        return {
+            **state,
+            "next": next_route,
+            "prefetched": self._settle_prefetches(prefetches, next_route)
         }
 
     def _get_user_profile(self, tid="default_user", created_at = 'now') -> Dict:
@@ -154,16 +324,21 @@ class TravelAgent:
             return []
 
     def _update_chat_history(self, state: AgentState, tid="default_user", cid = "1", created_at = 'now') -> None:
+        self._put_chat_history(state['chat_history'] + self._chat_messages(state), cid, created_at)
+
+    @staticmethod
+    def _chat_messages(state: AgentState) -> List[Dict]:
+        return [
+            {'user': state['input'], 'time': int(time.time())},
+            {'bot': state['final_output']['answer'], 'time': int(time.time())}
+        ]
+
+    def _put_chat_history(self, history: List[Dict], cid = "1", created_at = 'now') -> None:
         try:
-            new_messages = [
-                {'user': state['input'], 'time': int(time.time())},
-                {'bot': state['final_output']['answer'], 'time': int(time.time())}
-            ]
-            
             self.chat_table.put_item(Item={
                 'id': cid,
                 'createdAt': created_at,
-                'history': state['chat_history'] + new_messages,
+                'history': history,
                 'latest_timestamp': str(time.time())
             })
         except Exception as e:
@@ -187,21 +362,205 @@ class TravelAgent:
         except Exception as e:
             print(f"Error updating wishlist: {e}")
 
-    def run(self, input_text: str, user_id: str) -> Dict:
+    def run(self, input_text: str, user_id: str, deadline_at: Optional[float] = None,
+            principal: Optional[str] = None) -> Dict:
+        """Answer one turn. With deadline_at (epoch seconds) nodes degrade as it nears and a best-effort answer is returned by then.
+
+        principal is the authenticated caller charged for the turn; without it only the global admission bucket applies.
+        """
+        state = self._new_state(input_text, user_id, deadline_at, principal,
+                                self._get_chat_history(), self._get_user_profile())
+        with scheduler.turn(MODEL_RETRY_BUDGET, self._throttle_wait(state)), deadline.scope(deadline_at):
+            left = deadline.remaining(state)
+            if math.isinf(left):
+                result = self.graph.invoke(state)
+            else:
+                future = _turn_executor.submit(contextvars.copy_context().run, self.graph.invoke, state)
+                try:
+                    result = future.result(timeout=max(0.0, left))
+                except FutureTimeout:
+                    # The graph thread cannot be interrupted; it stops before its next step, so no cart or wishlist write lands
+                    deadline.cancel()
+                    return self._format_response(self._deadline_exceeded(state))
+        self._update_chat_history(result)
+        
+        return self._format_response(result)
+
+    async def arun(self, input_text: str, user_id: str, deadline_at: Optional[float] = None,
+                   principal: Optional[str] = None) -> Dict:
+        """Async counterpart of run, for hosting many concurrent conversations in one long-running process."""
+        chat_history, user_profile = await asyncio.gather(
+            asyncio.to_thread(self._get_chat_history),
+            asyncio.to_thread(self._get_user_profile)
+        )
+        state = self._new_state(input_text, user_id, deadline_at, principal, chat_history, user_profile)
+        with scheduler.turn(MODEL_RETRY_BUDGET, self._throttle_wait(state)), deadline.scope(deadline_at):
+            left = deadline.remaining(state)
+            try:
+                result = await asyncio.wait_for(self.graph.ainvoke(state), None if math.isinf(left) else max(0.0, left))
+            except asyncio.TimeoutError:
+                # The graph task is cancelled; steps already handed to worker threads see the flag
+                deadline.cancel()
+                return self._format_response(self._deadline_exceeded(state))
+        await asyncio.to_thread(self._update_chat_history, result)
+
+        return self._format_response(result)
+
+    @staticmethod
+    def _new_state(input_text: str, user_id: str, deadline_at: Optional[float], principal: Optional[str],
+                   chat_history: List[Dict], user_profile: Dict) -> AgentState:
         state = AgentState(
             input=input_text,
-            chat_history=self._get_chat_history(),
-            user_profile=self._get_user_profile(),
+            chat_history=chat_history,
+            user_profile=user_profile,
             conversation_id=f"{user_id}_{int(time.time())}", # TODO: Sync with session id from UI
             user_id=user_id,
-            final_output={}
+            principal=principal,
+            final_output={},
+            deadline=deadline_at
         )
-        
         # Log non-sensitive state info only
         print(f"Processing request for user: {state['user_id']}, conversation: {state['conversation_id'][:8]}...")
-        result = self.graph.invoke(state)
-        self._update_chat_history(result)
-        
+        return state
+
+    @staticmethod
+    def _throttle_wait(state: AgentState) -> float:
+        """Seconds the turn may spend waiting out model throttling, never past the deadline's answer reserve."""
+        return max(0.0, min(MODEL_MAX_THROTTLE_WAIT, deadline.remaining(state) - deadline.DEADLINE_ANSWER_RESERVE))
+
+    @staticmethod
+    def is_deadline_answer(response: Dict) -> bool:
+        """Whether a formatted response is the best-effort answer of a turn that ran out of time."""
+        return response.get("promptResponse") == DEADLINE_EXCEEDED_ANSWER
+
+    @staticmethod
+    def _deadline_exceeded(state: AgentState) -> Dict:
+        metrics.incr("deadline.exceeded")
+        print(f"Deadline passed for user: {state['user_id']}, returning a best-effort answer")
+        return {**state, "final_output": {"answer": DEADLINE_EXCEEDED_ANSWER}}
+
+    def run_batch(self, requests: List[Dict], max_concurrency: int = BATCH_MAX_CONCURRENCY,
+                  update_history: bool = False, principal: Optional[str] = None,
+                  deadline_at: Optional[float] = None) -> Iterator[Dict]:
+        """Answer many {"user_id", "prompt"} requests, yielding one result per request as it completes.
+
+        All prompts are routed in one batched router call, then node work is grouped by route and
+        run on at most max_concurrency threads. Results arrive out of order and carry the request index.
+        Every item is charged to admission control like a /prompt turn of principal: the router cost up
+        front and the route cost before its node runs. Items over budget get a result with status 429
+        and retry_after instead of an answer. With deadline_at (epoch seconds) items still running then are
+        abandoned and reported with status 504 and unfinished set, so the finished ones are not lost.
+        Chat history is left untouched unless update_history is set, e.g. for evaluation sets. The history
+        is a single read-modify-write item, so the answered turns are appended in request order in one
+        write once the whole batch has been answered.
+        """
+        # Loaded once per batch, the same way run() loads them for every request
+        chat_history = self._get_chat_history()
+        user_profile = self._get_user_profile()
+        states = [
+            AgentState(
+                input=request["prompt"],
+                chat_history=chat_history,
+                user_profile=user_profile,
+                conversation_id=f"{request.get('user_id', 'default_user')}_{int(time.time())}",
+                user_id=request.get("user_id", "default_user"),
+                principal=principal,
+                final_output={},
+                deadline=deadline_at
+            )
+            for request in requests
+        ]
+        with deadline.scope(deadline_at):
+            yield from self._run_batch(states, max_concurrency, update_history, principal, chat_history)
+
+    def _run_batch(self, states: List[AgentState], max_concurrency: int, update_history: bool,
+                   principal: Optional[str], chat_history: List[Dict]) -> Iterator[Dict]:
+        """run_batch inside the batch's deadline scope."""
+        admitted = []
+        admissions = admission.admit_batch(principal, [ROUTER_ADMISSION_KEY] * len(states))
+        for index, admitted_after in enumerate(admissions):
+            if isinstance(admitted_after, AdmissionRejected):
+                yield {"index": index, "user_id": states[index]["user_id"], **self._rejected_response(admitted_after)}
+            else:
+                admitted.append(index)
+        if not admitted:
+            return
+        # Admitted items may be queued behind each other; the router call covers them all
+        time.sleep(max(admissions[index] for index in admitted))
+
+        # Batch work yields to interactive turns when models are throttled
+        with scheduler.turn(MODEL_RETRY_BUDGET * len(admitted), 0), scheduler.priority(scheduler.BACKGROUND):
+            preds = self.router_chain.batch(
+                [{"question": states[index]["input"]} for index in admitted],
+                config={"max_concurrency": max_concurrency},
+                return_exceptions=True
+            )
+        by_route = defaultdict(list)
+        for index, pred in zip(admitted, preds):
+            by_route[self._parse_route(pred)].append(index)
+        print(f"Batch of {len(admitted)} routed: {({route: len(indexes) for route, indexes in by_route.items()})}")
+
+        answered = {}
+        executor = ThreadPoolExecutor(max_concurrency)
+        futures = {}
+        for route, indexes in by_route.items():
+            for index in indexes:
+                # Copied context, so items see the batch deadline and its cancellation
+                future = executor.submit(contextvars.copy_context().run, self._run_batch_item, states[index], route)
+                futures[future] = (index, route)
+        left = deadline.remaining()
+        try:
+            for future in as_completed(futures, timeout=None if math.isinf(left) else max(0.0, left)):
+                index, route = futures.pop(future)
+                result = future.result()
+                if "final_output" in result:
+                    answered[index] = result
+                    response = self._format_response(result)
+                else:
+                    response = result
+                yield {"index": index, "user_id": states[index]["user_id"], "route": route, **response}
+        except FutureTimeout:
+            # Running items stop before their next step, so no cart or wishlist write lands after this
+            deadline.cancel()
+            metrics.incr("deadline.batch_unfinished", len(futures))
+            print(f"Batch deadline passed with {len(futures)} of {len(states)} items unfinished")
+            for index, route in sorted(futures.values()):
+                yield {"index": index, "user_id": states[index]["user_id"], "route": route,
+                       "error": "Not finished before the deadline", "status": 504, "unfinished": True}
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        if update_history and answered:
+            new_messages = [message for index in sorted(answered) for message in self._chat_messages(answered[index])]
+            self._put_chat_history(chat_history + new_messages)
+
+    def _run_batch_item(self, state: AgentState, route: str) -> Dict:
+        """The node's final state for one batch request, or {"error": ...} when it failed or was not admitted."""
+        try:
+            time.sleep(admission.admit(state["principal"], route))
+        except AdmissionRejected as e:
+            return self._rejected_response(e)
+        try:
+            node = self._get_node(RouteType(route))
+            with scheduler.turn(MODEL_RETRY_BUDGET, 0), scheduler.priority(scheduler.BACKGROUND):
+                return node.process({**state, "next": route, "prefetched": None})
+        except Exception as e:
+            print(f"Batch item error on {route}: {e}")
+            return {"error": str(e)}
+
+    @staticmethod
+    def _rejected_response(error: AdmissionRejected) -> Dict:
+        return {"error": str(error), "status": 429, "retry_after": error.retry_after}
+
+    @staticmethod
+    def _parse_route(pred: Any) -> str:
+        try:
+            return RouteType(pred).value
+        except ValueError:
+            return RouteType.INTRO.value
+
+    @staticmethod
+    def _format_response(result: Dict) -> Dict:
         response = result['final_output']
         body = {
             "promptResponse": response.get('answer', '').split("<answer>")[-1]
@@ -0,0 +1,122 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import os
+import threading
+from typing import Any, Dict
+import boto3
+from botocore.config import Config
+
+#################### AWS CLIENT CONFIG ####################
+
+region_name = os.environ.get('AWS_REGION')
+
+# Size the pools to the number of calls one process can have in flight at once
+AWS_MAX_POOL_CONNECTIONS = int(os.environ.get('AWS_MAX_POOL_CONNECTIONS', '25'))
+
+# (connect_timeout, read_timeout) in seconds per service, failing fast instead of hanging
+SERVICE_TIMEOUTS = {
+    'bedrock-runtime': (3, int(os.environ.get('BEDROCK_READ_TIMEOUT', '60'))),
+    'bedrock-agent-runtime': (3, int(os.environ.get('KB_READ_TIMEOUT', '15'))),
+    'dynamodb': (2, 5),
+    'secretsmanager': (2, 5),
+}
+DEFAULT_TIMEOUTS = (3, 15)
+
+# Bedrock runtime throttling is handled by scheduler.py (failover and a per-turn retry budget),
+# so botocore only retries transient errors once instead of sleeping through 10 attempts
+SERVICE_RETRIES = {
+    'bedrock-runtime': {'max_attempts': int(os.environ.get('BEDROCK_MAX_ATTEMPTS', '2')), 'mode': 'standard'},
+    'bedrock-agent-runtime': {'max_attempts': 10, 'mode': 'adaptive'},
+}
+DEFAULT_RETRIES = {'max_attempts': 3, 'mode': 'standard'}
+
+#################### CLIENT REGISTRY ####################
+
+_session = None
+_clients: Dict[str, Any] = {}
+_resources: Dict[str, Any] = {}
+_lock = threading.Lock()
+
+def get_session() -> boto3.session.Session:
+    """Return the boto3 session shared by every client in the process."""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = boto3.session.Session(region_name=region_name)
+    return _session
+
+def client_config(service_name: str) -> Config:
+    connect_timeout, read_timeout = SERVICE_TIMEOUTS.get(service_name, DEFAULT_TIMEOUTS)
+    return Config(
+        region_name=region_name,
+        signature_version='v4',
+        connect_timeout=connect_timeout,
+        read_timeout=read_timeout,
+        max_pool_connections=AWS_MAX_POOL_CONNECTIONS,
+        tcp_keepalive=True,
+        retries=SERVICE_RETRIES.get(service_name, DEFAULT_RETRIES),
+    )
+
+def get_client(service_name: str) -> Any:
+    """Return the memoized low-level client for a service."""
+    client = _clients.get(service_name)
+    if client is None:
+        session = get_session()
+        with _lock:
+            client = _clients.get(service_name)
+            if client is None:
+                client = session.client(service_name, config=client_config(service_name))
+                _clients[service_name] = client
+    return client
+
+def get_resource(service_name: str) -> Any:
+    """Return the memoized resource for a service, e.g. dynamodb tables."""
+    resource = _resources.get(service_name)
+    if resource is None:
+        session = get_session()
+        with _lock:
+            resource = _resources.get(service_name)
+            if resource is None:
+                resource = session.resource(service_name, config=client_config(service_name))
+                _resources[service_name] = resource
+    return resource
+
+def pool_stats() -> Dict[str, Dict]:
+    """Snapshot of the urllib3 connection pools behind every registered client, for diagnosis."""
+    registered = dict(_clients)
+    registered.update({f"{name} (resource)": resource.meta.client for name, resource in _resources.items()})
+
+    stats = {}
+    for name, client in registered.items():
+        entry = {"max_pool_connections": client.meta.config.max_pool_connections, "pools": []}
+        try:
+            # botocore does not expose its pool manager publicly
+            manager = client._endpoint.http_session._manager
+            for key in list(manager.pools.keys()):
+                pool = manager.pools.get(key)
+                if pool is None:
+                    continue
+                entry["pools"].append({
+                    "host": pool.host,
+                    "connections_created": pool.num_connections,
+                    "requests": pool.num_requests,
+                    "idle_connections": pool.pool.qsize() if pool.pool else 0,
+                })
+        except AttributeError as e:
+            entry["error"] = f"Pool stats unavailable: {e}"
+        stats[name] = entry
+    return stats
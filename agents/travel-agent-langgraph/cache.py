@@ -0,0 +1,153 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+import metrics
+from aws_clients import get_resource
+
+class LRUCache:
+    """In-memory LRU tier with a per-entry expiry."""
+    def __init__(self, maxsize: int = 1024, ttl: int = 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
+        with self._lock:
+            self._data[key] = (value, time.time() + (ttl or self.ttl))
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteCache:
+    """Persistent tier in a local SQLite file, e.g. /tmp on a warm Lambda container or a dev machine."""
+    def __init__(self, path: str, ttl: int = 3600):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Any]:
+        try:
+            with self._lock:
+                row = self._conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None or row[1] < time.time():
+                return None
+            return json.loads(row[0])
+        except Exception as e:
+            print(f"SQLite cache get error: {e}")
+            return None
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
+        try:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), time.time() + (ttl or self.ttl))
+                )
+                self._conn.commit()
+        except Exception as e:
+            print(f"SQLite cache set error: {e}")
+
+
+class DynamoDBCache:
+    """Persistent tier shared across containers. The table uses the repo's id/createdAt key schema and an expires_at TTL attribute."""
+    def __init__(self, table_name: str, ttl: int = 3600):
+        self.ttl = ttl
+        self.table = get_resource('dynamodb').Table(table_name)
+
+    def get(self, key: str) -> Optional[Any]:
+        try:
+            item = self.table.get_item(Key={'id': key, 'createdAt': 'cache'}).get('Item')
+            # DynamoDB deletes expired items lazily, so check the expiry ourselves
+            if item is None or int(item['expires_at']) < time.time():
+                return None
+            return json.loads(item['value'])
+        except Exception as e:
+            print(f"DynamoDB cache get error: {e}")
+            return None
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
+        try:
+            self.table.put_item(Item={
+                'id': key,
+                'createdAt': 'cache',
+                'value': json.dumps(value),
+                'expires_at': int(time.time() + (ttl or self.ttl))
+            })
+        except Exception as e:
+            print(f"DynamoDB cache set error: {e}")
+
+
+class TieredCache:
+    """In-memory LRU in front of an optional persistent tier, counting hits and misses under cache.<name>.*"""
+    def __init__(self, name: str, memory: LRUCache, persistent: Optional[Any] = None):
+        self.name = name
+        self.memory = memory
+        self.persistent = persistent
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.memory.get(key)
+        if value is None and self.persistent is not None:
+            value = self.persistent.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+        metrics.incr(f"cache.{self.name}.{'miss' if value is None else 'hit'}")
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
+        self.memory.set(key, value, ttl)
+        if self.persistent is not None:
+            self.persistent.set(key, value, ttl)
+
+    def hit_rate(self) -> float:
+        return metrics.rate(f"cache.{self.name}.hit", f"cache.{self.name}.miss")
+
+
+def build_cache(name: str, maxsize: int, ttl: int, backend: str = "memory",
+                table_name: Optional[str] = None, sqlite_path: Optional[str] = None) -> TieredCache:
+    """Build a tiered cache. backend is "memory", "sqlite" or "dynamodb"."""
+    persistent = None
+    if backend == "sqlite" and sqlite_path:
+        persistent = SQLiteCache(sqlite_path, ttl)
+    elif backend == "dynamodb" and table_name:
+        persistent = DynamoDBCache(table_name, ttl)
+    elif backend != "memory":
+        print(f"Cache {name}: persistent backend {backend} not configured, using memory only")
+    return TieredCache(name, LRUCache(maxsize, ttl), persistent)
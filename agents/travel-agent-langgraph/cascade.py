@@ -0,0 +1,55 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import re
+from typing import Optional, Pattern
+
+import metrics
+
+REFUSAL_PATTERN = re.compile(
+    r"^\s*(i'?m sorry|i apologi[sz]e|i (cannot|can't|am unable to|don't have (enough )?information))",
+    re.IGNORECASE
+)
+
+class CascadePolicy:
+    """Cheap validity check run on the small model's output before accepting it.
+
+    A failed check escalates the call to the larger model. Checks, in order: empty
+    output, a refusal and a minimum length. Outputs matching `expected_reply`, a
+    short reply the prompt itself instructs (e.g. "no information is saved"), pass
+    the refusal and length checks.
+    """
+    def __init__(self, min_length: int = 1, expected_reply: Optional[Pattern] = None):
+        self.min_length = min_length
+        self.expected_reply = expected_reply
+
+    def check(self, output: str) -> Optional[str]:
+        """Return the reason the output is not acceptable, or None when it is."""
+        text = (output or "").strip()
+        if not text:
+            return "empty output"
+        if self.expected_reply is not None and self.expected_reply.search(text):
+            return None
+        if REFUSAL_PATTERN.match(text):
+            return "refusal"
+        if len(text) < self.min_length:
+            return f"shorter than {self.min_length} characters"
+        return None
+
+def record(chain_name: str, escalated: bool) -> None:
+    metrics.incr(f"cascade.{chain_name}.{'escalated' if escalated else 'accepted'}")
+
+def escalation_rate(chain_name: str) -> float:
+    return metrics.rate(f"cascade.{chain_name}.escalated", f"cascade.{chain_name}.accepted")
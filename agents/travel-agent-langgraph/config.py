@@ -14,10 +14,13 @@
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE. 
 
 import os
-import boto3
 import json
-from botocore.config import Config
+import re
 from langchain_aws import ChatBedrockConverse
+from aws_clients import get_client
+from prompt_cache import PromptCacheUsageHandler
+from cascade import CascadePolicy
+from scheduler import ModelScheduler
 
 #################### ENV VARIABLES ####################
 
@@ -38,7 +41,7 @@ GOOGLE_SEARCH_SECRET_NAME = os.environ['GOOGLE_SEARCH_SECRET_NAME']
 USE_PAAPI = os.environ.get('USE_PAAPI', 'false').lower() == 'true'
 
 def get_secret(secret_name: str):
-    client = boto3.session.Session().client('secretsmanager', region_name=region_name)
+    client = get_client('secretsmanager')
     return client.get_secret_value(SecretId=secret_name)['SecretString']
 
 # retrieve keys
@@ -68,20 +71,83 @@ else:
     paapi_secret = None
     partner_tag = None
 
-#################### AWS CLIENT CONFIG ####################
+#################### PERFORMANCE ####################
+
+# Start likely node work (KB retrieval, wishlist reads, city extraction) while the router runs
+SPECULATIVE_PREFETCH = os.environ.get('SPECULATIVE_PREFETCH', 'true').lower() == 'true'
+# Longest a node waits on its still running prefetch before doing the work itself, capped by the turn deadline
+PREFETCH_WAIT_SECONDS = float(os.environ.get('PREFETCH_WAIT_SECONDS', '5'))
+
+# Response cache for deterministic (temperature 0) chains that opt in, see cache.py
+# Backend is "memory", "sqlite" (CACHE_SQLITE_PATH) or "dynamodb" (CACHE_TABLE_NAME)
+LLM_CACHE_BACKEND = os.environ.get('LLM_CACHE_BACKEND', 'memory').lower()
+LLM_CACHE_TTL = int(os.environ.get('LLM_CACHE_TTL', '86400'))
+LLM_CACHE_MAXSIZE = int(os.environ.get('LLM_CACHE_MAXSIZE', '512'))
+CACHE_TABLE_NAME = os.environ.get('CACHE_TABLE_NAME')
+CACHE_SQLITE_PATH = os.environ.get('CACHE_SQLITE_PATH', '/tmp/travel-agent-cache.db')
+
+# Idempotent /prompt handling, see idempotency.py. Retries of a turn (same caller and Idempotency-Key header or
+# request_id, else same caller + session_id + prompt within IDEMPOTENCY_WINDOW seconds) replay the stored response.
+# Turns without a client request id and without a known caller and session are never deduplicated
+IDEMPOTENCY_BACKEND = os.environ.get('IDEMPOTENCY_BACKEND', 'memory').lower()
+IDEMPOTENCY_TABLE_NAME = os.environ.get('IDEMPOTENCY_TABLE_NAME', CACHE_TABLE_NAME)
+IDEMPOTENCY_WINDOW = int(os.environ.get('IDEMPOTENCY_WINDOW', '60'))
+IDEMPOTENCY_TTL = int(os.environ.get('IDEMPOTENCY_TTL', '3600'))
+# Lease on an in-progress turn, after which a retry may recompute it, and how long a duplicate waits for it
+IDEMPOTENCY_LEASE = int(os.environ.get('IDEMPOTENCY_LEASE', '300'))
+IDEMPOTENCY_WAIT_TIMEOUT = float(os.environ.get('IDEMPOTENCY_WAIT_TIMEOUT', '25'))
+
+# Admission control, see admission.py. Every turn is charged the router cost, then its route cost, against the
+# authenticated caller's token bucket and a global one. With the dynamodb backend, an
+# {"id": "admission-config", "createdAt": "admission"} item with a "limits" map overrides these values at runtime (refreshed every ADMISSION_REFRESH_SECONDS)
+ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', 'true').lower() == 'true'
+ADMISSION_BACKEND = os.environ.get('ADMISSION_BACKEND', 'memory').lower()
+ADMISSION_TABLE_NAME = os.environ.get('ADMISSION_TABLE_NAME', CACHE_TABLE_NAME)
+ADMISSION_REFRESH_SECONDS = float(os.environ.get('ADMISSION_REFRESH_SECONDS', '60'))
+ADMISSION_USER_CAPACITY = float(os.environ.get('ADMISSION_USER_CAPACITY', '20'))
+ADMISSION_USER_REFILL = float(os.environ.get('ADMISSION_USER_REFILL', '0.2'))  # tokens per second
+ADMISSION_GLOBAL_CAPACITY = float(os.environ.get('ADMISSION_GLOBAL_CAPACITY', '200'))
+ADMISSION_GLOBAL_REFILL = float(os.environ.get('ADMISSION_GLOBAL_REFILL', '5'))
+ADMISSION_MAX_WAIT = float(os.environ.get('ADMISSION_MAX_WAIT', '2'))
+# Roughly the number of model and API calls behind each route. "router" is charged before the router call,
+# the route's cost once it is chosen
+ADMISSION_ROUTE_COSTS = {
+    "router": 1,
+    "intro": 1, "amazon_facts": 1, "order_cart": 1, "remove_cart": 2, "add_cart": 1,
+    "weather": 2, "user_summary": 2, "conversation_summary": 2,
+    "internet_search": 3, "trip_recommendation": 3, "product_search": 3, "packing_list": 6, "grocery": 6,
+    **json.loads(os.environ.get('ADMISSION_ROUTE_COSTS', '{}')),
+}
 
-BEDROCK_CONFIG = Config(
-    region_name=region_name,
-    signature_version='v4',
-    read_timeout=500,
-    retries={
-        'max_attempts': 10,
-        'mode': 'adaptive'
-    }
-)
+# Google Custom Search results, keyed on the normalized query. Short TTL, travel queries ask about current events
+SEARCH_CACHE_BACKEND = os.environ.get('SEARCH_CACHE_BACKEND', LLM_CACHE_BACKEND).lower()
+SEARCH_CACHE_TTL = int(os.environ.get('SEARCH_CACHE_TTL', '900'))
+SEARCH_CACHE_MAXSIZE = int(os.environ.get('SEARCH_CACHE_MAXSIZE', '256'))
+# Text of fetched pages with their ETag/Last-Modified, revalidated with conditional GETs once stale.
+# Bodies can be large, so the default keeps them in memory; "sqlite" adds a local tier
+PAGE_CACHE_BACKEND = os.environ.get('PAGE_CACHE_BACKEND', 'memory').lower()
+PAGE_CACHE_TTL = int(os.environ.get('PAGE_CACHE_TTL', '86400'))
+PAGE_CACHE_MAXSIZE = int(os.environ.get('PAGE_CACHE_MAXSIZE', '64'))
+PAGE_CACHE_MAX_CHARS = int(os.environ.get('PAGE_CACHE_MAX_CHARS', '100000'))
+
+# Answer internet searches from the result snippets when they cover the question, fetching the page otherwise
+SEARCH_SNIPPET_FIRST = os.environ.get('SEARCH_SNIPPET_FIRST', 'true').lower() == 'true'
+
+# Read timeouts in seconds per external API, see resilience.py for the circuit breakers and hedging around them
+WEATHER_READ_TIMEOUT = float(os.environ.get('WEATHER_READ_TIMEOUT', '5'))
+SEARCH_READ_TIMEOUT = float(os.environ.get('SEARCH_READ_TIMEOUT', '5'))
+WEBPAGE_READ_TIMEOUT = float(os.environ.get('WEBPAGE_READ_TIMEOUT', '8'))
+
+# Node calls run at once by TravelAgent.run_batch (POST /batch), bounded by Bedrock quotas rather than CPU
+BATCH_MAX_CONCURRENCY = int(os.environ.get('BATCH_MAX_CONCURRENCY', '8'))
+# Most lines POST /batch accepts; the batch has to finish within API Gateway's 29 s, larger sets go through run_batch
+BATCH_MAX_SIZE = int(os.environ.get('BATCH_MAX_SIZE', '20'))
+
+#################### AWS CLIENTS ####################
 
-BEDROCK_RT = boto3.client("bedrock-runtime", config=BEDROCK_CONFIG)
-AGENT_RT = boto3.client('bedrock-agent-runtime', config = BEDROCK_CONFIG)
+# Shared clients with per-service timeouts and pool sizes, see aws_clients.py
+BEDROCK_RT = get_client("bedrock-runtime")
+AGENT_RT = get_client("bedrock-agent-runtime")
 
 #################### LLM CONFIG ####################
 
@@ -95,13 +161,76 @@ model_kwargs =  {
     "stop_sequences": ["Human"],
 }
 
+# Reports Bedrock prompt cache read/write tokens for every call
+prompt_cache_usage = PromptCacheUsageHandler()
+
 nova_pro_llm_converse = ChatBedrockConverse(
     client=BEDROCK_RT,
     model=NOVA_PRO_MODEL_ID,
+    callbacks=[prompt_cache_usage],
     **model_kwargs,
 )
 nova_lite_llm_converse = ChatBedrockConverse(
     client=BEDROCK_RT,
     model=NOVA_LITE_MODEL_ID,
+    callbacks=[prompt_cache_usage],
     **model_kwargs,
 )
+
+#################### MODEL SCHEDULER ####################
+
+# Throttled calls fail over to the same model through the cross-region inference profile of this
+# geography instead of botocore retrying one saturated model.
+MODEL_FAILOVER = os.environ.get('MODEL_FAILOVER', 'true').lower() == 'true'
+# Then to the other Nova model. Off by default: Lite to Pro raises the cost of the call, and Pro to Lite
+# silently downgrades the answer, including the cascade's escalation target
+MODEL_CROSS_FAILOVER = os.environ.get('MODEL_CROSS_FAILOVER', 'false').lower() == 'true'
+INFERENCE_PROFILE_PREFIX = os.environ.get(
+    'INFERENCE_PROFILE_PREFIX',
+    {'us': 'us', 'ca': 'us', 'eu': 'eu', 'ap': 'apac'}.get(region_name.split('-')[0], '')
+)
+# Per-turn budget shared by every model call in the turn: throttle retries and seconds spent waiting for cooldowns
+MODEL_RETRY_BUDGET = int(os.environ.get('MODEL_RETRY_BUDGET', '4'))
+MODEL_MAX_THROTTLE_WAIT = float(os.environ.get('MODEL_MAX_THROTTLE_WAIT', '5'))
+
+model_scheduler = ModelScheduler(retries=MODEL_RETRY_BUDGET, max_wait=MODEL_MAX_THROTTLE_WAIT)
+
+def _profile_llm(model_id: str) -> ChatBedrockConverse:
+    return ChatBedrockConverse(
+        client=BEDROCK_RT,
+        model=f"{INFERENCE_PROFILE_PREFIX}.{model_id}",
+        callbacks=[prompt_cache_usage],
+        **model_kwargs,
+    )
+
+# (model id, llm) candidates per primary model, primary first
+MODEL_CANDIDATES = {
+    NOVA_LITE_MODEL_ID: [(NOVA_LITE_MODEL_ID, nova_lite_llm_converse)],
+    NOVA_PRO_MODEL_ID: [(NOVA_PRO_MODEL_ID, nova_pro_llm_converse)],
+}
+if MODEL_FAILOVER and INFERENCE_PROFILE_PREFIX:
+    for model_id, candidates in MODEL_CANDIDATES.items():
+        candidates.append((f"{INFERENCE_PROFILE_PREFIX}.{model_id}", _profile_llm(model_id)))
+if MODEL_CROSS_FAILOVER:
+    MODEL_CANDIDATES[NOVA_LITE_MODEL_ID].append((NOVA_PRO_MODEL_ID, nova_pro_llm_converse))
+    MODEL_CANDIDATES[NOVA_PRO_MODEL_ID].append((NOVA_LITE_MODEL_ID, nova_lite_llm_converse))
+
+#################### MODEL CASCADE ####################
+
+# Routes that try Nova Lite first and escalate to Nova Pro only when the output fails its policy.
+# Routes left out of MODEL_CASCADE_ROUTES call Nova Pro directly.
+MODEL_CASCADE_ROUTES = [
+    route.strip() for route in os.environ.get(
+        'MODEL_CASCADE_ROUTES',
+        'internet_search,amazon_facts,trip_recommendation,conversation_summary,user_summary'
+    ).split(',') if route.strip()
+]
+
+CASCADE_POLICIES = {
+    "internet_search": CascadePolicy(min_length=80),
+    "amazon_facts": CascadePolicy(min_length=40),
+    "trip_recommendation": CascadePolicy(min_length=200),
+    "conversation_summary": CascadePolicy(min_length=80),
+    # The prompt tells the model to say no information is saved when the profile lacks the answer
+    "user_summary": CascadePolicy(min_length=40, expected_reply=re.compile(r"\bno information (is )?saved\b", re.IGNORECASE)),
+}
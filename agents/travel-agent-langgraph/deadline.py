@@ -0,0 +1,93 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import contextvars
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+import metrics
+
+#################### DEADLINE CONFIG ####################
+
+# API Gateway cuts REST integrations off at 29 s, whatever the Lambda timeout
+REQUEST_TIMEOUT_SECONDS = float(os.environ.get('REQUEST_TIMEOUT_SECONDS', '29'))
+# Kept back for the response, chat history write and network on the way out
+DEADLINE_SAFETY_MARGIN = float(os.environ.get('DEADLINE_SAFETY_MARGIN', '1.5'))
+# Kept back for the node's final answer chain when deciding whether optional work still fits
+DEADLINE_ANSWER_RESERVE = float(os.environ.get('DEADLINE_ANSWER_RESERVE', '6'))
+MIN_CALL_TIMEOUT = 0.5
+
+_current: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("deadline", default=None)
+# Set when the turn's caller stopped waiting for it. Copied contexts share the event, so graph threads see it
+_cancelled: contextvars.ContextVar[Optional[threading.Event]] = contextvars.ContextVar("deadline_cancelled", default=None)
+
+class TurnCancelled(Exception):
+    """The turn was abandoned at its deadline; raised before further work or side effects."""
+
+def from_context(context: Any) -> float:
+    """Absolute deadline (epoch seconds) for a Lambda invocation, the earlier of the Lambda and API Gateway limits."""
+    budget = REQUEST_TIMEOUT_SECONDS
+    if context is not None and hasattr(context, "get_remaining_time_in_millis"):
+        budget = min(budget, context.get_remaining_time_in_millis() / 1000)
+    return time.time() + budget - DEADLINE_SAFETY_MARGIN
+
+@contextmanager
+def scope(deadline: Optional[float]):
+    """Expose the turn's deadline to code that does not see AgentState, e.g. cascade escalation."""
+    token = _current.set(deadline)
+    cancel_token = _cancelled.set(threading.Event())
+    try:
+        yield
+    finally:
+        _cancelled.reset(cancel_token)
+        _current.reset(token)
+
+def cancel() -> None:
+    """Mark the current turn abandoned, so work still running for it stops before its next step."""
+    event = _cancelled.get()
+    if event is not None:
+        event.set()
+
+def check_cancelled(step: str) -> None:
+    """Raise TurnCancelled when the current turn was abandoned. Call before side effects such as cart writes."""
+    event = _cancelled.get()
+    if event is not None and event.is_set():
+        metrics.incr("deadline.cancelled")
+        print(f"Turn abandoned at its deadline, skipping {step}")
+        raise TurnCancelled(step)
+
+def remaining(state: Optional[Dict] = None) -> float:
+    """Seconds left before the deadline of `state`, or of the current turn; infinite without one."""
+    deadline = state.get("deadline") if state is not None else _current.get()
+    return math.inf if deadline is None else deadline - time.time()
+
+def can_afford(state: Optional[Dict], seconds: float, step: str) -> bool:
+    """Whether `seconds` of optional work still fit before the answer reserve. Skipped steps are counted under deadline.<step>.skipped."""
+    if remaining(state) - DEADLINE_ANSWER_RESERVE >= seconds:
+        return True
+    metrics.incr(f"deadline.{step}.skipped")
+    print(f"Skipping {step}, {remaining(state):.1f}s left in the turn")
+    return False
+
+def cap_timeout(state: Optional[Dict], timeout: Optional[float]) -> Optional[float]:
+    """Shorten a call timeout so the call ends before the answer reserve."""
+    left = remaining(state) - DEADLINE_ANSWER_RESERVE
+    if math.isinf(left):
+        return timeout
+    return max(MIN_CALL_TIMEOUT, min(timeout, left) if timeout else left)
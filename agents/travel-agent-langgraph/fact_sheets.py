@@ -0,0 +1,127 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import json
+import os
+import re
+import threading
+from typing import Dict, List, Optional
+
+# Per-destination fact sheets distilled offline from the knowledge base documents by
+# scripts/deployment/build_fact_sheets.py. index.json maps lowercased city names and
+# aliases to the sheet files.
+FACT_SHEETS_DIR = os.environ.get('FACT_SHEETS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fact_sheets'))
+USE_FACT_SHEETS = os.environ.get('USE_FACT_SHEETS', 'true').lower() == 'true'
+MAX_SHEETS_PER_QUESTION = 3
+INDEX_VERSION = 2
+# Knowledge base document bucket, sheet sources are S3 keys in it
+KB_BUCKET_NAME = os.environ.get('KB_BUCKET_NAME', '')
+
+# Questions a sheet answers on its own, about what it summarizes. Anything else also gets KB passages
+SHEET_TOPICS = re.compile(
+    r"\b(things to do|what (should|can|to) (i |we )?(do|see|visit)|sights?|sightseeing|attractions?|"
+    r"neighbou?rhoods?|where (should|to) (i |we )?stay|food|eat|dish(es)?|cuisine|climate|weather|"
+    r"best time|when (should|to) (i |we )?(go|visit)|getting around|transport\w*|itinerary)\b",
+    re.IGNORECASE
+)
+
+SECTIONS = [
+    ("neighborhoods", "Neighborhoods"),
+    ("top_sights", "Top sights"),
+    ("food", "Food"),
+    ("climate", "Climate"),
+    ("transport", "Getting around"),
+    ("tips", "Tips"),
+]
+
+class FactSheetIndex:
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.cities: Dict[str, str] = {}
+        self._sheets: Dict[str, Dict] = {}
+        self._pattern = None
+        try:
+            with open(os.path.join(directory, "index.json"), encoding="utf-8") as f:
+                index = json.load(f)
+            if index.get("version") == INDEX_VERSION:
+                self.cities = index.get("cities", {})
+            else:
+                print(f"Fact sheets unavailable: index version {index.get('version')}, rebuild with build_fact_sheets.py")
+        except (FileNotFoundError, json.JSONDecodeError) as e:
+            print(f"Fact sheets unavailable: {e}")
+        if self.cities:
+            # Longest names first so "new york city" wins over "york"
+            names = sorted(self.cities, key=len, reverse=True)
+            self._pattern = re.compile(r"\b(" + "|".join(re.escape(name) for name in names) + r")\b", re.IGNORECASE)
+
+    def find(self, text: str) -> List[Dict]:
+        """Fact sheets for the destinations named in text, in order of mention."""
+        if self._pattern is None:
+            return []
+        files = []
+        for match in self._pattern.finditer(text):
+            for file in self.cities[match.group(1).lower()]:
+                if file not in files:
+                    files.append(file)
+        return [sheet for sheet in map(self._load, files[:MAX_SHEETS_PER_QUESTION]) if sheet]
+
+    def _load(self, file: str) -> Optional[Dict]:
+        if file not in self._sheets:
+            try:
+                with open(os.path.join(self.directory, file), encoding="utf-8") as f:
+                    self._sheets[file] = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError) as e:
+                print(f"Error loading fact sheet {file}: {e}")
+                self._sheets[file] = None
+        return self._sheets[file]
+
+
+def covers(text: str) -> bool:
+    """Whether the fact sheets alone answer the question, without knowledge base passages."""
+    return bool(SHEET_TOPICS.search(text))
+
+def source_uri(sheet: Dict) -> str:
+    """S3 URI of the sheet's source document, the same kind of link a retrieval result carries."""
+    if not (KB_BUCKET_NAME and sheet.get("source")):
+        return ""
+    return f"s3://{KB_BUCKET_NAME}/{sheet['source']}"
+
+def render(sheet: Dict) -> str:
+    """Compact plain-text rendering used as prompt context."""
+    lines = [", ".join(part for part in (sheet.get("city"), sheet.get("country")) if part)]
+    if sheet.get("summary"):
+        lines.append(sheet["summary"])
+    for key, label in SECTIONS:
+        value = sheet.get(key)
+        if not value:
+            continue
+        if isinstance(value, list):
+            items = [f"{item['name']} - {item['description']}" if isinstance(item, dict) else str(item) for item in value]
+            lines.append(f"{label}: " + "; ".join(items))
+        else:
+            lines.append(f"{label}: {value}")
+    return "\n".join(lines)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_index() -> FactSheetIndex:
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = FactSheetIndex(FACT_SHEETS_DIR)
+    return _index
@@ -14,15 +14,83 @@
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE. 
 
 from agent import TravelAgent
+from config import (
+    IDEMPOTENCY_BACKEND, IDEMPOTENCY_TABLE_NAME, IDEMPOTENCY_WINDOW, IDEMPOTENCY_TTL,
+    IDEMPOTENCY_LEASE, IDEMPOTENCY_WAIT_TIMEOUT, BATCH_MAX_SIZE
+)
+from idempotency import RequestInProgress, build_store, idempotency_key, run_once
+from admission import AdmissionRejected
+import deadline
 import json
+import time
 
-def handler(event, _context):
+idempotency_store = build_store(IDEMPOTENCY_BACKEND, IDEMPOTENCY_TTL, IDEMPOTENCY_LEASE, IDEMPOTENCY_TABLE_NAME)
+
+def caller_identity(event):
+    """Cognito subject of the caller as verified by the API Gateway authorizer, None when unauthenticated."""
+    claims = ((event.get("requestContext") or {}).get("authorizer") or {}).get("claims") or {}
+    return claims.get("sub") or claims.get("cognito:username")
+
+
+def handler(event, context):
     if event["httpMethod"] == "POST" and event["path"] == "/prompt":
         body = json.loads(event["body"])
-        result = TravelAgent().run(body["prompt"], body.get("user_id", "default_user"))
+        identity = caller_identity(event)
+        key = idempotency_key(event.get("headers"), body, IDEMPOTENCY_WINDOW, identity)
+        # The turn has to answer before API Gateway or Lambda gives up on it
+        deadline_at = deadline.from_context(context)
+        try:
+            # Retried turns replay the stored response instead of re-running the graph and re-appending history
+            result = run_once(
+                idempotency_store, key,
+                lambda: TravelAgent().run(body["prompt"], body.get("user_id", "default_user"), deadline_at, identity),
+                min(IDEMPOTENCY_WAIT_TIMEOUT, max(0.0, deadline_at - time.time())),
+                # A retry of a turn that ran out of time must run again, not replay the apology
+                storable=lambda response: not TravelAgent.is_deadline_answer(response)
+            )
+        except AdmissionRejected as e:
+            return {
+                "statusCode": 429,
+                "headers": {"Retry-After": str(max(1, round(e.retry_after)))},
+                "body": json.dumps({"error": str(e)}),
+            }
+        except RequestInProgress:
+            return {
+                "statusCode": 409,
+                "headers": {"Retry-After": "5"},
+                "body": json.dumps({"error": "This request is still being processed, retry shortly"}),
+            }
         
         return {
             "statusCode": 200,
             "body": json.dumps(result),
         }
+    if event["httpMethod"] == "POST" and event["path"] == "/batch":
+        # JSONL in, JSONL out: one {"user_id", "prompt"} object per line
+        try:
+            requests = [json.loads(line) for line in event["body"].splitlines() if line.strip()]
+        except json.JSONDecodeError as e:
+            return {"statusCode": 400, "body": json.dumps({"error": f"Invalid JSONL: {e}"})}
+        if not all(isinstance(request, dict) and "prompt" in request for request in requests):
+            return {"statusCode": 400, "body": json.dumps({"error": "Every line must be an object with a prompt"})}
+        if len(requests) > BATCH_MAX_SIZE:
+            return {"statusCode": 413, "body": json.dumps({"error": f"At most {BATCH_MAX_SIZE} lines per batch"})}
+
+        # Items are charged to the caller's admission bucket like /prompt turns, and unfinished ones are
+        # reported rather than lost when the request deadline passes
+        results = list(TravelAgent().run_batch(
+            requests, principal=caller_identity(event), deadline_at=deadline.from_context(context)
+        ))
+        if results and all(result.get("status") == 429 for result in results):
+            return {
+                "statusCode": 429,
+                "headers": {"Retry-After": str(max(1, round(min(result["retry_after"] for result in results))))},
+                "body": json.dumps({"error": results[0]["error"]}),
+            }
+
+        return {
+            "statusCode": 200,
+            "headers": {"Content-Type": "application/x-ndjson"},
+            "body": "".join(json.dumps(result) + "\n" for result in results),
+        }
     return {"statusCode": 404}
\ No newline at end of file
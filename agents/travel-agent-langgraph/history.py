@@ -0,0 +1,103 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+import hashlib
+import os
+import re
+from typing import Dict, List, Union
+
+import metrics
+from cache import LRUCache
+
+#################### CHAT HISTORY CONFIG ####################
+
+# Render previous_chat as a compact transcript; false passes the raw history entries as before
+CHAT_HISTORY_COMPACT = os.environ.get('CHAT_HISTORY_COMPACT', 'true').lower() == 'true'
+# History entries (a user or a bot message each) given to the prompts
+CHAT_HISTORY_ENTRIES = int(os.environ.get('CHAT_HISTORY_ENTRIES', '20'))
+# The most recent bot turns are kept whole, older ones are cut to CHAT_HISTORY_BOT_CHARS
+CHAT_HISTORY_FULL_BOT_TURNS = int(os.environ.get('CHAT_HISTORY_FULL_BOT_TURNS', '2'))
+CHAT_HISTORY_BOT_CHARS = int(os.environ.get('CHAT_HISTORY_BOT_CHARS', '300'))
+CHAT_HISTORY_CACHE_SIZE = int(os.environ.get('CHAT_HISTORY_CACHE_SIZE', '256'))
+
+ROLES = {"user": "User", "bot": "Assistant"}
+TAG = re.compile(r"</?[A-Za-z][\w -]*/?>")
+SPACES = re.compile(r"[ \t]+")
+# Product lines of a search answer survive truncation, add_cart resolves "add the daypack" from them
+PRODUCT_LINE = re.compile(r"^\s*(\d+\.\s*)?(Product|Link|Price):|amazon\.com/dp/", re.IGNORECASE)
+
+# Rendered transcripts by history version; several chains of a turn render the same history
+_rendered = LRUCache(maxsize=CHAT_HISTORY_CACHE_SIZE, ttl=3600)
+
+def clean(text: str) -> str:
+    """The message text without the <answer> preamble, XML-style tags and extra whitespace."""
+    text = str(text)
+    if "<answer>" in text:
+        text = text.split("<answer>")[-1]
+    lines = (SPACES.sub(" ", line).strip() for line in TAG.sub("", text).splitlines())
+    return "\n".join(line for line in lines if line)
+
+def truncate(text: str, limit: int) -> str:
+    """First `limit` characters (at a word boundary), plus any product lines past them."""
+    if len(text) <= limit:
+        return text
+    head = text[:limit].rsplit(" ", 1)[0]
+    products = [line.strip() for line in text[len(head):].splitlines() if PRODUCT_LINE.search(line)]
+    return "\n".join([head + " …"] + products)
+
+def version(entries: List[Dict]) -> str:
+    """Digest of the entries' roles and texts. Stored history only grows, so every new turn is a new version."""
+    digest = hashlib.blake2b(digest_size=16)
+    for entry in entries:
+        for role in ROLES:
+            if role in entry:
+                digest.update(f"{role}\x1f{entry[role]}\x1e".encode("utf-8"))
+    return digest.hexdigest()
+
+def _render(entries: List[Dict]) -> str:
+    bot_turns = sum(1 for entry in entries if "bot" in entry)
+    lines = []
+    for entry in entries:
+        for role, label in ROLES.items():
+            if role not in entry:
+                continue
+            text = clean(entry[role])
+            if role == "bot":
+                bot_turns -= 1
+                if bot_turns >= CHAT_HISTORY_FULL_BOT_TURNS:
+                    text = truncate(text, CHAT_HISTORY_BOT_CHARS)
+            if text:
+                lines.append(f"{label}: {text}")
+    return "\n".join(lines)
+
+def render(history: List[Dict], entries: int = CHAT_HISTORY_ENTRIES) -> Union[str, List[Dict]]:
+    """previous_chat for the prompts: the last `entries` history entries as a role-prefixed transcript.
+
+    Timestamps and markup are dropped and bot turns older than the last
+    CHAT_HISTORY_FULL_BOT_TURNS are truncated. With CHAT_HISTORY_COMPACT=false the raw entries are returned.
+    """
+    window = (history or [])[-entries:]
+    if not CHAT_HISTORY_COMPACT:
+        return window
+    key = version(window)
+    transcript = _rendered.get(key)
+    if transcript is None:
+        metrics.incr("history.render.miss")
+        transcript = _render(window)
+        _rendered.set(key, transcript)
+    else:
+        metrics.incr("history.render.hit")
+    return transcript
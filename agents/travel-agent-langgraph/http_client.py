@@ -0,0 +1,126 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import os
+import random
+import asyncio
+import threading
+import weakref
+from typing import Optional
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Optional brotli support, both requests and httpx decode "br" once it is installed
+try:
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    ACCEPT_ENCODING = "gzip, deflate"
+
+#################### HTTP CLIENT CONFIG ####################
+
+HTTP_POOL_CONNECTIONS = int(os.environ.get('HTTP_POOL_CONNECTIONS', '10'))  # hosts kept in the pool
+HTTP_POOL_MAXSIZE = int(os.environ.get('HTTP_POOL_MAXSIZE', '10'))  # connections per host
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get('HTTP_KEEPALIVE_EXPIRY', '60'))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', '3'))
+HTTP_READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', '10'))
+HTTP_MAX_RETRIES = int(os.environ.get('HTTP_MAX_RETRIES', '2'))
+HTTP_BACKOFF_FACTOR = float(os.environ.get('HTTP_BACKOFF_FACTOR', '0.3'))
+HTTP_BACKOFF_JITTER = float(os.environ.get('HTTP_BACKOFF_JITTER', '0.3'))
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+DEFAULT_HEADERS = {
+    "Accept-Encoding": ACCEPT_ENCODING,
+    "Connection": "keep-alive",
+}
+
+#################### SYNC CLIENT ####################
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session() -> requests.Session:
+    """Return the process-wide requests session, creating it on first use."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                retry = Retry(
+                    total=HTTP_MAX_RETRIES,
+                    backoff_factor=HTTP_BACKOFF_FACTOR,
+                    backoff_jitter=HTTP_BACKOFF_JITTER,
+                    status_forcelist=RETRY_STATUSES,
+                    allowed_methods=frozenset(["GET", "HEAD"]),
+                    raise_on_status=False,
+                )
+                adapter = HTTPAdapter(
+                    pool_connections=HTTP_POOL_CONNECTIONS,
+                    pool_maxsize=HTTP_POOL_MAXSIZE,
+                    max_retries=retry,
+                )
+                session = requests.Session()
+                session.headers.update(DEFAULT_HEADERS)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+def get(url: str, read_timeout: Optional[float] = None, **kwargs) -> requests.Response:
+    kwargs.setdefault("timeout", (HTTP_CONNECT_TIMEOUT, read_timeout or HTTP_READ_TIMEOUT))
+    return get_session().get(url, **kwargs)
+
+#################### ASYNC CLIENT ####################
+
+# httpx pools are bound to the event loop that created them, so keep one client per loop
+_async_clients = weakref.WeakKeyDictionary()
+
+def get_async_client() -> httpx.AsyncClient:
+    """Return the pooled httpx client for the running event loop, creating it on first use."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            headers=DEFAULT_HEADERS,
+            timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=HTTP_POOL_CONNECTIONS * HTTP_POOL_MAXSIZE,
+                max_keepalive_connections=HTTP_POOL_MAXSIZE,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+            follow_redirects=True,
+        )
+        _async_clients[loop] = client
+    return client
+
+def _backoff(attempt: int) -> float:
+    return HTTP_BACKOFF_FACTOR * (2 ** attempt) + random.uniform(0, HTTP_BACKOFF_JITTER)
+
+async def aget(url: str, read_timeout: Optional[float] = None, **kwargs) -> httpx.Response:
+    """GET with the same retry policy as the sync session: retry transport errors and RETRY_STATUSES with jittered backoff."""
+    client = get_async_client()
+    if read_timeout:
+        kwargs.setdefault("timeout", httpx.Timeout(read_timeout, connect=HTTP_CONNECT_TIMEOUT))
+    for attempt in range(HTTP_MAX_RETRIES + 1):
+        try:
+            response = await client.get(url, **kwargs)
+            if response.status_code not in RETRY_STATUSES or attempt == HTTP_MAX_RETRIES:
+                return response
+        except httpx.TransportError:
+            if attempt == HTTP_MAX_RETRIES:
+                raise
+        await asyncio.sleep(_backoff(attempt))
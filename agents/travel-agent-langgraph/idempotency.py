@@ -0,0 +1,203 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+import metrics
+from aws_clients import get_resource
+
+IN_PROGRESS = "in_progress"
+COMPLETED = "completed"
+
+class RequestInProgress(Exception):
+    """A duplicate request is still being computed elsewhere and did not finish within the wait timeout."""
+
+
+def idempotency_key(headers: Optional[Dict], body: Dict, window: int, identity: Optional[str]) -> Optional[str]:
+    """Key for a /prompt turn, scoped to the authenticated caller, or None when the turn must not be deduplicated.
+
+    The client's per-message id (Idempotency-Key header or request_id) is preferred. The user + session + prompt
+    fingerprint is only used when both the caller identity and a session_id are known, since without them
+    different users, or a user deliberately repeating a prompt, would share a key.
+    """
+    headers = {name.lower(): value for name, value in (headers or {}).items()}
+    request_id = headers.get("idempotency-key") or body.get("request_id")
+    if request_id:
+        return f"request:{identity or 'anonymous'}:{request_id}"
+    if not identity or not body.get("session_id"):
+        return None
+    fingerprint = json.dumps([
+        identity,
+        body["session_id"],
+        body.get("prompt", ""),
+        int(time.time() // window),
+    ])
+    return f"fingerprint:{hashlib.sha256(fingerprint.encode('utf-8')).hexdigest()}"
+
+
+def is_live(record: Optional[Dict], now: float) -> bool:
+    """Whether a record still counts: not expired, and either completed or within its compute lease."""
+    return bool(record) and record["expires_at"] > now and (
+        record["status"] == COMPLETED or record.get("lease_expires_at", 0) > now
+    )
+
+
+class MemoryIdempotencyStore:
+    """Process-local store, enough for retries landing on the same warm container or server process."""
+    def __init__(self, ttl: int, lease: int):
+        self.ttl = ttl
+        self.lease = lease
+        # Every write moves its key to the end with expires_at = now + ttl, so the oldest expiry is always first
+        self._records: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def claim(self, key: str) -> Optional[Dict]:
+        """Claim key for computing and return None, or return the existing record."""
+        now = time.time()
+        with self._lock:
+            record = self._records.get(key)
+            if is_live(record, now):
+                return record
+            self._put(key, {"status": IN_PROGRESS, "lease_expires_at": now + self.lease, "expires_at": now + self.ttl}, now)
+            return None
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            record = self._records.get(key)
+            return record if is_live(record, time.time()) else None
+
+    def complete(self, key: str, response: Any) -> None:
+        now = time.time()
+        with self._lock:
+            self._put(key, {"status": COMPLETED, "response": response, "expires_at": now + self.ttl}, now)
+
+    def _put(self, key: str, record: Dict, now: float) -> None:
+        self._records[key] = record
+        self._records.move_to_end(key)
+        while self._records:
+            oldest = next(iter(self._records.values()))
+            if oldest["expires_at"] > now:
+                break
+            self._records.popitem(last=False)
+
+    def release(self, key: str) -> None:
+        with self._lock:
+            self._records.pop(key, None)
+
+
+class DynamoDBIdempotencyStore:
+    """Store shared by every container. Uses the repo's id/createdAt key schema and the expires_at TTL attribute."""
+    SORT_KEY = "idempotency"
+
+    def __init__(self, table_name: str, ttl: int, lease: int):
+        self.ttl = ttl
+        self.lease = lease
+        self.table = get_resource('dynamodb').Table(table_name)
+
+    def claim(self, key: str) -> Optional[Dict]:
+        now = int(time.time())
+        try:
+            # Claim when no live record exists, or the previous attempt's lease ran out without completing
+            self.table.put_item(
+                Item={'id': key, 'createdAt': self.SORT_KEY, 'status': IN_PROGRESS,
+                      'lease_expires_at': now + self.lease, 'expires_at': now + self.ttl},
+                ConditionExpression='attribute_not_exists(id) OR expires_at < :now OR (#s = :in_progress AND lease_expires_at < :now)',
+                ExpressionAttributeNames={'#s': 'status'},
+                ExpressionAttributeValues={':now': now, ':in_progress': IN_PROGRESS},
+            )
+            return None
+        except self.table.meta.client.exceptions.ConditionalCheckFailedException:
+            return self.get(key) or {"status": IN_PROGRESS}
+
+    def get(self, key: str) -> Optional[Dict]:
+        item = self.table.get_item(Key={'id': key, 'createdAt': self.SORT_KEY}, ConsistentRead=True).get('Item')
+        if item is None:
+            return None
+        record = {"status": item['status'], "expires_at": int(item['expires_at'])}
+        if 'lease_expires_at' in item:
+            record["lease_expires_at"] = int(item['lease_expires_at'])
+        if 'response' in item:
+            record["response"] = json.loads(item['response'])
+        # TTL deletion can lag by up to two days, expired items are still returned until then
+        return record if is_live(record, time.time()) else None
+
+    def complete(self, key: str, response: Any) -> None:
+        self.table.put_item(Item={
+            'id': key, 'createdAt': self.SORT_KEY, 'status': COMPLETED,
+            # JSON keeps floats and nested lists out of DynamoDB's type system
+            'response': json.dumps(response), 'expires_at': int(time.time()) + self.ttl,
+        })
+
+    def release(self, key: str) -> None:
+        self.table.delete_item(Key={'id': key, 'createdAt': self.SORT_KEY})
+
+
+def build_store(backend: str, ttl: int, lease: int, table_name: Optional[str] = None) -> Any:
+    """Build an idempotency store. backend is "memory" or "dynamodb"."""
+    if backend == "dynamodb" and table_name:
+        return DynamoDBIdempotencyStore(table_name, ttl, lease)
+    if backend != "memory":
+        print(f"Idempotency backend {backend} not configured, using memory")
+    return MemoryIdempotencyStore(ttl, lease)
+
+
+def run_once(store: Any, key: Optional[str], compute: Callable[[], Any], wait_timeout: float, poll_interval: float = 0.5,
+             storable: Callable[[Any], bool] = lambda response: True) -> Any:
+    """Return compute() for the first request with this key; duplicates get the stored or in-progress result.
+
+    Responses failing `storable`, e.g. a best-effort answer asking the user to retry, are returned but not stored.
+    """
+    if key is None:
+        metrics.incr("idempotency.skipped")
+        return compute()
+    deadline = time.time() + wait_timeout
+    while True:
+        record = store.claim(key)
+        if record is None:
+            return _compute(store, key, compute, storable)
+
+        while record and record["status"] != COMPLETED and time.time() < deadline:
+            time.sleep(poll_interval)
+            record = store.get(key)
+        if record and record["status"] == COMPLETED:
+            metrics.incr("idempotency.replayed")
+            print(f"Replaying stored response for {key[:24]}...")
+            return record["response"]
+        if record:
+            metrics.incr("idempotency.in_progress")
+            raise RequestInProgress(key)
+        # The leader failed or gave up its lease without storing a response: nobody is computing it any more
+        metrics.incr("idempotency.reclaimed")
+
+
+def _compute(store: Any, key: str, compute: Callable[[], Any], storable: Callable[[Any], bool]) -> Any:
+    metrics.incr("idempotency.computed")
+    try:
+        response = compute()
+    except Exception:
+        # Let a retry recompute instead of waiting on a lease that will never complete
+        store.release(key)
+        raise
+    if storable(response):
+        store.complete(key, response)
+    else:
+        metrics.incr("idempotency.not_stored")
+        store.release(key)
+    return response
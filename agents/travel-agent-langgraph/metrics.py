@@ -0,0 +1,43 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import threading
+from collections import defaultdict
+from typing import Dict
+
+# Process-wide counters, they live as long as the Lambda container or server process
+_counters: Dict[str, float] = defaultdict(float)
+_lock = threading.Lock()
+
+def incr(name: str, value: float = 1) -> None:
+    with _lock:
+        _counters[name] += value
+
+def get(name: str) -> float:
+    return _counters.get(name, 0)
+
+def rate(name: str, *others: str) -> float:
+    """Share of `name` among `name` and `others`, e.g. rate("cache.hit", "cache.miss")."""
+    total = get(name) + sum(get(other) for other in others)
+    return get(name) / total if total else 0.0
+
+def snapshot(prefix: str = "") -> Dict[str, float]:
+    with _lock:
+        return {name: value for name, value in _counters.items() if name.startswith(prefix)}
+
+def gauge(name: str, value: float) -> None:
+    """Set a point-in-time value, e.g. whether a circuit breaker is open."""
+    with _lock:
+        _counters[name] = value
@@ -14,16 +14,35 @@
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE. 
 
 from abc import ABC, abstractmethod
+import asyncio
 import csv
+import hashlib
+import inspect
+from concurrent.futures import TimeoutError as FutureTimeout
 from datetime import datetime
-from typing import Any, Dict, Optional, List
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, Optional, List
 import time
 import re
+from urllib.parse import urlparse
 from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import RunnableLambda
 from bs4 import BeautifulSoup
-from googleapiclient.discovery import build
-import requests
 from rapidfuzz import process, fuzz
+import http_client
+import metrics
+from cache import build_cache
+from singleflight import SingleFlight
+import resilience
+import scheduler
+import deadline
+import history
+import fact_sheets
+from prompt_cache import supports_prompt_cache, system_cache_point
+import cascade
+from cascade import CascadePolicy
+from pydantic import BaseModel, ValidationError
+from schemas import CityExtraction, ConfirmedLocation, PackingList, Cart
 
 # Optional PAAPI imports
 try:
@@ -40,16 +59,254 @@ from prompts import *
 from config import *
 
 import json
-import ast
+
+GOOGLE_CSE_URL = "https://customsearch.googleapis.com/customsearch/v1"
+OPENWEATHER_FORECAST_URL = "https://api.openweathermap.org/data/2.5/forecast"
+
+llm_cache = build_cache(
+    "llm", maxsize=LLM_CACHE_MAXSIZE, ttl=LLM_CACHE_TTL, backend=LLM_CACHE_BACKEND,
+    table_name=CACHE_TABLE_NAME, sqlite_path=CACHE_SQLITE_PATH
+)
+
+search_cache = build_cache(
+    "search", maxsize=SEARCH_CACHE_MAXSIZE, ttl=SEARCH_CACHE_TTL, backend=SEARCH_CACHE_BACKEND,
+    table_name=CACHE_TABLE_NAME, sqlite_path=CACHE_SQLITE_PATH
+)
+page_cache = build_cache(
+    "page", maxsize=PAGE_CACHE_MAXSIZE, ttl=PAGE_CACHE_TTL, backend=PAGE_CACHE_BACKEND,
+    table_name=CACHE_TABLE_NAME, sqlite_path=CACHE_SQLITE_PATH
+)
+
+# Concurrent identical external calls share one in-flight request (e.g. a group asking about the same city)
+weather_flight = SingleFlight("weather")
+kb_flight = SingleFlight("kb")
+paapi_flight = SingleFlight("paapi")
+
+# Circuit breakers skip a known-down API at once; idempotent reads are hedged past their p95 latency.
+# PAAPI is never hedged, its 1 request per second quota would throttle the duplicate.
+openweather_api = resilience.dependency("openweather", hedge=True, read_timeout=WEATHER_READ_TIMEOUT)
+google_cse_api = resilience.dependency("google_cse", hedge=True, read_timeout=SEARCH_READ_TIMEOUT)
+paapi_api = resilience.dependency("paapi")
+
+def webpage_dependency(url: str) -> resilience.Dependency:
+    """One breaker per web host, so a single slow site does not stop search answers from the others."""
+    host = urlparse(url).hostname or "unknown"
+    return resilience.dependency(f"web.{host}", hedge=True, read_timeout=WEBPAGE_READ_TIMEOUT)
+
+# Seconds of optional work that must still fit before the turn's answer reserve, see deadline.py
+DEADLINE_WEBPAGE_SECONDS = 2
+DEADLINE_DISAMBIGUATION_SECONDS = 3
+DEADLINE_FULL_RETRIEVAL_SECONDS = 3
+DEADLINE_PAAPI_SEARCH_SECONDS = 1.5
+KB_RESULTS = 3
+KB_RESULTS_NEAR_DEADLINE = 1
+
+# Snippet sufficiency check for InternetSearchNode: share of the question's terms the snippets must mention,
+# and questions that need a full page whatever the snippets say
+SNIPPET_MIN_COVERAGE = 0.6
+SNIPPET_RESULTS = 3
+SNIPPET_STOPWORDS = {
+    "the", "and", "are", "for", "what", "when", "where", "which", "who", "how", "does", "can", "will",
+    "there", "this", "that", "with", "from", "about", "any", "some", "you", "your", "have", "has", "was", "were",
+}
+FULL_PAGE_PATTERN = re.compile(
+    r"\b(itinerar\w*|guide|list|compare|comparison|steps?|how (do|to|can)|explain|details?|history|everything|plan)\b",
+    re.IGNORECASE
+)
+
+# Deterministic location resolution thresholds for WeatherNode
+FAST_PATH_MIN_SCORE = 95
+FAST_PATH_MIN_MARGIN = 8
+FAST_PATH_POPULATION_RATIO = 10
+
+# Local cart consolidation thresholds for PackingListNode
+CONSOLIDATE_TITLE_CUTOFF = 85
+CONSOLIDATE_MIN_LINE_WORDS = 3
+MAX_PACK_ITEMS = 10
+
+def scheduled_llm(llm: Any, wrap: Optional[Callable[[Any], Any]] = None) -> Any:
+    """Put `llm` (optionally wrapped, e.g. with structured output) behind the model scheduler and its failover candidates.
+
+    Models outside MODEL_CANDIDATES, such as test doubles, are called directly."""
+    wrap = wrap or (lambda candidate: candidate)
+    candidates = MODEL_CANDIDATES.get(getattr(llm, 'model_id', None))
+    if not candidates or candidates[0][1] is not llm:
+        return wrap(llm)
+    return model_scheduler.runnable([(model_id, wrap(candidate)) for model_id, candidate in candidates], llm.model_id)
+
+def build_chain(prompt: Any, llm: Any, name: str) -> Any:
+    """prompt | llm | str parser, with a Bedrock cache checkpoint after the static system prompt when the model supports it."""
+    if supports_prompt_cache(llm):
+        return (prompt | system_cache_point | scheduled_llm(llm) | StrOutputParser()).with_config({"name": name})
+    return (prompt | scheduled_llm(llm) | StrOutputParser()).with_config({"name": name})
+
+def _dump_structured(result: Optional[BaseModel]) -> Any:
+    # Plain dicts keep structured results cacheable in the persistent tiers; "" when the model skipped the tool
+    return result.model_dump(exclude_none=True) if result is not None else ""
+
+def build_structured_chain(prompt: Any, llm: Any, schema: type, name: str) -> Any:
+    """prompt | llm constrained to `schema` through Converse tool use, returning the validated fields as a dict."""
+    structured_llm = scheduled_llm(llm, lambda candidate: candidate.with_structured_output(schema))
+    if supports_prompt_cache(llm):
+        prompt = prompt | system_cache_point
+    return (prompt | structured_llm | RunnableLambda(_dump_structured)).with_config({"name": name})
+
+class Step:
+    """One I/O call of a node core: `sync` runs it for process(), `async_` is awaited for aprocess().
+
+    Step.blocking wraps a call with no async counterpart (DynamoDB, PAAPI, CPU bound work), which
+    aprocess() runs in a worker thread.
+    """
+    def __init__(self, sync: Callable[..., Any], async_: Optional[Callable[..., Awaitable[Any]]], *args, **kwargs):
+        self.sync = sync
+        self.async_ = async_
+        self.args = args
+        self.kwargs = kwargs
+
+    @classmethod
+    def blocking(cls, fn: Callable[..., Any], *args, **kwargs) -> "Step":
+        return cls(fn, None, *args, **kwargs)
+
+    @property
+    def name(self) -> str:
+        return getattr(self.sync, "__name__", None) or getattr(getattr(self.sync, "func", None), "__name__", "step")
+
+    def run(self) -> Any:
+        return self.sync(*self.args, **self.kwargs)
+
+    async def arun(self) -> Any:
+        if self.async_ is None:
+            return await asyncio.to_thread(self.sync, *self.args, **self.kwargs)
+        return await self.async_(*self.args, **self.kwargs)
+
+def http_get(dependency: resilience.Dependency, url: str, **kwargs) -> Step:
+    """GET through a dependency's breaker and hedging, on the shared sync or async HTTP client."""
+    return Step(partial(dependency.call, http_client.get), partial(dependency.acall, http_client.aget), url, **kwargs)
+
+def drive(core: Any) -> Any:
+    """Run a node core (a generator yielding Steps) to its return value, calling each step synchronously.
+
+    A step's exception is raised inside the core at its yield, so cores handle I/O errors with plain try/except.
+    Raises deadline.TurnCancelled instead of running a step once the turn was abandoned.
+    """
+    if not inspect.isgenerator(core):
+        return core
+    result, error = None, None
+    while True:
+        try:
+            step = core.throw(error) if error is not None else core.send(result)
+        except StopIteration as stop:
+            return stop.value
+        result, error = None, None
+        # An abandoned turn stops here, before its next model call or its cart and wishlist writes
+        deadline.check_cancelled(step.name)
+        try:
+            result = step.run()
+        except Exception as e:
+            error = e
+
+async def adrive(core: Any) -> Any:
+    """Async counterpart of drive(), awaiting each step."""
+    if not inspect.isgenerator(core):
+        return core
+    result, error = None, None
+    while True:
+        try:
+            step = core.throw(error) if error is not None else core.send(result)
+        except StopIteration as stop:
+            return stop.value
+        result, error = None, None
+        deadline.check_cancelled(step.name)
+        try:
+            result = await step.arun()
+        except Exception as e:
+            error = e
 
 class BaseNode(ABC):
-    def __init__(self, llm, dynamodb: Optional[Any] = None):
+    def __init__(self, llm, dynamodb: Optional[Any] = None, escalation_llm: Optional[Any] = None,
+                 cascade_policy: Optional[CascadePolicy] = None):
         self.llm = llm
         self.dynamodb = dynamodb
+        # Model cascade: outputs of llm failing cascade_policy are regenerated with escalation_llm
+        self.escalation_llm = escalation_llm if cascade_policy else None
+        self.cascade_policy = cascade_policy
+        self._escalation_chains = {}
+
+    def build_chain(self, prompt: Any, name: str) -> Any:
+        if self.escalation_llm is not None:
+            self._escalation_chains[name] = build_chain(prompt, self.escalation_llm, f"{name}_escalated")
+        return build_chain(prompt, self.llm, name)
+
+    def build_structured_chain(self, prompt: Any, schema: type, name: str) -> Any:
+        return build_structured_chain(prompt, self.llm, schema, name)
 
     @abstractmethod
+    def steps(self, state: Dict) -> Any:
+        """The node's logic as a generator yielding a Step per I/O call and returning the state.
+
+        Nodes without I/O may return the state directly.
+        """
+
     def process(self, state: Dict) -> Dict:
-        pass
+        try:
+            return drive(self.steps(state))
+        except Exception as e:
+            return self.handle_error(e, state)
+
+    async def aprocess(self, state: Dict) -> Dict:
+        """Async counterpart of process, for graph.ainvoke."""
+        try:
+            return await adrive(self.steps(state))
+        except Exception as e:
+            return self.handle_error(e, state)
+
+    def prefetch_steps(self, state: Dict) -> Any:
+        """Side-effect free work started speculatively while the router runs, as a core like steps(). Nodes opt in by overriding."""
+        return None
+
+    def prefetch(self, state: Dict) -> Any:
+        return drive(self.prefetch_steps(state))
+
+    def prefetched_or_fetch(self, state: Dict) -> Any:
+        """Steps returning the speculative prefetch result when the router picked this node, else running the prefetch now."""
+        prefetched = yield Step(self.get_prefetched, self.aget_prefetched, state)
+        if prefetched:
+            return prefetched
+        core = self.prefetch_steps(state)
+        return (yield from core) if inspect.isgenerator(core) else core
+
+    @staticmethod
+    def _prefetch_wait(state: Dict) -> Optional[float]:
+        return deadline.cap_timeout(state, PREFETCH_WAIT_SECONDS)
+
+    def get_prefetched(self, state: Dict) -> Any:
+        """The prefetch result, or None on error or when it does not finish in time, so the caller computes it inline."""
+        future = state.get("prefetched")
+        if future is None:
+            return None
+        try:
+            return future.result(timeout=self._prefetch_wait(state))
+        except FutureTimeout:
+            metrics.incr("prefetch.timeout")
+            print("Prefetch still running, computing it inline")
+            return None
+        except Exception as e:
+            print(f"Prefetch error: {e}")
+            return None
+
+    async def aget_prefetched(self, state: Dict) -> Any:
+        future = state.get("prefetched")
+        if future is None:
+            return None
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self._prefetch_wait(state))
+        except asyncio.TimeoutError:
+            metrics.incr("prefetch.timeout")
+            print("Prefetch still running, computing it inline")
+            return None
+        except Exception as e:
+            print(f"Prefetch error: {e}")
+            return None
 
     def handle_error(self, error: Exception, state: Dict) -> Dict:
         state["error"] = str(error)
@@ -80,164 +337,337 @@ class BaseNode(ABC):
             return False
 
     @staticmethod
-    def safe_parse_json(input_str: str) -> Optional[Any]:
-        # Try JSON parse
-        try: return json.loads(input_str)
-        except json.JSONDecodeError: pass
-        
-        # Try JSON from code blocks
-        m = re.search(r'```(?:json)?\s*([\s\S]*?)\s*```|\{[\s\S]*\}', input_str)
-        if m:
-            try: return json.loads(m.group(1) or m.group(0))
-            except json.JSONDecodeError: pass
-        
-        # Try Python literal
-        try: return ast.literal_eval(input_str)
-        except (ValueError, SyntaxError): pass
-        
-        # Try key-value extraction
-        try: return dict(re.findall(r'(\w+)\s*[:=]\s*([^,}\s]+)', input_str))
-        except ValueError: pass
-    
-    @staticmethod
-    def safe_parse_python(input_str):
-        match = re.search(r'<python>([\s\S]*?)</python>', input_str)
-        if match:
-            try:
-                return ast.literal_eval(match.group(1).strip())
-            except (ValueError, SyntaxError):
-                return None
-        return None
+    def _cart_items(cart: Optional[Cart]) -> List[Dict]:
+        # Cart items are stored as plain dicts in the wishlist table
+        return [item.model_dump(exclude_none=True) for item in cart.items] if cart else []
 
     @staticmethod
     def remove_duplicates(items: List[Dict]) -> List[Dict]:
         seen = set()
         return [x for x in items if tuple(sorted(x.items())) not in seen and not seen.add(tuple(sorted(x.items())))]
 
-    def invoke_chain(self, chain: Any, inputs: Dict) -> str:
+    def chain_steps(self, chain: Any, inputs: Dict, cache: bool = False) -> Any:
+        """Steps invoking a chain: response cache lookup, the call, cascade escalation and the cache write."""
         chain_name = getattr(chain, 'config', {}).get('name')
         print(f"[{self.__class__.__name__}] Invoking chain: {chain_name}")
+        model_id = self._model_id(self.llm)
+        # Keyed on the chain's own model whichever model answered, so escalated and failed-over answers hit too
+        cache_key = self._cache_key(chain, chain_name, inputs, model_id) if cache else None
+        if cache_key:
+            # The persistent tier may be DynamoDB, keep it off the event loop
+            cached = yield Step.blocking(llm_cache.get, cache_key)
+            if cached is not None:
+                print(f"[{self.__class__.__name__}] Cache hit: {chain_name} (hit rate {llm_cache.hit_rate():.0%})")
+                return cached
         try:
-            return chain.invoke(inputs)
+            # The served model differs from self.llm when the scheduler failed over to another model
+            result, served_by = yield Step(scheduler.invoke_tracked, scheduler.ainvoke_tracked, chain, inputs)
         except Exception as e:
             print(f"Chain error: {e}")
-            return ""
+            result, served_by = "", None
+        served_by = served_by or model_id
+        escalation_chain = self._escalation_chain(chain_name, result, served_by)
+        if escalation_chain is not None:
+            try:
+                result, served_by = yield Step(scheduler.invoke_tracked, scheduler.ainvoke_tracked, escalation_chain, inputs)
+                served_by = served_by or self._model_id(self.escalation_llm)
+            except Exception as e:
+                print(f"Chain error: {e}")
+        if cache_key and result:
+            yield Step.blocking(llm_cache.set, cache_key, result)
+        return result
+
+    def structured_steps(self, chain: Any, schema: type, inputs: Dict, cache: bool = False) -> Any:
+        """chain_steps for a structured chain, returning a `schema` instance or None when the model gave no valid output."""
+        return self._to_schema(schema, (yield from self.chain_steps(chain, inputs, cache=cache)))
+
+    def _to_schema(self, schema: type, result: Any) -> Optional[BaseModel]:
+        if not result:
+            print(f"[{self.__class__.__name__}] No {schema.__name__} in model output")
+            return None
+        try:
+            return schema.model_validate(result)
+        except ValidationError as e:
+            print(f"[{self.__class__.__name__}] Invalid {schema.__name__}: {e}")
+            return None
+
+    def _escalation_chain(self, chain_name: str, result: str, served_by: str) -> Optional[Any]:
+        """Return the larger model's chain when the cascade policy rejects the small model's output."""
+        escalation_chain = self._escalation_chains.get(chain_name)
+        if escalation_chain is None:
+            return None
+        if served_by == self._model_id(self.escalation_llm):
+            # A failover already answered with the larger model, escalating would repeat the same call
+            metrics.incr(f"cascade.{chain_name}.served_by_escalation_model")
+            return None
+        reason = self.cascade_policy.check(result)
+        cascade.record(chain_name, reason is not None)
+        if reason is None:
+            return None
+        # A second, larger model call only when the turn still has time for it
+        if not deadline.can_afford(None, 0, "escalation"):
+            return None
+        print(f"[{self.__class__.__name__}] Escalating {chain_name}: {reason} "
+              f"(escalation rate {cascade.escalation_rate(chain_name):.0%})")
+        return escalation_chain
+
+    @staticmethod
+    def _model_id(llm: Any) -> str:
+        return scheduler.base_model_id(getattr(llm, 'model_id', None) or getattr(llm, 'model', ''))
+
+    def _cache_key(self, chain: Any, chain_name: str, inputs: Dict, model_id: str) -> Optional[str]:
+        """Key responses on chain name + the chain's primary model id + a hash of the rendered prompt.
+
+        The cascade and failovers are part of the chain, so their answers are stored under the same key.
+        """
+        try:
+            prompt = getattr(chain, 'bound', chain).first
+            rendered = prompt.invoke(inputs).to_string()
+        except Exception as e:
+            print(f"Cache key error, skipping cache: {e}")
+            return None
+        return f"{chain_name}:{model_id}:{hashlib.sha256(rendered.encode('utf-8')).hexdigest()}"
 
 
 class IntroNode(BaseNode):
     def __init__(self, llm):
         super().__init__(llm)
-        self.chain = (intro_prompt | self.llm | StrOutputParser()).with_config({"name": "intro_chain"})
+        self.chain = self.build_chain(intro_prompt, "intro_chain")
 
-    def process(self, state: Dict) -> Dict:
-        try:
-            state["final_output"] = {
-                "answer": self.invoke_chain(self.chain, {
-                    "input": state["input"],
-                    "user_profile": state.get("user_profile", {}),
-                    "previous_chat": state["chat_history"][-20:]
-                })
-            }
-            return state
-        except Exception as e:
-            return self.handle_error(e, state)
+    def steps(self, state: Dict) -> Any:
+        state["final_output"] = {
+            "answer": (yield from self.chain_steps(self.chain, self._chain_inputs(state), cache=True))
+        }
+        return state
+
+    @staticmethod
+    def _chain_inputs(state: Dict) -> Dict:
+        return {
+            "input": state["input"],
+            "user_profile": state.get("user_profile", {}),
+            "previous_chat": history.render(state["chat_history"])
+        }
 
 
 class InternetSearchNode(BaseNode):
-    def __init__(self, llm, google_api_key: str, google_cse_id: str):
-        super().__init__(llm)
+    def __init__(self, llm, google_api_key: str, google_cse_id: str, escalation_llm=None, cascade_policy=None):
+        super().__init__(llm, escalation_llm=escalation_llm, cascade_policy=cascade_policy)
         self.google_api_key = google_api_key
         self.google_cse_id = google_cse_id
-        self.chain = (search_internet_prompt_template | self.llm | StrOutputParser()).with_config({"name": "search_chain"})
+        self.chain = self.build_chain(search_internet_prompt_template, "search_chain")
+        # Not cascaded: an insufficient snippet answer falls back to the full page, not to the larger model
+        self.snippet_chain = build_chain(search_snippets_prompt_template, self.llm, "search_snippet_chain")
+
+    def steps(self, state: Dict) -> Any:
+        # Get search results and content
+        search_results = yield from self._search_steps(state["input"], read_timeout=deadline.cap_timeout(state, SEARCH_READ_TIMEOUT))
+        search_result = search_results[0]
+
+        # Answer from the snippets when they look sufficient, downloading the page only when they are not
+        answer = None
+        if SEARCH_SNIPPET_FIRST and self._snippets_sufficient(state["input"], search_results):
+            answer = self._snippet_answer((yield from self.chain_steps(
+                self.snippet_chain, self._chain_inputs(state, self._snippets(search_results))
+            )))
+        if answer is None:
+            webpage_content = self._snippets(search_results)
+            if deadline.can_afford(state, DEADLINE_WEBPAGE_SECONDS, "webpage_fetch"):
+                try:
+                    webpage_content = yield from self._webpage_steps(
+                        search_result['link'], read_timeout=deadline.cap_timeout(state, WEBPAGE_READ_TIMEOUT)
+                    )
+                except Exception as e:
+                    print(f"Page fetch failed, answering from search snippets: {e}")
+            metrics.incr("search.depth.page")
+            answer = yield from self.chain_steps(self.chain, self._chain_inputs(state, webpage_content))
+
+        state["final_output"] = {
+            "answer": answer,
+            "link": search_result['link']
+        }
+        return state
 
-    def process(self, state: Dict) -> Dict:
-        try:
-            # Get search results and content
-            search_result = self._google_search(state["input"])[0]
-            webpage_content = self._get_webpage_content(search_result['link'])
-
-            # Generate answer
-            state["final_output"] = {
-                "answer": self.invoke_chain(self.chain, {
-                    "input": state["input"],
-                    "search_res": webpage_content,
-                    "previous_chat": state["chat_history"][-20:]
-                }),
-                "link": search_result['link']
-            }
-            return state
-        except Exception as e:
-            return self.handle_error(e, state)
+    @staticmethod
+    def _chain_inputs(state: Dict, search_res: str) -> Dict:
+        return {
+            "input": state["input"],
+            "search_res": search_res,
+            "previous_chat": history.render(state["chat_history"])
+        }
+
+    @staticmethod
+    def _snippets_sufficient(query: str, search_results: list) -> bool:
+        """Cheap pre-check before the snippet answer: no full-page question type, and the top snippets mention most query terms."""
+        if FULL_PAGE_PATTERN.search(query):
+            return False
+        terms = {term for term in re.findall(r"[a-z0-9]+", query.lower()) if len(term) > 2 and term not in SNIPPET_STOPWORDS}
+        if not terms:
+            return False
+        text = " ".join(
+            f"{item.get('title', '')} {item.get('snippet', '')}" for item in search_results[:SNIPPET_RESULTS]
+        ).lower()
+        return sum(term in text for term in terms) / len(terms) >= SNIPPET_MIN_COVERAGE
+
+    @staticmethod
+    def _snippet_answer(answer: str) -> Optional[str]:
+        """The snippet answer, or None when the model flagged the snippets as insufficient."""
+        if not answer or SNIPPETS_INSUFFICIENT in answer:
+            metrics.incr("search.depth.snippets_insufficient")
+            return None
+        metrics.incr("search.depth.snippets")
+        print(f"Answered from search snippets (snippet rate "
+              f"{metrics.rate('search.depth.snippets', 'search.depth.page'):.0%})")
+        return answer
+
+    def _webpage_steps(self, url: str, read_timeout: Optional[float] = None) -> Any:
+        cached = yield Step.blocking(page_cache.get, url)
+        if cached and cached["fresh_until"] > time.time():
+            metrics.incr("page.fresh")
+            return cached["text"]
+        site = webpage_dependency(url)
+        response = yield http_get(site, url, headers=self._conditional_headers(cached),
+                                  read_timeout=read_timeout or site.read_timeout)
+        # HTML parsing and the persistent cache tier both stay off the event loop
+        return (yield Step.blocking(self._page_text, url, cached, response.status_code, response.headers, response.content))
+
+    @staticmethod
+    def _conditional_headers(cached: Optional[Dict]) -> Dict:
+        headers = {}
+        if cached and cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached and cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+        return headers
+
+    @staticmethod
+    def _page_text(url: str, cached: Optional[Dict], status_code: int, headers: Any, content: bytes) -> str:
+        """Page text from a 200 (cached when the server sent validators or a max-age) or the cached text on a 304."""
+        cache_control = headers.get("Cache-Control", "").lower()
+        max_age = re.search(r"max-age=(\d+)", cache_control)
+        fresh_until = time.time() + min(int(max_age.group(1)), PAGE_CACHE_TTL) if max_age else 0
+        if status_code == 304 and cached:
+            metrics.incr("page.not_modified")
+            page_cache.set(url, {**cached, "fresh_until": fresh_until})
+            return cached["text"]
+
+        text = BeautifulSoup(content, 'html.parser').get_text()
+        validators = {"etag": headers.get("ETag"), "last_modified": headers.get("Last-Modified")}
+        if status_code == 200 and "no-store" not in cache_control and (any(validators.values()) or fresh_until) \
+                and len(text) <= PAGE_CACHE_MAX_CHARS:
+            page_cache.set(url, {"text": text, "fresh_until": fresh_until, **validators})
+        return text
+
+    def _search_steps(self, query: str, num_results: int = 5, read_timeout: Optional[float] = None) -> Any:
+        key = self._search_key(query, num_results)
+        items = yield Step.blocking(search_cache.get, key)
+        if items is not None:
+            return items
+        # Call the Custom Search REST endpoint on the shared pool instead of rebuilding a discovery client per query
+        response = yield http_get(google_cse_api, GOOGLE_CSE_URL, params=self._search_params(query, num_results),
+                                  read_timeout=read_timeout or google_cse_api.read_timeout)
+        response.raise_for_status()
+        items = response.json()['items']
+        yield Step.blocking(search_cache.set, key, items)
+        return items
 
-    def _get_webpage_content(self, url: str) -> str:
-        response = requests.get(url, timeout=10)
-        return BeautifulSoup(response.content, 'html.parser').get_text()
+    @staticmethod
+    def _search_key(query: str, num_results: int) -> str:
+        # Case, punctuation and spacing do not change Google's results, "Events in Tokyo?" == "events in tokyo"
+        normalized = " ".join(re.findall(r"\w+", query.lower()))
+        return f"cse:{num_results}:{normalized}"
+
+    @staticmethod
+    def _snippets(search_results: list) -> str:
+        """Titles and snippets of the search results, the answer context when the page cannot be fetched in time."""
+        return "\n\n".join(f"{item.get('title', '')}\n{item.get('snippet', '')}" for item in search_results)
 
-    def _google_search(self, query: str, num_results: int = 5) -> list:
-        return build("customsearch", "v1", developerKey=self.google_api_key).cse().list(
-            q=query,
-            cx=self.google_cse_id,
-            num=num_results
-        ).execute()['items']
+    def _search_params(self, query: str, num_results: int) -> Dict:
+        return {
+            "key": self.google_api_key,
+            "cx": self.google_cse_id,
+            "q": query,
+            "num": num_results
+        }
 
 
 class AmazonFactsNode(BaseNode):
-    def __init__(self, llm):
-        super().__init__(llm)
-        self.chain = (amazon_facts_prompt_template | self.llm | StrOutputParser()).with_config({"name": "facts_chain"})
+    def __init__(self, llm, escalation_llm=None, cascade_policy=None):
+        super().__init__(llm, escalation_llm=escalation_llm, cascade_policy=cascade_policy)
+        self.chain = self.build_chain(amazon_facts_prompt_template, "facts_chain")
 
-    def process(self, state: Dict) -> Dict:
-        try:
-            state["final_output"] = {
-                "answer": self.invoke_chain(self.chain, {
-                    "input": state["input"],
-                    "user_profile": state.get("user_profile", {})
-                })
-            }
-            return state
-        except Exception as e:
-            return self.handle_error(e, state)
+    def steps(self, state: Dict) -> Any:
+        state["final_output"] = {
+            "answer": (yield from self.chain_steps(self.chain, {
+                "input": state["input"],
+                "user_profile": state.get("user_profile", {})
+            }, cache=True))
+        }
+        return state
 
 
 class TripRecommendationNode(BaseNode):
-    def __init__(self, llm, agent_client, kb_id: str):
-        super().__init__(llm)
+    def __init__(self, llm, agent_client, kb_id: str, escalation_llm=None, cascade_policy=None):
+        super().__init__(llm, escalation_llm=escalation_llm, cascade_policy=cascade_policy)
         self.agent_client = agent_client
         self.kb_id = kb_id
-        self.chain = (trip_rec_prompt_template | self.llm | StrOutputParser()).with_config({"name": "trip_rec_chain"})
+        self.chain = self.build_chain(trip_rec_prompt_template, "trip_rec_chain")
 
-    def process(self, state: Dict) -> Dict:
-        try:
-            # Get vector search results
-            docs = self.agent_client.retrieve(
-                knowledgeBaseId=self.kb_id,
-                retrievalQuery={"text": state["input"]},
-                retrievalConfiguration={"vectorSearchConfiguration": {"numberOfResults": 3}}
-            )
-            print(f"Vector search results: {docs}")
-
-            # Extract results and links
-            results = []
-            links = []
-            for doc in docs['retrievalResults']:
-                results.append(doc['content']['text'])
-                links.append(doc['location']['s3Location']['uri'])
-
-            print(f"RAG results: {results}")
-
-            # Generate recommendation
-            state["final_output"] = {
-                "answer": self.invoke_chain(self.chain, {
-                    "input": state["input"],
-                    "search_res": results,
-                    "user_profile": state.get("user_profile", {}),
-                    "previous_chat": state["chat_history"][-20:]
-                }),
-                "links": links
-            }
-            return state
-        except Exception as e:
-            return self.handle_error(e, state)
+    def steps(self, state: Dict) -> Any:
+        # Get vector search results, reusing the speculative retrieval when the router picked this node
+        results, links = yield from self.prefetched_or_fetch(state)
+
+        # Generate recommendation
+        state["final_output"] = {
+            "answer": (yield from self.chain_steps(self.chain, self._chain_inputs(state, results))),
+            "links": links
+        }
+        return state
+
+    def prefetch_steps(self, state: Dict) -> Any:
+        # Known destinations use their precomputed fact sheet, skipping the retrieval round trip
+        # when the question is about what the sheet summarizes
+        sheets = fact_sheets.get_index().find(state["input"]) if fact_sheets.USE_FACT_SHEETS else []
+        results = [fact_sheets.render(sheet) for sheet in sheets]
+        links = [fact_sheets.source_uri(sheet) for sheet in sheets]
+        if sheets:
+            print(f"Using fact sheets: {[sheet.get('city') for sheet in sheets]}")
+            if fact_sheets.covers(state["input"]):
+                metrics.incr("trip_rec.fact_sheet")
+                return results, links
+            metrics.incr("trip_rec.fact_sheet_with_kb")
+        else:
+            metrics.incr("trip_rec.kb")
+        # Fewer passages near the deadline keep the answer prompt, and so the answer, short
+        k = KB_RESULTS if deadline.can_afford(state, DEADLINE_FULL_RETRIEVAL_SECONDS, "full_retrieval") else KB_RESULTS_NEAR_DEADLINE
+        kb_results, kb_links = yield Step.blocking(self._retrieve, state["input"], k)
+        return results + kb_results, links + kb_links
+
+    def _retrieve(self, query: str, k: int = KB_RESULTS) -> tuple:
+        docs = kb_flight.do(f"{self.kb_id}:{k}:{query}", self.agent_client.retrieve,
+            knowledgeBaseId=self.kb_id,
+            retrievalQuery={"text": query},
+            retrievalConfiguration={"vectorSearchConfiguration": {"numberOfResults": k}}
+        )
+        print(f"Vector search results: {docs}")
+
+        # Extract results and links
+        results = []
+        links = []
+        for doc in docs['retrievalResults']:
+            results.append(doc['content']['text'])
+            links.append(doc['location']['s3Location']['uri'])
+
+        print(f"RAG results: {results}")
+        return results, links
+
+    @staticmethod
+    def _chain_inputs(state: Dict, results: List[str]) -> Dict:
+        return {
+            "input": state["input"],
+            "search_res": results,
+            "user_profile": state.get("user_profile", {}),
+            "previous_chat": history.render(state["chat_history"])
+        }
 
 
 class PackingListNode(BaseNode):
@@ -252,56 +682,69 @@ class PackingListNode(BaseNode):
             region=region_name
         )
         self.paapi_partner_tag = partner_tag
-        self.pack_chain = (amazon_pack_template | self.llm | StrOutputParser()).with_config({"name": "pack_chain"})
-        self.format_chain = (amazon_search_format_template | self.llm | StrOutputParser()).with_config({"name": "format_chain"})
-        self.consolidate_chain = (consolidate_cart_prompt_template | self.llm | StrOutputParser()).with_config({"name": "consolidate_chain"})
+        self.pack_chain = self.build_structured_chain(amazon_pack_template, PackingList, "pack_chain")
+        self.format_chain = self.build_chain(amazon_search_format_template, "format_chain")
 
-    def process(self, state: Dict) -> Dict:
-        try:
-            # Generate packing list
-            pack_list = self.invoke_chain(self.pack_chain, {
-                "input": state["input"],
-                "user_profile": state.get("user_profile", {}),
-                "previous_chat": state["chat_history"][-20:]
-            })
+    def steps(self, state: Dict) -> Any:
+        # Generate packing list
+        pack_list = yield from self.structured_steps(self.pack_chain, PackingList, {
+            "input": state["input"],
+            "user_profile": state.get("user_profile", {}),
+            "previous_chat": history.render(state["chat_history"])
+        })
 
-            # Search products and get ASINs
-            asins = []
-            search_prods = []
+        # Search products and get ASINs. The PAAPI SDK is synchronous; keep the searches sequential to respect its request rate
+        asins = []
+        search_prods = []
 
-            for item in self.safe_parse_python(pack_list) or []:
-                search_results = self._search_products(item)
-                search_prods.append(search_results['products'])
-                asins.extend(search_results['asins'])
+        for item in self._pack_items(pack_list):
+            if search_prods and not deadline.can_afford(state, DEADLINE_PAAPI_SEARCH_SECONDS, "pack_item_search"):
+                break
+            search_results = yield Step.blocking(self._search_products, item)
+            search_prods.append(search_results['products'])
+            asins.extend(search_results['asins'])
 
-            # Format and consolidate results
-            formatted_answer = self.invoke_chain(self.format_chain, {
-                "input": state["input"],
-                "prod_search": search_prods,
-                "user_profile": state.get("user_profile", {}),
-                "previous_chat": state["chat_history"][-20:]
-            })
+        # Format and consolidate results
+        formatted_answer = yield from self.chain_steps(self.format_chain, {
+            "input": state["input"],
+            "prod_search": search_prods,
+            "user_profile": state.get("user_profile", {}),
+            "previous_chat": history.render(state["chat_history"])
+        })
 
-            asins_response = self.invoke_chain(self.consolidate_chain, {
-                    "cart": asins,
-                    "answer": formatted_answer
-                })
-            
-            asins_dict = self.safe_parse_json(asins_response)
-                        
-            state["final_output"] = {
-                "answer": formatted_answer,
-                "asins": asins_dict
-            }
-
-            return state
-            
-        except Exception as e:
-            return self.handle_error(e, state)
+        state["final_output"] = {
+            "answer": formatted_answer,
+            "asins": self._consolidate_cart(formatted_answer, asins)
+        }
+
+        return state
+
+    @staticmethod
+    def _pack_items(pack_list: Optional[PackingList]) -> List[str]:
+        return pack_list.items[:MAX_PACK_ITEMS] if pack_list else []
+
+    def _consolidate_cart(self, answer: str, asins: List[Dict]) -> List[Dict]:
+        """Keep the searched products the formatted answer mentions, matched by ASIN (in the detail page links) or fuzzy title."""
+        text = answer.lower()
+        # Strip list numbering and "Product:" labels, skip short lines like "Rating: 4.3" or category headings
+        lines = [re.sub(r'^\s*(\d+\.|[-*])?\s*(product:)?\s*', '', line, flags=re.IGNORECASE) for line in answer.splitlines()]
+        lines = [line for line in lines if len(line.split()) >= CONSOLIDATE_MIN_LINE_WORDS]
+
+        cart = []
+        for item in asins:
+            if item["asin"].lower() in text:
+                cart.append(item)
+            elif lines and process.extractOne(item.get("title", ""), lines, scorer=fuzz.token_sort_ratio,
+                                              score_cutoff=CONSOLIDATE_TITLE_CUTOFF):
+                cart.append(item)
+
+        cart = self.remove_duplicates(cart)
+        print(f"Consolidated cart: {len(cart)} of {len(asins)} searched products")
+        return cart
 
     def _search_products(self, query: str) -> Dict:
         print(f"Searching for products: {query}")
-        search_results = self.paapi.search_items(SearchItemsRequest(
+        search_results = paapi_flight.do(f"2:{query}", paapi_api.call, self.paapi.search_items, SearchItemsRequest(
             partner_tag=self.paapi_partner_tag,
             partner_type=PartnerType.ASSOCIATES,
             keywords=query,
@@ -345,63 +788,81 @@ class WeatherNode(BaseNode):
     def __init__(self, llm, openweather_api_key: str):
         super().__init__(llm)
         self.api_key = openweather_api_key
-        self.extract_city_chain = (extract_city_prompt_template | self.llm | StrOutputParser()).with_config({"name": "city_chain"})
-        self.location_chain = (confirm_location_prompt_template | self.llm | StrOutputParser()).with_config({"name": "location_chain"})
-        self.weather_chain = (weather_prompt_template | self.llm | StrOutputParser()).with_config({"name": "weather_chain"})
-
-    def process(self, state: Dict) -> Dict:
-        try:
-            # Extract city from query using LLM
-            extracted_city_response = self.invoke_chain(self.extract_city_chain, {
-                "input": state["input"]
+        self.extract_city_chain = self.build_structured_chain(extract_city_prompt_template, CityExtraction, "city_chain")
+        self.location_chain = self.build_structured_chain(confirm_location_prompt_template, ConfirmedLocation, "location_chain")
+        self.weather_chain = self.build_chain(weather_prompt_template, "weather_chain")
+
+    def steps(self, state: Dict) -> Any:
+        # Extract city from query using LLM, unless it was already prefetched during routing
+        city = yield from self.prefetched_or_fetch(state)
+        extracted_city = self._city_name(city)
+
+        # Match city name to database. Fuzzy matching is CPU bound, keep it off the event loop
+        matches = yield Step.blocking(self._match_city, extracted_city, score_cutoff=84)
+        city_candidates = matches if matches else []
+
+        # Resolve deterministically, disambiguating with the LLM only when the match is ambiguous
+        location = self._resolve_location(state["input"], extracted_city, city_candidates)
+        if location is None and city_candidates \
+                and not deadline.can_afford(state, DEADLINE_DISAMBIGUATION_SECONDS, "location_disambiguation"):
+            location = city_candidates[0][1]
+        if location is None:
+            confirmed = yield from self.structured_steps(self.location_chain, ConfirmedLocation, {
+                "input": state["input"],
+                "city_candidates": city_candidates
             })
-            extracted_city = self.safe_parse_json(extracted_city_response)["city_name"]
+            location = self._confirmed_location(confirmed)
 
-            # Match city name to database
-            matches = self._match_city(extracted_city, score_cutoff=84)
-            city_candidates = matches if matches else []
+        # Get weather data
+        weather_raw = yield self._weather_step(location, deadline.cap_timeout(state, WEATHER_READ_TIMEOUT))
+        forecast_weather_data = self._compress_forecast(json.loads(weather_raw))
 
-            # Disambiguate with LLM
-            confirmed = self.invoke_chain(self.location_chain, {
+        # Generate response
+        state["final_output"] = {
+            "answer": (yield from self.chain_steps(self.weather_chain, {
                 "input": state["input"],
-                "city_candidates": city_candidates
-            })
-            location = self.safe_parse_json(confirmed)
+                "search_res": forecast_weather_data,
+                "previous_chat": history.render(state["chat_history"])
+            }))
+        }
+        return state
 
-            # Get weather data
-            weather_raw = self._get_weather_data(location)
-            weather_json = self.safe_parse_json(weather_raw)
-            
-            # Compress forecast
-            daily_forecast = {}
-            for entry in weather_json["list"]:
-                dt = datetime.strptime(entry["dt_txt"], "%Y-%m-%d %H:%M:%S")
-                day = dt.date()
-                hour = dt.hour
-                if hour == 12 and day not in daily_forecast:
-                    daily_forecast[day] = entry
-
-            forecast_output = []
-            for day in sorted(daily_forecast.keys()):
-                entry = daily_forecast[day]
-                desc = entry["weather"][0]["description"]
-                temp = round((entry["main"]["temp"] - 273.15) * 9/5 + 32)
-                forecast_output.append(f"{day.strftime('%A, %b %d')}: {desc}, {temp}°F")
-
-            forecast_weather_data = "\n".join(forecast_output)
-
-            # Generate response
-            state["final_output"] = {
-                "answer": self.invoke_chain(self.weather_chain, {
-                    "input": state["input"],
-                    "search_res": forecast_weather_data,
-                    "previous_chat": state["chat_history"][-20:]
-                })
-            }
-            return state
-            
-        except Exception as e:
-            return self.handle_error(e, state)
+    def prefetch_steps(self, state: Dict) -> Any:
+        return (yield from self.structured_steps(self.extract_city_chain, CityExtraction, {
+            "input": state["input"]
+        }, cache=True))
+
+    @staticmethod
+    def _city_name(city: Optional[CityExtraction]) -> str:
+        if city is None or not city.city_name.strip():
+            raise ValueError("No city found in the question")
+        return city.city_name
+
+    @staticmethod
+    def _confirmed_location(confirmed: Optional[ConfirmedLocation]) -> Dict:
+        if confirmed is None:
+            raise ValueError("Could not confirm the location")
+        return confirmed.model_dump()
+
+    @staticmethod
+    def _compress_forecast(weather_json: Dict) -> str:
+        """Keep one midday entry per day and render it as a readable line in Fahrenheit."""
+        daily_forecast = {}
+        for entry in weather_json["list"]:
+            dt = datetime.strptime(entry["dt_txt"], "%Y-%m-%d %H:%M:%S")
+            day = dt.date()
+            hour = dt.hour
+            if hour == 12 and day not in daily_forecast:
+                daily_forecast[day] = entry
+
+        forecast_output = []
+        for day in sorted(daily_forecast.keys()):
+            entry = daily_forecast[day]
+            desc = entry["weather"][0]["description"]
+            temp = round((entry["main"]["temp"] - 273.15) * 9/5 + 32)
+            forecast_output.append(f"{day.strftime('%A, %b %d')}: {desc}, {temp}°F")
+
+        return "\n".join(forecast_output)
         
     def _load_cities(self, filepath):
         """load city file efficiently (using built-in csv, not pandas)"""
@@ -414,6 +875,7 @@ class WeatherNode(BaseNode):
                     {
                         "city": row["city"].strip(),
                         "country": row.get("country", "").strip(),
+                        "admin_name": row.get("admin_name", "").strip(),
                         "latitude": float(row["lat"]),
                         "longitude": float(row["lng"]),
                         "population": row["population"],
@@ -431,47 +893,99 @@ class WeatherNode(BaseNode):
 
         # Filter out low-confidence matches
         return [
-            (match, cities[idx]) for match, score, idx in matches if score >= score_cutoff
+            (match, cities[idx], score) for match, score, idx in matches if score >= score_cutoff
         ]
 
-    def _get_weather_data(self, location: Dict) -> list:
-        response = requests.get(
-            f"https://api.openweathermap.org/data/2.5/forecast",
-            params={
-                "lat": location["latitude"],
-                "lon": location["longitude"],
-                "appid": self.api_key
-            },
-            timeout=10
-        )
+    def _resolve_location(self, user_input: str, extracted_city: str, candidates: List) -> Optional[Dict]:
+        """Pick the location from the fuzzy matches without an LLM, or return None when it is genuinely ambiguous.
+
+        Uses country/region hints from the input, the score margin to the runner-up,
+        exact name hits and the population prior, in that order.
+        """
+        location = None
+
+        # Narrow to candidates whose country or region is named in the input, e.g. "Paris, Texas".
+        # Whole words only, so "Georgia" does not match inside "Georgian"
+        hinted = [c for c in candidates if any(
+            place and re.search(rf"\b{re.escape(place)}\b", user_input, re.IGNORECASE)
+            for place in (c[1]["country"], c[1].get("admin_name", ""))
+        )]
+        if hinted:
+            candidates = hinted
+
+        if len(candidates) == 1 and candidates[0][2] >= FAST_PATH_MIN_SCORE:
+            location = candidates[0][1]
+        elif len(candidates) > 1 and candidates[0][2] >= FAST_PATH_MIN_SCORE \
+                and candidates[0][2] - candidates[1][2] >= FAST_PATH_MIN_MARGIN:
+            location = candidates[0][1]
+        else:
+            # Several exact name hits, e.g. Paris FR vs. Paris TX: take the much larger city
+            exact = [c[1] for c in candidates if c[0] == (extracted_city or "").strip().lower()]
+            exact.sort(key=lambda city: self._population(city), reverse=True)
+            if len(exact) == 1:
+                location = exact[0]
+            elif len(exact) > 1 and self._population(exact[0]) >= FAST_PATH_POPULATION_RATIO * max(self._population(exact[1]), 1):
+                location = exact[0]
+
+        if location is None:
+            metrics.incr("weather.location.llm")
+        else:
+            metrics.incr("weather.location.fast_path")
+            print(f"Resolved location without LLM: {location['city']}, {location['country']} "
+                  f"(fast path rate {metrics.rate('weather.location.fast_path', 'weather.location.llm'):.0%})")
+        return location
+
+    @staticmethod
+    def _population(city: Dict) -> float:
+        try:
+            return float(city.get("population") or 0)
+        except ValueError:
+            return 0.0
+
+    def _weather_step(self, location: Dict, read_timeout: Optional[float] = None) -> Step:
+        """Forecast fetch shared with concurrent callers asking for the same location."""
+        key = self._weather_key(location)
+        return Step(partial(weather_flight.do, key, drive), partial(weather_flight.ado, key, adrive),
+                    self._fetch_weather_steps(location, read_timeout))
+
+    def _fetch_weather_steps(self, location: Dict, read_timeout: Optional[float] = None) -> Any:
+        response = yield http_get(openweather_api, OPENWEATHER_FORECAST_URL, params=self._weather_params(location),
+                                  read_timeout=read_timeout or openweather_api.read_timeout)
         return response.content.decode()
 
+    @staticmethod
+    def _weather_key(location: Dict) -> str:
+        return f"{location['latitude']}:{location['longitude']}"
+
+    def _weather_params(self, location: Dict) -> Dict:
+        return {
+            "lat": location["latitude"],
+            "lon": location["longitude"],
+            "appid": self.api_key
+        }
+
 
 class ConversationSummaryNode(BaseNode):
-    def __init__(self, llm, chat_table: str, email_config: Dict = None):
-        super().__init__(llm)
+    def __init__(self, llm, chat_table: str, email_config: Dict = None, escalation_llm=None, cascade_policy=None):
+        super().__init__(llm, escalation_llm=escalation_llm, cascade_policy=cascade_policy)
         self.chat_table = chat_table
         self.email_config = email_config or {}
-        self.chain = (summarize_conversation_template | self.llm | StrOutputParser()).with_config({"name": "summary_chain"})
+        self.chain = self.build_chain(summarize_conversation_template, "summary_chain")
 
 
-    def process(self, state: Dict) -> Dict:
-        try:
-            summary = self.invoke_chain(self.chain, {
-                "input": state["input"],
-                "previous_chat": state.get("chat_history", [])[-10],
-                "user_profile": state.get("user_profile", {})
-            })        
+    def steps(self, state: Dict) -> Any:
+        summary = yield from self.chain_steps(self.chain, {
+            "input": state["input"],
+            "previous_chat": history.render(state.get("chat_history", []), entries=10),
+            "user_profile": state.get("user_profile", {})
+        })
 
-            # Send email if configured
-            if self.email_config:
-                self._send_email(summary)
+        # Send email if configured
+        if self.email_config:
+            yield Step.blocking(self._send_email, summary)
 
-            state["final_output"] = {"answer": summary}
-            return state
-            
-        except Exception as e:
-            return self.handle_error(e, state)
+        state["final_output"] = {"answer": summary}
+        return state
 
     def _send_email(self, summary: str) -> None:
         # Implement your email sending logic here
@@ -491,29 +1005,28 @@ class OrderCartNode(BaseNode):
     def __init__(self, llm, wishlist_table: str, dynamodb=None):
         super().__init__(llm, dynamodb)
         self.wishlist_table = wishlist_table
-        self.chain = (order_cart_template | self.llm | StrOutputParser()).with_config({"name": "order_chain"})
+        self.chain = self.build_chain(order_cart_template, "order_chain")
 
-    def process(self, state: Dict) -> Dict:
-        try:
-            wishlist = self.get_dynamo_item(self.wishlist_table, {
-                "id": state.get("user_id", "default_user"),
-                "createdAt": "now"
-            })
+    def prefetch_steps(self, state: Dict) -> Any:
+        return (yield Step.blocking(self.get_dynamo_item, self.wishlist_table, {
+            "id": state.get("user_id", "default_user"),
+            "createdAt": "now"
+        }))
 
-            cart_summary = self.invoke_chain(self.chain, {
-                "input": state["input"],
-                "user_cart": wishlist.get("wishlist", []) if wishlist else [],
-                "previous_chat": state["chat_history"][-20:]
-            })
+    def steps(self, state: Dict) -> Any:
+        wishlist = yield from self.prefetched_or_fetch(state)
 
-            state["final_output"] = {
-                "answer": cart_summary,
-                "asins": wishlist.get("wishlist", []) if wishlist else []
-            }
-            return state
-            
-        except Exception as e:
-            return self.handle_error(e, state)
+        cart_summary = yield from self.chain_steps(self.chain, {
+            "input": state["input"],
+            "user_cart": wishlist.get("wishlist", []) if wishlist else [],
+            "previous_chat": history.render(state["chat_history"])
+        })
+
+        state["final_output"] = {
+            "answer": cart_summary,
+            "asins": wishlist.get("wishlist", []) if wishlist else []
+        }
+        return state
 
 
 class ProductSearchNode(BaseNode):
@@ -528,43 +1041,40 @@ class ProductSearchNode(BaseNode):
             region=region_name
         )
         self.paapi_partner_tag = partner_tag
-        self.format_chain = (amazon_search_format_template | self.llm | StrOutputParser()).with_config({"name": "format_chain"})
-        self.search_chain = (amazon_search_template | self.llm | StrOutputParser()).with_config({"name": "search_chain"})
+        self.format_chain = self.build_chain(amazon_search_format_template, "format_chain")
+        self.search_chain = self.build_chain(amazon_search_template, "search_chain")
 
-    def process(self, state: Dict) -> Dict:
-        try:
-            # Get search query and perform search
-            search_query = self.invoke_chain(self.search_chain, {
-                "input": state["input"],
-                "user_profile": state.get("user_profile", {}),
-                "previous_chat": state["chat_history"][-20:]
-            })
-            
-            search_results = self._search_products(search_query)
-            
-            # Format response
-            response = self.invoke_chain(self.format_chain, {
-                "input": state["input"],
-                "prod_search": search_results["products"],
-                "user_profile": state.get("user_profile", {}),
-                "previous_chat": state["chat_history"][-20:]
-            })
+    def steps(self, state: Dict) -> Any:
+        # Get search query and perform search
+        search_query = yield from self.chain_steps(self.search_chain, {
+            "input": state["input"],
+            "user_profile": state.get("user_profile", {}),
+            "previous_chat": history.render(state["chat_history"])
+        }, cache=True)
 
-            state["final_output"] = {
-                "answer": response,
-                "asins": search_results["asins"]
-            }
-            return state
-            
-        except Exception as e:
-            return self.handle_error(e, state)
+        search_results = yield Step.blocking(self._search_products, search_query)
+
+        # Format response
+        response = yield from self.chain_steps(self.format_chain, {
+            "input": state["input"],
+            "prod_search": search_results["products"],
+            "user_profile": state.get("user_profile", {}),
+            "previous_chat": history.render(state["chat_history"])
+        })
+
+        state["final_output"] = {
+            "answer": response,
+            "asins": search_results["asins"]
+        }
+        return state
 
     def _search_products(self, query: str) -> Dict:
         try:
-            search_results = self.paapi.search_items(SearchItemsRequest(
+            keywords = query.replace("\n", "").replace("<entity>", "").replace("</entity>", "")
+            search_results = paapi_flight.do(f"4:{keywords}", paapi_api.call, self.paapi.search_items, SearchItemsRequest(
                 partner_tag=self.paapi_partner_tag,
                 partner_type=PartnerType.ASSOCIATES,
-                keywords=query.replace("\n", "").replace("<entity>", "").replace("</entity>", ""),
+                keywords=keywords,
                 search_index="All",
                 item_count=4,
                 resources=[
@@ -610,48 +1120,46 @@ class RemoveCartNode(BaseNode):
     def __init__(self, llm, wishlist_table: str, dynamodb=None):
         super().__init__(llm, dynamodb)
         self.wishlist_table = wishlist_table
-        self.remove_chain = (remove_cart_prompt_template | self.llm | StrOutputParser()).with_config({"name": "remove_chain"})
-        self.confirm_chain = (confirm_cart_removal_prompt_template | self.llm | StrOutputParser()).with_config({"name": "confirm_chain"})
-
-    def process(self, state: Dict) -> Dict:
-        try:
-            # Get current wishlist and process removals
-            existing_list = self.get_dynamo_item(self.wishlist_table, {
-                "id": state.get("user_id", "default_user"),
-                "createdAt": "now"
-            })
-            current_list = existing_list.get("wishlist", []) if existing_list else []
-            
-            # Remove items and update
-            updated_cart = self._process_removals(state, current_list)
-            
-            self.put_dynamo_item(self.wishlist_table, {
-                "id": state.get("user_id", "default_user"),
-                "createdAt": "now",
-                "wishlist": updated_cart,
-                "latest_timestamp": str(time.time())
-            })
-
-            # Generate confirmation
-            state["final_output"] = {
-                "answer": self.invoke_chain(self.confirm_chain, {
-                    "input": state["input"],
-                    "cart": updated_cart
-                }),
-                "asins": current_list
-            }
-            return state
-            
-        except Exception as e:
-            return self.handle_error(e, state)
-
-    def _process_removals(self, state: Dict, current_list: List) -> List:
-        removed_items = self.safe_parse_json(self.invoke_chain(self.remove_chain, {
+        self.remove_chain = self.build_structured_chain(remove_cart_prompt_template, Cart, "remove_chain")
+        self.confirm_chain = self.build_chain(confirm_cart_removal_prompt_template, "confirm_chain")
+
+    def prefetch_steps(self, state: Dict) -> Any:
+        return (yield Step.blocking(self.get_dynamo_item, self.wishlist_table, {
+            "id": state.get("user_id", "default_user"),
+            "createdAt": "now"
+        }))
+
+    def steps(self, state: Dict) -> Any:
+        # Get current wishlist and process removals
+        existing_list = yield from self.prefetched_or_fetch(state)
+        current_list = existing_list.get("wishlist", []) if existing_list else []
+
+        # Remove items and update
+        removed_items = self._cart_items((yield from self.structured_steps(self.remove_chain, Cart, {
             "input": state["input"],
-            "previous_chat": state["chat_history"][-20:],
+            "previous_chat": history.render(state["chat_history"]),
             "cart": current_list
-        })) or []
+        })))
+        updated_cart = self._process_removals(removed_items, current_list)
+
+        yield Step.blocking(self.put_dynamo_item, self.wishlist_table, {
+            "id": state.get("user_id", "default_user"),
+            "createdAt": "now",
+            "wishlist": updated_cart,
+            "latest_timestamp": str(time.time())
+        })
+
+        # Generate confirmation
+        state["final_output"] = {
+            "answer": (yield from self.chain_steps(self.confirm_chain, {
+                "input": state["input"],
+                "cart": updated_cart
+            })),
+            "asins": current_list
+        }
+        return state
 
+    def _process_removals(self, removed_items: List, current_list: List) -> List:
         # Process and deduplicate
         wishlist = []
         for item in removed_items:
@@ -666,91 +1174,80 @@ class AddFromHistoryNode(BaseNode):
     def __init__(self, llm, wishlist_table: str, dynamodb=None):
         super().__init__(llm, dynamodb)
         self.wishlist_table = wishlist_table
-        self.chain = (add_from_previous_chat_prompt_template | self.llm | StrOutputParser()).with_config({"name": "add_history_chain"})
+        self.chain = self.build_structured_chain(add_from_previous_chat_prompt_template, Cart, "add_history_chain")
 
-    def process(self, state: Dict) -> Dict:
-        try:
-            existing_list = self.get_dynamo_item(
-                self.wishlist_table, 
-                {"id": state.get("user_id", "default_user"), "createdAt": "now"}
-            )
-            current_list = existing_list.get("wishlist", []) if existing_list else []
-
-            # Process items from chat history
-            new_items = self.safe_parse_json(self.invoke_chain(self.chain, {
-                "input": state["input"],
-                "previous_chat": state["chat_history"][-20:]
-            })) or []
-            print(f"new_items: {new_items}")
-
-            # Update wishlist
-            current_list.extend(new_items)
-            updated_list = self.remove_duplicates(current_list)
-            print(f"updated_list: {updated_list}")
-            
-            self.put_dynamo_item(self.wishlist_table, {
-                "id": state.get("user_id", "default_user"),
-                "createdAt": "now",
-                "wishlist": updated_list,
-                "latest_timestamp": str(time.time())
-            })
+    def prefetch_steps(self, state: Dict) -> Any:
+        return (yield Step.blocking(self.get_dynamo_item, self.wishlist_table, {
+            "id": state.get("user_id", "default_user"),
+            "createdAt": "now"
+        }))
 
-            state["final_output"] = {
-                "answer": "I have updated your cart, is there anything else I can do for you?",
-                "asins": updated_list
-            }
-            return state
-            
-        except Exception as e:
-            return self.handle_error(e, state)
+    def steps(self, state: Dict) -> Any:
+        existing_list = yield from self.prefetched_or_fetch(state)
+        current_list = existing_list.get("wishlist", []) if existing_list else []
+
+        # Process items from chat history
+        new_items = self._cart_items((yield from self.structured_steps(self.chain, Cart, {
+            "input": state["input"],
+            "previous_chat": history.render(state["chat_history"])
+        })))
+        print(f"new_items: {new_items}")
+
+        # Update wishlist
+        current_list.extend(new_items)
+        updated_list = self.remove_duplicates(current_list)
+        print(f"updated_list: {updated_list}")
+
+        yield Step.blocking(self.put_dynamo_item, self.wishlist_table, {
+            "id": state.get("user_id", "default_user"),
+            "createdAt": "now",
+            "wishlist": updated_list,
+            "latest_timestamp": str(time.time())
+        })
+
+        state["final_output"] = {
+            "answer": "I have updated your cart, is there anything else I can do for you?",
+            "asins": updated_list
+        }
+        return state
         
 
 class UserSummaryNode(BaseNode):
-    def __init__(self, llm):
-        super().__init__(llm)
-        self.chain = (user_summary_prompt_template | self.llm | StrOutputParser()).with_config({"name": "user_summary_chain"})
+    def __init__(self, llm, escalation_llm=None, cascade_policy=None):
+        super().__init__(llm, escalation_llm=escalation_llm, cascade_policy=cascade_policy)
+        self.chain = self.build_chain(user_summary_prompt_template, "user_summary_chain")
 
-    def process(self, state: Dict) -> Dict:
-        try:
-            state["final_output"] = {
-                "answer": self.invoke_chain(self.chain, {
-                    "input": state["input"],
-                    "user_profile": state.get("user_profile", {})
-                })
-            }
-            return state
-            
-        except Exception as e:
-            return self.handle_error(e, state)
+    def steps(self, state: Dict) -> Any:
+        state["final_output"] = {
+            "answer": (yield from self.chain_steps(self.chain, {
+                "input": state["input"],
+                "user_profile": state.get("user_profile", {})
+            }))
+        }
+        return state
 
 
 class FallbackPackingListNode(BaseNode):
     """Fallback node when PAAPI is disabled"""
     def __init__(self, llm):
         super().__init__(llm)
-        self.chain = (intro_prompt | self.llm | StrOutputParser()).with_config({"name": "fallback_pack_chain"})
+        self.chain = self.build_chain(intro_prompt, "fallback_pack_chain")
 
-    def process(self, state: Dict) -> Dict:
-        try:
-            state["final_output"] = {
-                "answer": "I'd love to help you create a packing list, but Amazon product search is currently disabled. I can provide general packing advice instead! What type of trip are you planning?"
-            }
-            return state
-        except Exception as e:
-            return self.handle_error(e, state)
+    def steps(self, state: Dict) -> Dict:
+        state["final_output"] = {
+            "answer": "I'd love to help you create a packing list, but Amazon product search is currently disabled. I can provide general packing advice instead! What type of trip are you planning?"
+        }
+        return state
 
 
 class FallbackProductSearchNode(BaseNode):
     """Fallback node when PAAPI is disabled"""
     def __init__(self, llm):
         super().__init__(llm)
-        self.chain = (intro_prompt | self.llm | StrOutputParser()).with_config({"name": "fallback_search_chain"})
+        self.chain = self.build_chain(intro_prompt, "fallback_search_chain")
 
-    def process(self, state: Dict) -> Dict:
-        try:
-            state["final_output"] = {
-                "answer": "Amazon product search is currently disabled. I can help you with travel recommendations, weather information, or general travel advice instead!"
-            }
-            return state
-        except Exception as e:
-            return self.handle_error(e, state)
+    def steps(self, state: Dict) -> Dict:
+        state["final_output"] = {
+            "answer": "Amazon product search is currently disabled. I can help you with travel recommendations, weather information, or general travel advice instead!"
+        }
+        return state
@@ -0,0 +1,66 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import os
+from typing import Any, List
+from langchain_aws import ChatBedrockConverse
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import BaseMessage, SystemMessage
+from langchain_core.outputs import LLMResult
+from langchain_core.prompt_values import PromptValue
+from langchain_core.runnables import RunnableLambda
+
+import metrics
+
+# Bedrock prompt caching on the static system prompts, for models that support cache checkpoints
+BEDROCK_PROMPT_CACHING = os.environ.get('BEDROCK_PROMPT_CACHING', 'true').lower() == 'true'
+PROMPT_CACHE_MODELS = {
+    "amazon.nova-micro-v1:0",
+    "amazon.nova-lite-v1:0",
+    "amazon.nova-pro-v1:0",
+}
+
+def supports_prompt_cache(llm: Any) -> bool:
+    model_id = getattr(llm, 'model_id', None) or getattr(llm, 'model', '')
+    # Cross-region inference profiles prefix the model id, e.g. us.amazon.nova-pro-v1:0
+    return BEDROCK_PROMPT_CACHING and any(model_id.endswith(supported) for supported in PROMPT_CACHE_MODELS)
+
+def _with_system_cache_point(prompt_value: PromptValue) -> List[BaseMessage]:
+    messages = prompt_value.to_messages()
+    if messages and isinstance(messages[0], SystemMessage):
+        content = messages[0].content
+        blocks = [{"type": "text", "text": content}] if isinstance(content, str) else list(content)
+        messages[0] = SystemMessage(content=blocks + [ChatBedrockConverse.create_cache_point()])
+    return messages
+
+# Chain step placed between the prompt and the model: checkpoint right after the static system content
+system_cache_point = RunnableLambda(_with_system_cache_point).with_config({"name": "system_cache_point"})
+
+
+class PromptCacheUsageHandler(BaseCallbackHandler):
+    """Records Bedrock cache read/write input tokens reported on each model response."""
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, 'message', None), 'usage_metadata', None) or {}
+                details = usage.get('input_token_details') or {}
+                cache_read = details.get('cache_read', 0)
+                cache_write = details.get('cache_creation', 0)
+                metrics.incr("bedrock.input_tokens", usage.get('input_tokens', 0))
+                metrics.incr("bedrock.cache_read_tokens", cache_read)
+                metrics.incr("bedrock.cache_write_tokens", cache_write)
+                if cache_read or cache_write:
+                    print(f"Prompt cache tokens: read {cache_read}, write {cache_write}")
@@ -19,26 +19,28 @@ from langchain_core.prompts.chat import ChatPromptTemplate
 # INTRODUCTION AND GENERAL CHAT PROMPTS
 # =============================================================================
 # Prompts for initial user interactions and general capabilities explanation
+#
+# Static instructions live in the system prompts and dynamic variables come last in the
+# user messages, so Bedrock can cache the system prompt prefix across calls.
 
 intro_system = """<instructions>
 You are an Amazon shopping assistant designed to help users create travel itineraries or adjust those itineraries.
 You are friendly and helpful. Try your best to answer appropriate questions, to see examples of inappropriate questions look at the <inappropriate> section.
 However, focus on what you do, not what you don't do. 
 Please keep your responses under 2 paragraphs.
-</instructions>"""
+</instructions>
 
-intro_user_msg = """
 <inappropriate>
 violence
 self-harm
 </inappropriate>
 
-<previous input>
-{previous_chat}
-</previous input>
-
 <final instructions>Tell me what this application can do, focus on the ability to create travel itineraries, create a packing list, and answer questions.</final instructions>"""
 
+intro_user_msg = """<previous input>
+{previous_chat}
+</previous input>"""
+
 intro_messages = [
     ("system", intro_system),
     ("user", intro_user_msg),
@@ -54,6 +56,7 @@ intro_prompt = ChatPromptTemplate.from_messages(intro_messages)
 search_internet_system = """<instructions>
 You are an Amazon shopping assistant designed to help users create travel itineraries or adjust those itineraries.
 You are going to receive internet search results use those results as context for your response
+Please answer the question in the <question> section in an helpful and friendly manner.
 </instructions>"""
 
 search_user_msg = """<context>
@@ -64,8 +67,9 @@ search_user_msg = """<context>
 {previous_chat}
 </previous input>
 
-Please answer the following question in an helpful and friendly manner. 
-{input}"""
+<question>
+{input}
+</question>"""
 
 search_messages = [
     ("system", search_internet_system),
@@ -74,6 +78,21 @@ search_messages = [
 
 search_internet_prompt_template = ChatPromptTemplate.from_messages(search_messages)
 
+# Snippet-first search: answer from the result titles and snippets, or flag that the full page is needed
+SNIPPETS_INSUFFICIENT = "<insufficient/>"
+
+search_snippets_system = f"""<instructions>
+You are an Amazon shopping assistant designed to help users create travel itineraries or adjust those itineraries.
+You are going to receive the titles and snippets of internet search results, use only those as context for your response.
+If the snippets answer the question in the <question> section, answer it in an helpful and friendly manner.
+If they do not contain enough information to answer, reply with {SNIPPETS_INSUFFICIENT} and nothing else.
+</instructions>"""
+
+search_snippets_prompt_template = ChatPromptTemplate.from_messages([
+    ("system", search_snippets_system),
+    ("user", search_user_msg),
+])
+
 # =============================================================================
 # WEATHER AND LOCATION PROMPTS
 # =============================================================================
@@ -107,7 +126,7 @@ weather_prompt_template = ChatPromptTemplate.from_messages(weather_messages)
 
 # City extraction prompts
 
-extract_city_system = """<instructions>Please extract the city_name from the provided text. Please output a JSON object with 'city_name' as the key.
+extract_city_system = """<instructions>Please extract the city_name from the provided text.
 </instructions>"""
 
 extract_city_user_msg = f"<input question>\n{{input}}\n</input question>"
@@ -122,7 +141,7 @@ extract_city_prompt_template = ChatPromptTemplate.from_messages(extract_city_mes
 
 confirm_location_system = """<instructions>
 Please review the provided city information and the users question. Your objective is to understand the users intent: which city are the referring to?
-Please ONLY output a single JSON object with keys: thinking (your thoughts), city, latitude and longitude.
+Return the chosen city with its latitude and longitude.
 </instructions>"""
 
 confirm_location_user_msg = f"<context>\n{{city_candidates}}\n</context>\n\n<input question>\n{{input}}\n</input question>"
@@ -322,13 +341,7 @@ amazon_search_template = ChatPromptTemplate.from_messages(amazon_search_messages
 
 # Amazon search result formatting prompts
 
-amazon_search_format_msg = """<instructions>
-Take the search results and put them in a list of items with the detail_page_url to the item page, a price, rating, and description. Don't provide more than 10 items. 
-Provide the unmodified detail_page_url for each item. Avoid large items like 68 oz of olive oil or 10 lbs of an item. Only include one item for a given category. Pick the more upscale item.
-Don't just provide every item, customize it to the user based on their profile. Don't state their user profile back to the user. Don't add items to the list that have no price. Think about the cart items to include step by step.
-</instructions>
-
-<user profile>
+amazon_search_format_msg = """<user profile>
 {user_profile}
 </user profile>
 
@@ -352,6 +365,9 @@ Do not modify the detail_page_url.
 Refer to the examples to see how to format your output
 If the user is a man, don't recommend products for women.
 Don't provide more than 10 items.
+Take the search results and put them in a list of items with the detail_page_url to the item page, a price, rating, and description.
+Provide the unmodified detail_page_url for each item. Avoid large items like 68 oz of olive oil or 10 lbs of an item. Only include one item for a given category. Pick the more upscale item.
+Don't just provide every item, customize it to the user based on their profile. Don't state their user profile back to the user. Don't add items to the list that have no price. Think about the cart items to include step by step.
 </instructions>
 
 <output format examples>
@@ -388,7 +404,6 @@ amazon_search_format_template = ChatPromptTemplate.from_messages(amazon_search_f
 # Prompts for generating personalized packing lists and grocery lists
 
 amazon_pack_msg = """<previous chat>
-Use this previous chat only for context, don't repeat items the user has already asked about. If there is weather information about rain, include things like umbrellas. Think carefully about how the list makes sense, for a user going to Napa they wouldn't want to order wine from Amazon.
 {previous_chat}
 </previous chat>
 
@@ -402,16 +417,15 @@ Use this previous chat only for context, don't repeat items the user has already
 """
 
 amazon_pack_system = """<instructions>
-Based on the user question, generate a packing list or grocery list that would make sense for this trip. Reformat the above question into a list of entities that can be searched on Amazon, inside <python> xml tag. 
+Based on the user question, generate a packing list or grocery list that would make sense for this trip. Reformat the above question into a list of entities that can be searched on Amazon. 
 Only reformat the input, don't try to answer the question. Refer to the examples to see how to format your output. A grocery list should only contain food. You can suggest accompaniments to alcohol but you can't suggest alcohol directly.
 THE LIST CAN ONLY HAVE A MAX OF 10 ITEMS OR LESS THIS IS VERY IMPORTANT.
-
+Use the previous chat only for context, don't repeat items the user has already asked about. If there is weather information about rain, include things like umbrellas. Think carefully about how the list makes sense, for a user going to Napa they wouldn't want to order wine from Amazon.
 </instructions>
 
 <examples>
 query: I want a packing list for my stay in Madrid
 user profile: User is a early 20s female
-<python>
 ["sunscreen",
 "women's sunglasses",
 "sun hat",
@@ -419,11 +433,9 @@ user profile: User is a early 20s female
 "cute drawstring backpack",
 "plug adapter"
 ]
-</python>
 
 query: Give me some Amazon suggestions for beach stuff for Cape Cod
 user profile: User is a mid 30s male 
-<python>
 ["men's sunglasses",
 "men's bathing suit",
 "beach towels",
@@ -432,11 +444,9 @@ user profile: User is a mid 30s male
 "beach bag",
 "cooler backpack"
 ]
-</python>
 
 query: Can you make me a grocery list?
 user profile: User is a fan of upscale, organic products
-<python> 
 ["Lactose Free Milk",
 "High fiber Cereal",
 "Fresh fruit",
@@ -448,7 +458,6 @@ user profile: User is a fan of upscale, organic products
 "Gourmet salami",
 "extra virgin olive oil",
 ]
-</python>
 </examples>"""
 
 amazon_pack_messages = [
@@ -465,13 +474,13 @@ amazon_pack_template = ChatPromptTemplate.from_messages(amazon_pack_messages)
 
 remove_cart_system = """<persona>
 You are an Amazon shopping assistant designed to help users create packing/grocery lists. Only output the cart list and nothing else.
-</persona>"""
+</persona>
 
-remove_cart_user_msg = """<instructions>
-You will receive an existing cart and a user query, output a new version of the cart with the items the user listed removed. Only output a list of JSON objects.
-</instructions>
+<instructions>
+You will receive an existing cart and a user query, output a new version of the cart with the items the user listed removed.
+</instructions>"""
 
-<cart>
+remove_cart_user_msg = """<cart>
 {cart}
 </cart>
 
@@ -490,43 +499,17 @@ remove_cart_messages = [
 
 remove_cart_prompt_template = ChatPromptTemplate.from_messages(remove_cart_messages)
 
-# Cart consolidation prompts
-
-consolidate_cart_system = """<persona instructions>
-You are an Amazon shopping assistant designed to help users create packing/grocery lists. Only output the cart list and nothing else.
-</persona instructions>"""
-
-consolidate_cart_user_msg = """<instructions>
-You will receive an existing cart and a generated cart, output a new version of the cart with only the items in the generated cart and nothing else. 
-Your output should be strictly a list of JSON objects.
-</instructions>
-
-<cart>
-{cart}
-</cart>
-
-<generated cart>
-{answer}
-</generated cart>"""
-
-consolidate_cart_messages = [
-    ("system", consolidate_cart_system),
-    ("user", consolidate_cart_user_msg),
-]
-
-consolidate_cart_prompt_template = ChatPromptTemplate.from_messages(consolidate_cart_messages)
-
 # Cart removal confirmation prompts
 
 confirm_cart_removal_system = """<persona instructions>
 You are an Amazon shopping assistant designed to help users create packing/grocery lists. 
-</persona instructions>"""
+</persona instructions>
 
-confirm_cart_removal_user_msg = """<instructions>
+<instructions>
 You will receive a cart, summarize the new cart (don't repeat items in your summary) and lead with "your current cart contains:".
-</instructions>
+</instructions>"""
 
-<cart>
+confirm_cart_removal_user_msg = """<cart>
 {cart}
 </cart>"""
 
@@ -547,18 +530,18 @@ asin_format = """[
 {{'asin': 'B07KBGQP3K', 'title': 'Due Vittorie Oro Gold, Barrel Aged Balsamic Vinegar of Modena IGP', 'reviews': '4.4', 'price': '28.98', 'qty': '1'}}
 ]"""
 add_from_previous_chat_system = f"""<persona instructions>
-You are an Amazon shopping assistant designed to help users create packing/grocery lists. You strictly output lists with JSON objects.
+You are an Amazon shopping assistant designed to help users create packing/grocery lists.
 </persona instructions>
 
+<instructions>
+You will receive chat history that had searched for items in it, create the list of items to add to the user cart. Don't add all of the searched for items to the cart, only the specified ones.
+</instructions>
+
 <output format>
 {asin_format}
 </output format>"""
 
-add_from_previous_chat_user_msg = """<instructions>
-You will receive chat history that had searched for items in it, create a list of JSON objects to the user cart. Don't add all of the searched for items to the cart, only the specified ones.
-</instructions>
-
-<previous chat>
+add_from_previous_chat_user_msg = """<previous chat>
 {previous_chat}
 </previous chat>
 
@@ -643,18 +626,18 @@ Hilton Head, South Carolina: Staying at 5 Periwinkle Ln: A BESTNEST by Beverly S
 
 Please let me know if you need any other details about your upcoming or past stays.
 </example output>
+
+ONLY USE USER PROFILE TO ANSWER THE QUESTION. IF YOU CANNOT FIND THE ANSWER IN USER PROFILE, SAY SO NO INFORMATION IS SAVED.
 """
 
 user_summary_user_msg = """
-<input question>
-{input}
-</input question>
-
 <user profile>
 {user_profile}
 </user profile>
 
-ONLY USE USER PROFILE TO ANSWER THE QUESTION. IF YOU CANNOT FIND THE ANSWER IN USER PROFILE, SAY SO NO INFORMATION IS SAVED.
+<input question>
+{input}
+</input question>
 """
 
 user_summary_messages = [
@@ -780,12 +763,17 @@ Leaders work every day to create a safer, more productive, higher performing, mo
 Success and Scale Bring Broad Responsibility
 We started in a garage, but we’re not there anymore. We are big, we impact the world, and we are far from perfect. We must be humble and thoughtful about even the secondary effects of our actions. Our local communities, planet, and future generations need us to be better every day. We must begin each day with a determination to make better, do better, and be better for our customers, our employees, our partners, and the world at large. And we must end every day knowing we can do even more tomorrow. Leaders create more than they consume and always leave things better than how they found them.
 </context>
+
+<instructions>Please answer the question in the <question> section in an helpful and friendly manner.</instructions>
 """
 
-amazon_facts_user_msg = """<instructions>Please answer the following question in an helpful and friendly manner. \n{input}</instructions>
-<user profile>
+amazon_facts_user_msg = """<user profile>
 {user_profile}
 </user profile>
+
+<question>
+{input}
+</question>
 """
 
 amazon_facts_messages = [
@@ -0,0 +1,276 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import metrics
+
+#################### RESILIENCE CONFIG ####################
+
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get('BREAKER_FAILURE_THRESHOLD', '5'))  # consecutive failures
+BREAKER_RESET_SECONDS = float(os.environ.get('BREAKER_RESET_SECONDS', '30'))  # open time before a trial call
+HEDGE_ENABLED = os.environ.get('HEDGE_ENABLED', 'true').lower() == 'true'
+HEDGE_MIN_SAMPLES = int(os.environ.get('HEDGE_MIN_SAMPLES', '20'))  # latencies needed before the p95 is trusted
+HEDGE_MIN_DELAY = float(os.environ.get('HEDGE_MIN_DELAY', '0.2'))
+HEDGE_MAX_RATE = float(os.environ.get('HEDGE_MAX_RATE', '0.1'))  # share of calls allowed to send a hedge
+HEDGE_MAX_WORKERS = int(os.environ.get('HEDGE_MAX_WORKERS', '16'))
+
+# Responses with these statuses count as dependency failures, like transport errors
+FAILURE_STATUSES = (429, 500, 502, 503, 504)
+
+_hedge_executor = ThreadPoolExecutor(max_workers=HEDGE_MAX_WORKERS, thread_name_prefix="hedge")
+
+class CircuitOpen(Exception):
+    """Raised instead of calling a dependency whose breaker is open."""
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} is unavailable, retry in {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Closed until `failure_threshold` consecutive failures, then open for `reset_seconds`.
+
+    After that one trial call is let through (half open): success closes the breaker, failure opens it again.
+    """
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.time() - self.opened_at >= self.reset_seconds else "open"
+
+    def allow(self) -> None:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return
+            if state == "half_open" and not self._trial:
+                self._trial = True
+                return
+            retry_after = max(0.0, self.opened_at + self.reset_seconds - time.time())
+        metrics.incr(f"breaker.{self.name}.rejected")
+        raise CircuitOpen(self.name, retry_after)
+
+    def record(self, success: bool) -> None:
+        with self._lock:
+            self._trial = False
+            if success:
+                if self.opened_at is not None:
+                    print(f"Circuit breaker {self.name} closed")
+                self.failures, self.opened_at = 0, None
+            else:
+                self.failures += 1
+                if self.opened_at is not None or self.failures >= self.failure_threshold:
+                    if self.opened_at is None:
+                        print(f"Circuit breaker {self.name} opened after {self.failures} failures")
+                        metrics.incr(f"breaker.{self.name}.opened")
+                    self.opened_at = time.time()
+            metrics.gauge(f"breaker.{self.name}.open", 0 if self.opened_at is None else 1)
+
+    def release(self) -> None:
+        """End a call without an outcome, e.g. a cancelled one, so a half-open breaker lets the next trial through."""
+        with self._lock:
+            self._trial = False
+
+
+class LatencyTracker:
+    """Recent call latencies of one dependency, for the hedge delay."""
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        samples = sorted(self._samples)
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+class Dependency:
+    """Circuit breaker, latency tracking and optional hedging around calls to one external service.
+
+    With hedging on, a call still running after the dependency's p95 latency gets a second, identical
+    call and the first response wins. Only hedge idempotent reads, and never rate-limited APIs.
+    Metrics: breaker.<name>.*, resilience.<name>.calls/failures/hedged/hedge_won.
+    """
+    def __init__(self, name: str, hedge: bool = False, read_timeout: Optional[float] = None, **breaker_kwargs):
+        self.name = name
+        self.hedge = hedge and HEDGE_ENABLED
+        # Passed to http_client by the caller, in place of the shared HTTP_READ_TIMEOUT
+        self.read_timeout = read_timeout
+        self.breaker = CircuitBreaker(name, **breaker_kwargs)
+        self.latency = LatencyTracker()
+
+    def _hedge_delay(self) -> Optional[float]:
+        if not self.hedge:
+            return None
+        p95 = self.latency.percentile(0.95)
+        if p95 is None or self._hedge_rate() >= HEDGE_MAX_RATE:
+            return None
+        return max(p95, HEDGE_MIN_DELAY)
+
+    def _hedge_rate(self) -> float:
+        """Share of calls that were hedged."""
+        return metrics.get(f"resilience.{self.name}.hedged") / max(metrics.get(f"resilience.{self.name}.calls"), 1)
+
+    # Latency is recorded for failures and timeouts too, otherwise the p95 would hide the slow calls
+    def _timed(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        start = time.time()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.latency.add(time.time() - start)
+
+    async def _atimed(self, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        start = time.time()
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            self.latency.add(time.time() - start)
+
+    def _settle(self, result: Any) -> Any:
+        failed = getattr(result, "status_code", None) in FAILURE_STATUSES
+        self.breaker.record(not failed)
+        if failed:
+            metrics.incr(f"resilience.{self.name}.failures")
+        return result
+
+    def _failed(self, error: BaseException) -> None:
+        self.breaker.record(False)
+        metrics.incr(f"resilience.{self.name}.failures")
+
+    def call(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Call fn(*args, **kwargs) through the breaker, hedging it once it runs past the p95."""
+        self.breaker.allow()
+        metrics.incr(f"resilience.{self.name}.calls")
+        delay = self._hedge_delay()
+        try:
+            if delay is None:
+                return self._settle(self._timed(fn, *args, **kwargs))
+            return self._settle(self._hedged(delay, fn, *args, **kwargs))
+        except CircuitOpen:
+            raise
+        except Exception as e:
+            self._failed(e)
+            raise
+        except BaseException:
+            self.breaker.release()
+            raise
+
+    def _hedged(self, delay: float, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        primary = _hedge_executor.submit(self._timed, fn, *args, **kwargs)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+        metrics.incr(f"resilience.{self.name}.hedged")
+        hedge = _hedge_executor.submit(self._timed, fn, *args, **kwargs)
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                # A failed call only decides the outcome when the other one failed too
+                if future.exception() is None or not pending:
+                    if future is hedge and future.exception() is None:
+                        metrics.incr(f"resilience.{self.name}.hedge_won")
+                    # The losing request keeps its thread until it completes, requests calls cannot be cancelled
+                    return future.result()
+
+    async def acall(self, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """Async counterpart of call() for coroutine functions; the losing hedge is cancelled."""
+        self.breaker.allow()
+        metrics.incr(f"resilience.{self.name}.calls")
+        delay = self._hedge_delay()
+        try:
+            if delay is None:
+                return self._settle(await self._atimed(fn, *args, **kwargs))
+            return self._settle(await self._ahedged(delay, fn, *args, **kwargs))
+        except CircuitOpen:
+            raise
+        except Exception as e:
+            self._failed(e)
+            raise
+        except BaseException:
+            # Cancelled, e.g. by a turn deadline or as a losing hedge: says nothing about the dependency
+            self.breaker.release()
+            raise
+
+    async def _ahedged(self, delay: float, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        primary = asyncio.ensure_future(self._atimed(fn, *args, **kwargs))
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+        metrics.incr(f"resilience.{self.name}.hedged")
+        hedge = asyncio.ensure_future(self._atimed(fn, *args, **kwargs))
+        pending = {primary, hedge}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None or not pending:
+                        if task is hedge and task.exception() is None:
+                            metrics.incr(f"resilience.{self.name}.hedge_won")
+                        return task.result()
+        finally:
+            for task in (primary, hedge):
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.breaker.state,
+            "p95": self.latency.percentile(0.95),
+            "hedge_rate": self._hedge_rate(),
+        }
+
+
+#################### DEPENDENCY REGISTRY ####################
+
+# Process-wide, so breaker state and latencies outlive the per-request nodes
+_dependencies: "OrderedDict[str, Dependency]" = OrderedDict()
+_registry_lock = threading.Lock()
+MAX_DEPENDENCIES = 256
+
+def dependency(name: str, **kwargs) -> Dependency:
+    """Return the named dependency, creating it with kwargs on first use. Least recently used ones are evicted past MAX_DEPENDENCIES."""
+    with _registry_lock:
+        dep = _dependencies.get(name)
+        if dep is None:
+            dep = _dependencies[name] = Dependency(name, **kwargs)
+            while len(_dependencies) > MAX_DEPENDENCIES:
+                _dependencies.popitem(last=False)
+        else:
+            _dependencies.move_to_end(name)
+        return dep
+
+def stats() -> Dict[str, Dict[str, Any]]:
+    with _registry_lock:
+        return {name: dep.stats() for name, dep in _dependencies.items()}
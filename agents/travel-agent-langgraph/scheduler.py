@@ -0,0 +1,257 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+
+import metrics
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+THROTTLE_ERROR_CODES = {
+    "ThrottlingException", "TooManyRequestsException", "ServiceUnavailableException", "ModelNotReadyException",
+}
+# Cross-region inference profile ids are the model id behind a geography prefix, e.g. us.amazon.nova-lite-v1:0
+INFERENCE_PROFILE_PREFIXES = ("us", "eu", "apac", "us-gov", "global")
+
+class ModelsSaturated(Exception):
+    """Every candidate model is throttled and the turn has no retry budget (or priority) left to wait."""
+
+
+class TurnBudget:
+    """Retries and total throttle wait shared by every model call in one turn."""
+    def __init__(self, retries: int, max_wait: float):
+        self.retries = retries
+        self.wait_left = max_wait
+        self._lock = threading.Lock()
+
+    def take_retry(self) -> bool:
+        with self._lock:
+            if self.retries <= 0:
+                return False
+            self.retries -= 1
+            return True
+
+    def take_wait(self, seconds: float) -> float:
+        with self._lock:
+            granted = max(0.0, min(seconds, self.wait_left))
+            self.wait_left -= granted
+            return granted
+
+
+_turn_budget: contextvars.ContextVar[Optional[TurnBudget]] = contextvars.ContextVar("turn_budget", default=None)
+_priority: contextvars.ContextVar[str] = contextvars.ContextVar("model_call_priority", default=INTERACTIVE)
+# A list shared with copied contexts (langchain runs steps in one), collecting the model ids that served each call
+_served: contextvars.ContextVar[Optional[List[str]]] = contextvars.ContextVar("served_models", default=None)
+
+@contextmanager
+def turn(retries: int, max_wait: float):
+    """Scope a per-turn retry budget over every model call made in this context (threads need copy_context)."""
+    token = _turn_budget.set(TurnBudget(retries, max_wait))
+    try:
+        yield
+    finally:
+        _turn_budget.reset(token)
+
+@contextmanager
+def priority(level: str):
+    """Mark model calls in this context as INTERACTIVE (user waiting) or BACKGROUND (prefetch, batch)."""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+def background(fn: Callable, *args, **kwargs) -> Callable[[], Any]:
+    """Bind fn to a copy of the current context (turn budget included) with BACKGROUND priority, for executor threads."""
+    context = contextvars.copy_context()
+
+    def call():
+        with priority(BACKGROUND):
+            return fn(*args, **kwargs)
+    return functools.partial(context.run, call)
+
+@contextmanager
+def served_models():
+    """Collect the ids of the models that served the calls made inside, to see a failover to another model."""
+    served: List[str] = []
+    token = _served.set(served)
+    try:
+        yield served
+    finally:
+        _served.reset(token)
+
+def invoke_tracked(runnable: Any, value: Any) -> Tuple[Any, Optional[str]]:
+    """runnable.invoke(value) and the base model id that served its last model call, None when not scheduled."""
+    with served_models() as served:
+        result = runnable.invoke(value)
+    return result, served[-1] if served else None
+
+async def ainvoke_tracked(runnable: Any, value: Any) -> Tuple[Any, Optional[str]]:
+    with served_models() as served:
+        result = await runnable.ainvoke(value)
+    return result, served[-1] if served else None
+
+def base_model_id(model_id: str) -> str:
+    """The model behind an inference profile id, the id itself for a plain model id."""
+    prefix, _, rest = model_id.partition(".")
+    return rest if prefix in INFERENCE_PROFILE_PREFIXES and rest else model_id
+
+def is_throttle(error: Exception) -> bool:
+    """botocore ClientError codes, or the exception class name for the modeled exceptions."""
+    response = getattr(error, "response", None)
+    code = response.get("Error", {}).get("Code") if isinstance(response, dict) else None
+    return (code or type(error).__name__) in THROTTLE_ERROR_CODES
+
+
+class ModelScheduler:
+    """Tracks throttling per model id and spreads calls over failover candidates.
+
+    A throttled model is skipped for a cooldown that doubles with consecutive throttles. Interactive calls
+    fail over to the next healthy candidate, or wait for the earliest cooldown out of the turn's budget.
+    Background calls never wait: with every candidate cooling down they give up, leaving capacity to users.
+    Other errors from the primary are raised; a failover candidate that errors is skipped for the rest of the call.
+    """
+    def __init__(self, retries: int = 4, max_wait: float = 5, cooldown_base: float = 1, cooldown_max: float = 30):
+        self.retries = retries
+        self.max_wait = max_wait
+        self.cooldown_base = cooldown_base
+        self.cooldown_max = cooldown_max
+        self._throttled: Dict[str, Tuple[float, int]] = {}
+        self._lock = threading.Lock()
+
+    def cooling_until(self, model_id: str) -> float:
+        return self._throttled.get(model_id, (0.0, 0))[0]
+
+    def record_throttle(self, model_id: str) -> None:
+        with self._lock:
+            _, streak = self._throttled.get(model_id, (0.0, 0))
+            cooldown = min(self.cooldown_max, self.cooldown_base * (2 ** streak))
+            self._throttled[model_id] = (time.time() + cooldown, streak + 1)
+        metrics.incr(f"scheduler.{model_id}.throttled")
+        print(f"Model {model_id} throttled, cooling down {cooldown:.1f}s")
+
+    def record_success(self, model_id: str) -> None:
+        if model_id in self._throttled:
+            with self._lock:
+                self._throttled.pop(model_id, None)
+
+    def _next(self, candidates: Sequence[Tuple[str, Any]], budget: TurnBudget,
+              skipped: Set[str]) -> Tuple[Optional[Tuple[str, Any]], float]:
+        """Pick the first candidate not cooling down, or the one that recovers first and how long to wait for it."""
+        candidates = [candidate for candidate in candidates if candidate[0] not in skipped]
+        now = time.time()
+        for candidate in candidates:
+            if self.cooling_until(candidate[0]) <= now:
+                return candidate, 0.0
+        candidate = min(candidates, key=lambda c: self.cooling_until(c[0]))
+        if _priority.get() == BACKGROUND:
+            return None, 0.0
+        wait = self.cooling_until(candidate[0]) - now
+        granted = budget.take_wait(wait)
+        return (candidate, granted) if granted >= wait else (None, 0.0)
+
+    def _budget(self) -> TurnBudget:
+        # Calls outside a turn (scripts, tests) get a budget of their own
+        return _turn_budget.get() or TurnBudget(self.retries, self.max_wait)
+
+    def invoke(self, candidates: Sequence[Tuple[str, Any]], value: Any, config: RunnableConfig) -> Any:
+        budget = self._budget()
+        first = candidates[0][0]
+        skipped: Set[str] = set()
+        while True:
+            candidate, wait = self._next(candidates, budget, skipped)
+            if candidate is None:
+                metrics.incr("scheduler.saturated")
+                raise ModelsSaturated(f"All candidates for {first} are throttled")
+            if wait:
+                time.sleep(wait)
+            model_id, runnable = candidate
+            try:
+                result = runnable.invoke(value, config)
+            except Exception as e:
+                if not is_throttle(e):
+                    if model_id == first:
+                        raise
+                    self._skip(model_id, e, skipped)
+                    continue
+                self.record_throttle(model_id)
+                if not budget.take_retry():
+                    raise
+                continue
+            self._record_call(first, model_id)
+            return result
+
+    async def ainvoke(self, candidates: Sequence[Tuple[str, Any]], value: Any, config: RunnableConfig) -> Any:
+        budget = self._budget()
+        first = candidates[0][0]
+        skipped: Set[str] = set()
+        while True:
+            candidate, wait = self._next(candidates, budget, skipped)
+            if candidate is None:
+                metrics.incr("scheduler.saturated")
+                raise ModelsSaturated(f"All candidates for {first} are throttled")
+            if wait:
+                await asyncio.sleep(wait)
+            model_id, runnable = candidate
+            try:
+                result = await runnable.ainvoke(value, config)
+            except Exception as e:
+                if not is_throttle(e):
+                    if model_id == first:
+                        raise
+                    self._skip(model_id, e, skipped)
+                    continue
+                self.record_throttle(model_id)
+                if not budget.take_retry():
+                    raise
+                continue
+            self._record_call(first, model_id)
+            return result
+
+    @staticmethod
+    def _skip(model_id: str, error: Exception, skipped: Set[str]) -> None:
+        # e.g. a cross-region profile the current region cannot call, which must not fail the primary's call
+        skipped.add(model_id)
+        metrics.incr(f"scheduler.{model_id}.failed")
+        print(f"Failover candidate {model_id} failed, skipping it: {error}")
+
+    def _record_call(self, primary: str, model_id: str) -> None:
+        self.record_success(model_id)
+        metrics.incr(f"scheduler.{model_id}.calls")
+        served = _served.get()
+        if served is not None:
+            served.append(base_model_id(model_id))
+        if model_id != primary:
+            metrics.incr("scheduler.failover")
+            if base_model_id(model_id) != base_model_id(primary):
+                metrics.incr("scheduler.cross_model_failover")
+            print(f"Failed over from {primary} to {model_id}")
+
+    def runnable(self, candidates: List[Tuple[str, Any]], name: str) -> RunnableLambda:
+        """One runnable over (model_id, runnable) candidates, primary first."""
+        return RunnableLambda(
+            lambda value, config: self.invoke(candidates, value, config),
+            afunc=lambda value, config: self.ainvoke(candidates, value, config),
+            name=name,
+        )
@@ -0,0 +1,50 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+from typing import List, Optional
+from pydantic import BaseModel, Field
+
+# Output schemas for chains constrained through Converse tool use (see build_structured_chain in nodes.py).
+# Class docstrings and field descriptions are sent to the model as the tool definition.
+
+class CityExtraction(BaseModel):
+    """The city the user is asking about."""
+    city_name: str = Field(description="City name as written by the user, without state or country")
+
+
+class ConfirmedLocation(BaseModel):
+    """The city the user is referring to, chosen from the candidates."""
+    thinking: str = Field(default="", description="Brief reasoning for the choice")
+    city: str
+    latitude: float
+    longitude: float
+
+
+class PackingList(BaseModel):
+    """Entities to search for on Amazon."""
+    items: List[str] = Field(description="At most 10 short product search queries")
+
+
+class CartItem(BaseModel):
+    asin: str
+    title: str = ""
+    price: str = ""
+    qty: str = "1"
+    reviews: Optional[str] = None
+
+
+class Cart(BaseModel):
+    """Items in the user's cart."""
+    items: List[CartItem]
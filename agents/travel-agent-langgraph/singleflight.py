@@ -0,0 +1,74 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import asyncio
+import threading
+import weakref
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict
+
+import metrics
+
+class SingleFlight:
+    """Coalesce concurrent identical calls: callers with the same key share one in-flight call and its result or error.
+
+    Nothing is kept once the call completes; pair it with a cache for reuse across time.
+    Counts leaders and shared callers under singleflight.<name>.*
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        # asyncio tasks are bound to the event loop that created them, so keep one table per loop
+        self._tasks = weakref.WeakKeyDictionary()
+
+    def do(self, key: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run fn(*args, **kwargs) unless another thread is already running it for key, then wait for that result."""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+        if not leader:
+            metrics.incr(f"singleflight.{self.name}.shared")
+            return future.result()
+
+        metrics.incr(f"singleflight.{self.name}.leader")
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+        return future.result()
+
+    async def ado(self, key: str, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """Async counterpart of do() for coroutine functions, coalescing callers on the running event loop."""
+        tasks = self._tasks.setdefault(asyncio.get_running_loop(), {})
+        task = tasks.get(key)
+        if task is None:
+            metrics.incr(f"singleflight.{self.name}.leader")
+            task = asyncio.ensure_future(fn(*args, **kwargs))
+            tasks[key] = task
+            task.add_done_callback(lambda _: tasks.pop(key, None))
+        else:
+            metrics.incr(f"singleflight.{self.name}.shared")
+        # Shield so one caller being cancelled does not cancel the call for the others
+        return await asyncio.shield(task)
+
+    def shared_rate(self) -> float:
+        return metrics.rate(f"singleflight.{self.name}.shared", f"singleflight.{self.name}.leader")
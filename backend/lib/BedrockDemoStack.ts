@@ -55,10 +55,10 @@ export class BedrockDemoStack extends Stack {
       bucket: docBucket,
       knowledgeBase: kb,
       dataSourceName: 'documents',
-      chunkingStrategy: bedrock.ChunkingStrategy.fixedSize({
-        maxTokens: 500,
-        overlapPercentage: 20,
-      }),
+      // Documents are pre-chunked by section in scripts/deployment/ingest_kb.py, one chunk per S3 object
+      chunkingStrategy: bedrock.ChunkingStrategy.NONE,
+      // Only the chunks, not the ingestion manifest kept at the bucket root
+      inclusionPrefixes: ['docs/'],
     });
 
 
@@ -89,7 +89,8 @@ export class BedrockDemoStack extends Stack {
         cognitoUserPools: [userPool],
       }),
       lambdaEntry: props.lambdaEntry,
-      knowledgeBaseId: kb.knowledgeBaseId
+      knowledgeBaseId: kb.knowledgeBaseId,
+      docBucketName: docBucket.bucketName
     });
 
     // CloudFront Distribution
@@ -111,7 +112,7 @@ export class BedrockDemoStack extends Stack {
               allowedMethods: CloudFrontAllowedMethods.ALL,
               forwardedValues: {
                 queryString: true,
-                headers: ['Authorization'],
+                headers: ['Authorization', 'Idempotency-Key'],
               },
               defaultTtl: Duration.seconds(0),
               minTtl: Duration.seconds(0),
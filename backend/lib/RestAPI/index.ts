@@ -52,6 +52,7 @@ interface RestAPIProps {
   authorizer: IAuthorizer;
   authorizationType: AuthorizationType;
   knowledgeBaseId: string;
+  docBucketName: string;
 }
 
 export class RestAPI extends Construct {
@@ -59,7 +60,7 @@ export class RestAPI extends Construct {
   lambdaRestAPI: LambdaRestApi;
 
   constructor(scope: Construct, id: string, {
-     lambdaEntry, authorizationType, authorizer, knowledgeBaseId}: RestAPIProps) {
+     lambdaEntry, authorizationType, authorizer, knowledgeBaseId, docBucketName}: RestAPIProps) {
     super(scope, id);
 
     // Get the Stack instance
@@ -90,7 +91,10 @@ export class RestAPI extends Construct {
         `arn:aws:bedrock:*::foundation-model/amazon.nova-pro-v1:0`,
         // Inference profile ARNs - all regions
         `arn:aws:bedrock:*:${stack.account}:inference-profile/amazon.nova-lite-v1:0`,
-        `arn:aws:bedrock:*:${stack.account}:inference-profile/amazon.nova-pro-v1:0`
+        `arn:aws:bedrock:*:${stack.account}:inference-profile/amazon.nova-pro-v1:0`,
+        // Cross-region inference profiles (us., eu., apac.) the model scheduler fails over to
+        `arn:aws:bedrock:*:${stack.account}:inference-profile/*.amazon.nova-lite-v1:0`,
+        `arn:aws:bedrock:*:${stack.account}:inference-profile/*.amazon.nova-pro-v1:0`
       ],
     }));
 
@@ -140,6 +144,16 @@ export class RestAPI extends Construct {
       removalPolicy: cdk.RemovalPolicy.DESTROY,
     });
     
+    // Shared table for persistent caches, items expire through the expires_at TTL attribute
+    const cache_table = new dynamodb.Table(this, 'agent-cache-table', {
+      partitionKey: { name: 'id', type: dynamodb.AttributeType.STRING },
+      sortKey: { name: 'createdAt', type: dynamodb.AttributeType.STRING },
+      billingMode: dynamodb.BillingMode.PAY_PER_REQUEST,
+      pointInTimeRecovery: true,
+      timeToLiveAttribute: 'expires_at',
+      removalPolicy: cdk.RemovalPolicy.DESTROY,
+    });
+    
     const restAPILambda = new lambda.DockerImageFunction(this, 'api', {
       code: lambda.DockerImageCode.fromImageAsset(lambdaEntry, {
         platform: Platform.LINUX_AMD64,
@@ -149,13 +163,20 @@ export class RestAPI extends Construct {
       memorySize: 1024,
       environment: {
         KNOWLEDGE_BASE_ID: knowledgeBaseId,
+        // Fact sheet answers link to their source document in the knowledge base bucket
+        KB_BUCKET_NAME: docBucketName,
         USER_TABLE_NAME: user_table.tableName, 
         CHAT_TABLE_NAME: chat_table.tableName,
         WISHLIST_TABLE_NAME: wishlist_table.tableName,
+        CACHE_TABLE_NAME: cache_table.tableName,
         OPENWEATHER_SECRET_NAME: openweatherSecretName,
         PAAPI_SECRET_NAME: paapiSecretName,
         GOOGLE_SEARCH_SECRET_NAME: googleSearchSecretName,
         USE_PAAPI: process.env.USE_PAAPI || 'false',
+        LLM_CACHE_BACKEND: process.env.LLM_CACHE_BACKEND || 'memory',
+        // Retries can land on another container, so idempotency records live in the cache table
+        IDEMPOTENCY_BACKEND: 'dynamodb',
+        ADMISSION_BACKEND: process.env.ADMISSION_BACKEND || 'dynamodb',
       },
     });
 
@@ -171,6 +192,7 @@ export class RestAPI extends Construct {
     user_table.grantReadWriteData(this.restAPILambdaRole);
     chat_table.grantReadWriteData(this.restAPILambdaRole);
     wishlist_table.grantReadWriteData(this.restAPILambdaRole);
+    cache_table.grantReadWriteData(this.restAPILambdaRole);
 
     this.lambdaRestAPI = new LambdaRestApi(this, 'RestApi', {
       handler: restAPILambda,
@@ -192,6 +214,10 @@ export class RestAPI extends Construct {
           apiName: 'prompt',
           methods: ['POST'],
         },
+        {
+          apiName: 'batch',
+          methods: ['POST'],
+        },
       ],
     });
 
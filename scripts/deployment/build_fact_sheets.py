@@ -0,0 +1,197 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Distill destination documents into compact fact sheets for trip recommendations.
+
+Each document in the docs folder is summarized once by Nova Pro, through a forced
+tool call, into a structured fact sheet (neighborhoods, top sights, food, climate,
+transport). The sheets are written next to the agent code, in fact_sheets/, with an
+index.json that maps city names and aliases to their sheets. Documents whose content
+hash matches the index are skipped, so re-running after an edit only rebuilds the
+changed destinations. The agent image picks the sheets up on the next deploy.
+
+Each sheet records the S3 key of its document's first chunk as uploaded by
+ingest_kb.py, so answers from a sheet link to the same object a retrieval would.
+
+Usage:
+    python3 build_fact_sheets.py --docs-path ../../data/sample-knowledge-base-docs [--force]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import unicodedata
+from typing import Dict, List, Optional
+
+import boto3
+
+from ingest_kb import DEFAULT_MAX_CHARS, DEFAULT_PREFIX, chunk_document, chunk_key
+
+DEFAULT_OUTPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../agents/travel-agent-langgraph/fact_sheets")
+DEFAULT_MODEL_ID = "amazon.nova-pro-v1:0"
+# Version 2 maps each name to a list of sheets
+INDEX_VERSION = 2
+
+SYSTEM_PROMPT = """You write fact sheets for a travel assistant from long travel guides.
+Keep only what helps recommend things to do: the best-known neighborhoods, sights, food and drink,
+the climate by season and how to get around. Be specific (names, areas, dishes) and concise, one short
+sentence per item. Leave out prices, phone numbers, addresses and opening hours, which go stale.
+Only use facts from the document."""
+
+NAMED_ITEMS = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {"name": {"type": "string"}, "description": {"type": "string"}},
+        "required": ["name", "description"],
+    },
+}
+
+FACT_SHEET_TOOL = {
+    "toolSpec": {
+        "name": "fact_sheet",
+        "description": "Record the destination fact sheet.",
+        "inputSchema": {"json": {
+            "type": "object",
+            "properties": {
+                "city": {"type": "string", "description": "Destination name, e.g. Madrid"},
+                "country": {"type": "string"},
+                "aliases": {"type": "array", "items": {"type": "string"},
+                            "description": "Other names travelers use for the destination, e.g. NYC"},
+                "summary": {"type": "string", "description": "Two sentences on what the destination is known for"},
+                "neighborhoods": {**NAMED_ITEMS, "description": "Up to 8 neighborhoods or areas"},
+                "top_sights": {**NAMED_ITEMS, "description": "Up to 10 sights"},
+                "food": {**NAMED_ITEMS, "description": "Up to 8 dishes, drinks or food areas"},
+                "climate": {"type": "string", "description": "Climate by season and the best time to visit"},
+                "transport": {"type": "string", "description": "Getting in and getting around"},
+                "tips": {"type": "array", "items": {"type": "string"}, "description": "Up to 5 practical tips"},
+            },
+            "required": ["city", "summary", "neighborhoods", "top_sights", "food", "climate", "transport"],
+        }},
+    }
+}
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(65536), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def load_index(path: str) -> Dict:
+    try:
+        with open(path, encoding="utf-8") as f:
+            index = json.load(f)
+        if index.get("version") == INDEX_VERSION:
+            return index
+    except FileNotFoundError:
+        pass
+    return {"version": INDEX_VERSION, "cities": {}, "sources": {}}
+
+def source_key(docs_path: str, filename: str, prefix: str) -> Optional[str]:
+    """S3 key of the document's first chunk, the object the UI links to for answers from the sheet."""
+    for chunk in chunk_document(os.path.join(docs_path, filename), DEFAULT_MAX_CHARS):
+        return chunk_key(prefix, filename, chunk["hash"])
+    return None
+
+def distill(bedrock, model_id: str, document: str) -> Optional[Dict]:
+    response = bedrock.converse(
+        modelId=model_id,
+        system=[{"text": SYSTEM_PROMPT}],
+        messages=[{"role": "user", "content": [{"text": f"<document>\n{document}\n</document>"}]}],
+        toolConfig={"tools": [FACT_SHEET_TOOL], "toolChoice": {"tool": {"name": "fact_sheet"}}},
+        inferenceConfig={"maxTokens": 4000, "temperature": 0},
+    )
+    for block in response["output"]["message"]["content"]:
+        if "toolUse" in block:
+            return block["toolUse"]["input"]
+    return None
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs-path", default=os.environ.get("KB_DOCS_PATH"))
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--model-id", default=DEFAULT_MODEL_ID)
+    parser.add_argument("--prefix", default=DEFAULT_PREFIX, help="Chunk prefix used by ingest_kb.py")
+    parser.add_argument("--force", action="store_true", help="Rebuild every sheet, even unchanged ones")
+    args = parser.parse_args()
+
+    if not args.docs_path or not os.path.isdir(args.docs_path):
+        parser.error("--docs-path (or KB_DOCS_PATH) must be an existing directory")
+
+    index_path = os.path.join(args.output, "index.json")
+    index = load_index(index_path)
+    bedrock = boto3.client("bedrock-runtime")
+    os.makedirs(args.output, exist_ok=True)
+
+    filenames = sorted(
+        name for name in os.listdir(args.docs_path)
+        if os.path.isfile(os.path.join(args.docs_path, name)) and not name.startswith(".")
+    )
+    for filename in filenames:
+        path = os.path.join(args.docs_path, filename)
+        sha256 = file_sha256(path)
+        source = index["sources"].get(filename)
+        if source and source["sha256"] == sha256 and not args.force:
+            print(f"Unchanged: {filename}")
+            continue
+
+        with open(path, encoding="utf-8") as f:
+            sheet = distill(bedrock, args.model_id, f.read())
+        if sheet is None:
+            print(f"No fact sheet returned for {filename}, skipping")
+            continue
+
+        sheet_file = f"{os.path.splitext(filename)[0]}.json"
+        sheet["source"] = source_key(args.docs_path, filename, args.prefix)
+        with open(os.path.join(args.output, sheet_file), "w", encoding="utf-8") as f:
+            json.dump(sheet, f, indent=2, ensure_ascii=False)
+        index["sources"][filename] = {"sha256": sha256, "file": sheet_file}
+        print(f"Built {sheet_file} for {sheet['city']}")
+
+    # Remove sheets whose document is gone, then rebuild the name lookup from what is left
+    for filename in list(index["sources"]):
+        if filename not in filenames:
+            sheet_path = os.path.join(args.output, index["sources"].pop(filename)["file"])
+            if os.path.exists(sheet_path):
+                os.remove(sheet_path)
+            print(f"Removed sheet for {filename}")
+
+    cities: Dict[str, List[str]] = {}
+    for entry in index["sources"].values():
+        with open(os.path.join(args.output, entry["file"]), encoding="utf-8") as f:
+            sheet = json.load(f)
+        for name in [sheet["city"], *sheet.get("aliases", [])]:
+            name = name.strip().lower()
+            # Index the accent-free spelling too, travelers type "reykjavik" more often than "reykjavík"
+            ascii_name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode()
+            for key in (name, ascii_name):
+                if key and entry["file"] not in cities.setdefault(key, []):
+                    cities[key].append(entry["file"])
+    index["cities"] = dict(sorted(cities.items()))
+
+    # Several documents for one destination, e.g. a city guide and a restaurant guide, are all kept
+    for name, files in index["cities"].items():
+        if len(files) > 1:
+            print(f"Name collision: '{name}' is used by {', '.join(files)}, questions naming it get every sheet")
+
+    with open(index_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=2)
+        f.write("\n")
+    print(f"{len(index['sources'])} fact sheets, {len(cities)} names indexed")
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,11 @@ if [ -f "../../.env" ]; then
     set +a
 fi
 
+# Refresh the destination fact sheets bundled with the agent (unchanged documents are skipped)
+if [ -n "${KB_DOCS_PATH:-}" ] && [ -d "$KB_DOCS_PATH" ] && python3 -c "import boto3" 2>/dev/null; then
+    python3 build_fact_sheets.py --docs-path "$KB_DOCS_PATH" || echo "Fact sheet build failed, deploying the existing sheets"
+fi
+
 cd ../../backend
 yarn install
 yarn infra:deploy
@@ -0,0 +1,233 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Incremental knowledge base ingestion.
+
+Streams every document in the docs folder, splits it into sections at headings,
+and uploads one S3 object per content-hashed chunk. A manifest from the previous
+run, kept in the data source bucket next to the chunks so every machine and CI run
+sees it, is used to upload only added chunks and delete removed ones. Without a
+manifest the chunk prefix is listed instead. An ingestion job is started only when
+something changed, so the knowledge base re-embeds just the touched chunks after a
+small edit.
+
+Usage:
+    python3 ingest_kb.py --docs-path ../../data/sample-knowledge-base-docs \
+        --bucket <DocBucketName> --knowledge-base-id <id> --data-source-id <id> [--dry-run]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import boto3
+
+# Outside the chunk prefix, which is all the data source ingests
+DEFAULT_MANIFEST_KEY = "kb-manifest.json"
+MANIFEST_VERSION = 1
+DEFAULT_PREFIX = "docs/"
+# Chunks stay under the size Bedrock would otherwise split to (about 500 tokens)
+DEFAULT_MAX_CHARS = 1800
+
+# Headings in the city guides are short standalone lines: "Understand", "Get in", "By plane"
+HEADING_MAX_WORDS = 6
+HEADING_MAX_CHARS = 60
+HEADING_END_CHARS = ('.', ',', ':', ';', '!', '?', ')', ']')
+
+def is_heading(line: str) -> bool:
+    text = line.strip()
+    return (
+        bool(text)
+        and line[:1] not in (' ', '\t')
+        and len(text) <= HEADING_MAX_CHARS
+        and len(text.split()) <= HEADING_MAX_WORDS
+        and not text.endswith(HEADING_END_CHARS)
+        and not text[0].isdigit()
+    )
+
+def read_sections(path: str) -> Iterator[Tuple[str, str]]:
+    """Stream (heading, body) sections from a document without loading the whole file."""
+    headings: List[str] = []
+    body: List[str] = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if is_heading(line):
+                if any(part.strip() for part in body):
+                    yield " / ".join(headings) or "Overview", "".join(body).strip()
+                    headings, body = [], []
+                # Consecutive headings ("Get in" then "By plane") form one section path
+                headings.append(line.strip())
+            else:
+                body.append(line)
+    if any(part.strip() for part in body):
+        yield " / ".join(headings) or "Overview", "".join(body).strip()
+
+def split_text(text: str, max_chars: int) -> Iterator[str]:
+    """Split at paragraph boundaries, hard-splitting at whitespace only for oversize paragraphs."""
+    current = ""
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        while len(paragraph) > max_chars:
+            cut = paragraph.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            if current:
+                yield current
+                current = ""
+            yield paragraph[:cut].strip()
+            paragraph = paragraph[cut:].strip()
+        if current and len(current) + len(paragraph) + 2 > max_chars:
+            yield current
+            current = ""
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current:
+        yield current
+
+def document_title(filename: str) -> str:
+    return os.path.splitext(filename)[0].replace("_", " ").replace("-", " ").title()
+
+def chunk_document(path: str, max_chars: int) -> Iterator[Dict]:
+    """Yield {hash, section, text} chunks, each prefixed with the document title and section so it stands alone."""
+    title = document_title(os.path.basename(path))
+    for heading, body in read_sections(path):
+        header = f"{title} - {heading}\n\n"
+        for piece in split_text(body, max(max_chars - len(header), 200)):
+            text = header + piece
+            yield {
+                "hash": hashlib.sha256(text.encode("utf-8")).hexdigest(),
+                "section": heading,
+                "text": text,
+            }
+
+def chunk_key(prefix: str, filename: str, chunk_hash: str) -> str:
+    return f"{prefix}{os.path.splitext(filename)[0]}/{chunk_hash[:16]}.txt"
+
+def load_manifest(s3, bucket: str, key: str) -> Dict:
+    try:
+        manifest = json.loads(s3.get_object(Bucket=bucket, Key=key)["Body"].read())
+        if manifest.get("version") == MANIFEST_VERSION:
+            return manifest
+        print(f"Ignoring manifest with version {manifest.get('version')}")
+    except s3.exceptions.NoSuchKey:
+        pass
+    return {"version": MANIFEST_VERSION, "documents": {}}
+
+def save_manifest(s3, bucket: str, key: str, manifest: Dict) -> None:
+    s3.put_object(Bucket=bucket, Key=key, Body=json.dumps(manifest, indent=2).encode("utf-8"),
+                  ContentType="application/json")
+
+def list_keys(s3, bucket: str, prefix: str) -> Set[str]:
+    """Object keys under the chunk prefix, without the metadata sidecars."""
+    keys = set()
+    for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix):
+        keys.update(item["Key"] for item in page.get("Contents", []) if not item["Key"].endswith(".metadata.json"))
+    return keys
+
+def plan(docs_path: str, manifest: Dict, prefix: str, max_chars: int,
+         existing_keys: Optional[Set[str]] = None) -> Tuple[List[Dict], List[str], Dict]:
+    """Diff the docs folder against the manifest, or against existing_keys in the bucket when there is none.
+
+    Returns (chunks to upload, keys to delete, new manifest).
+    """
+    previous = manifest.get("documents", {})
+    existing_keys = existing_keys or set()
+    documents = {}
+    uploads, deletes = [], []
+
+    filenames = sorted(
+        name for name in os.listdir(docs_path)
+        if os.path.isfile(os.path.join(docs_path, name)) and not name.startswith(".")
+    )
+    for filename in filenames:
+        known = {entry["hash"]: entry for entry in previous.get(filename, [])}
+        entries = []
+        for chunk in chunk_document(os.path.join(docs_path, filename), max_chars):
+            if any(entry["hash"] == chunk["hash"] for entry in entries):
+                continue  # identical sections within a document only need indexing once
+            entry = {"hash": chunk["hash"], "key": chunk_key(prefix, filename, chunk["hash"]), "section": chunk["section"]}
+            entries.append(entry)
+            # Chunk keys carry the content hash, so an existing key already holds this text
+            if chunk["hash"] not in known and entry["key"] not in existing_keys:
+                uploads.append({**entry, "source": filename, "text": chunk["text"]})
+        current = {entry["hash"] for entry in entries}
+        deletes.extend(entry["key"] for hash_, entry in known.items() if hash_ not in current)
+        documents[filename] = entries
+
+    for filename, entries in previous.items():
+        if filename not in documents:
+            deletes.extend(entry["key"] for entry in entries)
+
+    if not previous:
+        # No manifest: drop whatever else is under the prefix, e.g. whole documents from an older upload
+        current = {entry["key"] for entries in documents.values() for entry in entries}
+        deletes.extend(sorted(existing_keys - current))
+
+    return uploads, deletes, {"version": MANIFEST_VERSION, "prefix": prefix, "documents": documents}
+
+def apply(s3, bucket: str, uploads: List[Dict], deletes: List[str]) -> None:
+    for chunk in uploads:
+        s3.put_object(Bucket=bucket, Key=chunk["key"], Body=chunk["text"].encode("utf-8"), ContentType="text/plain")
+        # Sidecar metadata lets retrieval filter or cite by source document and section
+        s3.put_object(Bucket=bucket, Key=f"{chunk['key']}.metadata.json", ContentType="application/json",
+                      Body=json.dumps({"metadataAttributes": {"source": chunk["source"], "section": chunk["section"]}}))
+
+    keys = [key for deleted in deletes for key in (deleted, f"{deleted}.metadata.json")]
+    for start in range(0, len(keys), 1000):
+        s3.delete_objects(Bucket=bucket, Delete={"Objects": [{"Key": key} for key in keys[start:start + 1000]], "Quiet": True})
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs-path", default=os.environ.get("KB_DOCS_PATH"))
+    parser.add_argument("--bucket", required=True)
+    parser.add_argument("--knowledge-base-id", required=True)
+    parser.add_argument("--data-source-id", required=True)
+    parser.add_argument("--prefix", default=DEFAULT_PREFIX)
+    parser.add_argument("--manifest-key", default=DEFAULT_MANIFEST_KEY, help="Manifest object key in the bucket")
+    parser.add_argument("--max-chars", type=int, default=DEFAULT_MAX_CHARS)
+    parser.add_argument("--dry-run", action="store_true", help="Print the plan without touching S3 or the knowledge base")
+    args = parser.parse_args()
+
+    if not args.docs_path or not os.path.isdir(args.docs_path):
+        parser.error("--docs-path (or KB_DOCS_PATH) must be an existing directory")
+    s3 = boto3.client("s3")
+    previous = load_manifest(s3, args.bucket, args.manifest_key)
+    existing_keys = None if previous["documents"] else list_keys(s3, args.bucket, args.prefix)
+
+    uploads, deletes, manifest = plan(args.docs_path, previous, args.prefix, args.max_chars, existing_keys)
+    total = sum(len(entries) for entries in manifest["documents"].values())
+    print(f"{total} chunks in {len(manifest['documents'])} documents: {len(uploads)} to upload, {len(deletes)} to delete")
+    for chunk in uploads:
+        print(f"  + {chunk['key']} ({chunk['source']}: {chunk['section']})")
+    for key in deletes:
+        print(f"  - {key}")
+
+    if args.dry_run:
+        return
+    if uploads or deletes:
+        apply(s3, args.bucket, uploads, deletes)
+        job = boto3.client("bedrock-agent").start_ingestion_job(
+            knowledgeBaseId=args.knowledge_base_id, dataSourceId=args.data_source_id
+        )
+        print(f"Started ingestion job {job['ingestionJob']['ingestionJobId']}")
+    else:
+        print("Knowledge base is up to date, skipping ingestion job")
+
+    # Written last so a failed run is retried in full next time
+    save_manifest(s3, args.bucket, args.manifest_key, manifest)
+
+if __name__ == "__main__":
+    main()
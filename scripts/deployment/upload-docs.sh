@@ -21,8 +21,15 @@ BUCKET_NAME=$(aws cloudformation describe-stacks --stack-name="$STACK_NAME" --qu
 KNOWLEDGE_BASE_ID=$(aws cloudformation describe-stacks --stack-name="$STACK_NAME" --query "Stacks[0].Outputs[?OutputKey=='KnowledgeBaseId'].OutputValue" --output text)
 DATA_SOURCE_ID=$(aws cloudformation describe-stacks --stack-name="$STACK_NAME" --query "Stacks[0].Outputs[?OutputKey=='DataSourceId'].OutputValue" --output text)
 
-# Upload documents to S3
-aws s3 sync "$KB_DOCS_PATH/" "s3://${BUCKET_NAME}/docs/" --exclude "*.DS_Store"
+# The data source uses no chunking of its own, so documents must go through the section chunker
+if ! command -v python3 >/dev/null 2>&1 || ! python3 -c "import boto3" 2>/dev/null; then
+    echo "python3 with boto3 is required to chunk and upload the knowledge base documents"
+    exit 1
+fi
 
-# Start ingestion job
-aws bedrock-agent start-ingestion-job --knowledge-base-id "$KNOWLEDGE_BASE_ID" --data-source-id "$DATA_SOURCE_ID" --no-cli-pager
+# Upload only added/changed chunks and start an ingestion job if anything changed
+python3 ingest_kb.py \
+    --docs-path "$KB_DOCS_PATH" \
+    --bucket "$BUCKET_NAME" \
+    --knowledge-base-id "$KNOWLEDGE_BASE_ID" \
+    --data-source-id "$DATA_SOURCE_ID"
@@ -27,6 +27,7 @@ import { getRequestURL } from '../getRequestURL';
 // import { fromCognitoIdentityPool } from "@aws-sdk/credential-providers";
 
 interface GetPromptResponseInput {
+  requestId: string;
   prompt: string;
   useRag: boolean;
   strictPrompt: boolean;
@@ -43,6 +44,7 @@ export interface GetPromptResponseOutput {
 }
 
 const getPromptResponse = async ({
+  requestId,
   prompt,
   useRag,
   strictPrompt,
@@ -60,7 +62,8 @@ const getPromptResponse = async ({
 
   const response = await fetch(getRequestURL('/prompt'), {
     method: 'POST',
-    headers: { ...requestHeaders, 'Content-Type': 'application/json' },
+    // The message id lets the API replay the stored answer when this request is retried
+    headers: { ...requestHeaders, 'Content-Type': 'application/json', 'Idempotency-Key': requestId },
     body,
   });
 
@@ -170,6 +173,8 @@ export const useSessions = (): UseChatSessionOutput => {
   });
 
   const submitPrompt = (prompt: string): void => {
+    const messageId = crypto.randomUUID();
+
     setChatSessions((prevChatSessions) => {
       const chatSession = prevChatSessions[currentChatSessionId];
 
@@ -178,12 +183,12 @@ export const useSessions = (): UseChatSessionOutput => {
         [currentChatSessionId]: {
           ...chatSession,
           name: chatSession.name ?? getSessionNameFromPrompt(prompt),
-          conversation: [...chatSession.conversation, { id: crypto.randomUUID(), type: 'User', content: prompt }],
+          conversation: [...chatSession.conversation, { id: messageId, type: 'User', content: prompt }],
         },
       };
     });
 
-    mutate({ prompt, strictPrompt, useRag, modelName });
+    mutate({ requestId: messageId, prompt, strictPrompt, useRag, modelName });
   };
 
   const createChatSession = (): void => {